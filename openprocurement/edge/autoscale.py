@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerAutoscaler(object):
+
+    """Hill climbing search of the workers count with max throughput.
+
+    Every ``update`` gets the throughput measured with the current workers
+    count. While it grows by more than ``tolerance`` the count keeps moving
+    in the same direction, a drop reverses it. On a plateau, on a latency
+    jump by more than ``latency_tolerance``, on 429s and without backlog
+    workers are removed, so the count settles at the knee of the
+    throughput curve. When a move loses throughput the count goes back and
+    is held for ``cooldown`` updates while throughput stays within
+    ``tolerance`` of the one it was held with, then it's probed again.
+
+    >>> autoscaler = WorkerAutoscaler(1, 10)
+    >>> autoscaler.update(1, 10, 0.1, 0, 100)
+    2
+    >>> autoscaler.update(2, 20, 0.1, 0, 100)
+    3
+    >>> autoscaler.update(3, 20.5, 0.2, 0, 100)
+    2
+    """
+
+    def __init__(self, min_workers, max_workers, step=1, tolerance=0.05,
+                 latency_tolerance=0.5, cooldown=12):
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.step = step
+        self.tolerance = tolerance
+        self.latency_tolerance = latency_tolerance
+        self.cooldown = cooldown
+        self.hold = 0
+        self.direction = 1
+        self.last_throughput = None
+        self.last_latency = None
+
+    def update(self, workers, throughput, latency, throttled, backlog):
+        """Return workers count for the next interval."""
+        if throttled:
+            self.hold = 0
+            self.direction = -1
+        elif not backlog:
+            # Throughput is bound by the feed, not by workers
+            target = max(workers - self.step, self.min_workers)
+            self.hold = 0
+            self.direction = 1
+            self.last_throughput = None
+            self.last_latency = latency
+            return target
+        elif self.hold and self.hold == self.cooldown:
+            # Throughput of the held count is the baseline
+            self.hold -= 1
+            self.last_throughput = throughput
+            self.last_latency = latency
+            return workers
+        elif self.last_throughput is not None:
+            gain = (float(throughput - self.last_throughput) /
+                    max(self.last_throughput, 1e-9))
+            slower = (latency and self.last_latency and
+                      latency > self.last_latency *
+                      (1 + self.latency_tolerance))
+            if self.hold:
+                self.hold -= 1
+                if abs(gain) > self.tolerance or slower:
+                    # Load changed, climb from the held count
+                    self.hold = 0
+                    self.direction = 1 if gain > 0 and not slower else -1
+                elif self.hold:
+                    return workers
+                else:
+                    self.direction = 1
+            elif gain < -self.tolerance:
+                self.direction = -self.direction
+                self.hold = self.cooldown
+            elif gain <= self.tolerance or slower:
+                self.direction = -1
+        target = workers + self.direction * self.step
+        if target > self.max_workers or target < self.min_workers:
+            target = min(max(target, self.min_workers), self.max_workers)
+            self.direction = -self.direction
+        self.last_throughput = throughput
+        self.last_latency = latency
+        return target
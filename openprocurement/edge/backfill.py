@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+from gevent import monkey
+monkey.patch_all()
+
+import logging
+from datetime import datetime
+from gevent import spawn
+from gevent.queue import Empty, Queue
+from iso8601 import parse_date
+from json import loads
+from munch import munchify
+from openprocurement_client.client import TendersClientSync
+from openprocurement_client.sync import get_response
+from openprocurement.edge.feeder import LowWaterMark
+from openprocurement.edge.utils import TZ
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_PRIORITY = 1000
+
+
+def split_date_ranges(start, end, count):
+    """Split [start, end) into count equal ``[start, end]`` ISO ranges.
+
+    >>> split_date_ranges('2017-01-01T00:00:00+02:00',
+    ...                   '2017-01-03T00:00:00+02:00', 2)
+    [['2017-01-01T00:00:00+02:00', '2017-01-02T00:00:00+02:00'], \
+['2017-01-02T00:00:00+02:00', '2017-01-03T00:00:00+02:00']]
+    """
+    start, end = parse_date(start), parse_date(end)
+    step = (end - start) / count
+    bounds = [start + step * i for i in xrange(0, count)] + [end]
+    return [[bounds[i].isoformat(), bounds[i + 1].isoformat()]
+            for i in xrange(0, count)]
+
+
+class DateModifiedFeedClient(TendersClientSync):
+
+    """Sync client of the dateModified feed.
+
+    Unlike the changes feed, its offsets are dates, so a crawl can be
+    started at any point of the history.
+    """
+
+    def sync_tenders(self, params=None, extra_headers=None):
+        _params = (params or {}).copy()
+        _params['feed'] = 'dateModified'
+        self.headers.update(extra_headers or {})
+        response = self.request('GET', self.prefix_path,
+                                params_dict=_params)
+        if response.status_code == 200:
+            return munchify(loads(response.text))
+
+
+class BackfillFeeder(object):
+
+    """Crawls dateModified ranges of the feed concurrently.
+
+    ``ranges`` is a list of ``[offset, end]`` pairs, the offset of a range
+    moves forward as its pages are received and a finished range becomes
+    None, so a crawl can be resumed from ``checkpoint_state``, the ranges
+    whose received items are all handed over to the bridge.
+    """
+
+    def __init__(self, host, version, resource, ranges=(), extra_params=None,
+                 queue_size=101):
+        self.host = host
+        self.version = version
+        self.resource = resource
+        self.ranges = [list(r) if r else None for r in ranges]
+        self.extra_params = extra_params or {}
+        self.queue = Queue(maxsize=queue_size)
+        self.crawlers = []
+        self.low_water = LowWaterMark()
+
+    def create_client(self):
+        return DateModifiedFeedClient('', resource=self.resource,
+                                      host_url=self.host,
+                                      api_version=self.version)
+
+    def live_offset(self):
+        """Offset of the changes feed at its current end."""
+        client = TendersClientSync('', resource=self.resource,
+                                   host_url=self.host,
+                                   api_version=self.version)
+        params = dict(self.extra_params, descending=True, limit=1)
+        return get_response(client, params).prev_page.offset
+
+    def oldest_date_modified(self):
+        params = dict(self.extra_params, limit=1)
+        data = get_response(self.create_client(), params).data
+        return data[0]['dateModified'] if data else None
+
+    def plan(self, count):
+        """Split the feed history up to now into count ranges."""
+        start = self.oldest_date_modified()
+        if start is None:
+            self.ranges = []
+        else:
+            self.ranges = split_date_ranges(
+                start, datetime.now(TZ).isoformat(), count)
+        return self.ranges
+
+    def crawl(self, index):
+        client = self.create_client()
+        offset, end = self.ranges[index]
+        end = parse_date(end)
+        params = dict(self.extra_params, offset=offset)
+        while True:
+            response = get_response(client, params)
+            # The feed is sorted by dateModified, so the range ends at the
+            # first newer item
+            items = [item for item in response.data
+                     if parse_date(item['dateModified']) < end]
+            for item in items:
+                self.queue.put((BACKFILL_PRIORITY, item))
+            if not items or len(items) < len(response.data):
+                break
+            params['offset'] = response.next_page.offset
+            self.ranges[index][0] = params['offset']
+        self.ranges[index] = None
+        logger.info('Backfill: {} range {} finished'.format(
+            self.resource, index), extra={'MESSAGE_ID': 'backfill_range'})
+
+    def get_resource_items(self):
+        return self.low_water.iterate(self.crawl_ranges())
+
+    def crawl_ranges(self):
+        self.crawlers = [spawn(self.crawl, index)
+                         for index, date_range in enumerate(self.ranges)
+                         if date_range is not None]
+        while True:
+            try:
+                yield self.queue.get(timeout=0.1)
+            except Empty:
+                if all(crawler.ready() for crawler in self.crawlers):
+                    break
+        failed = [c for c in self.crawlers if not c.successful()]
+        if failed:
+            raise failed[0].exception
+
+    def finished(self):
+        return not any(self.ranges)
+
+    def get_state(self):
+        return [list(r) for r in self.ranges if r is not None]
+
+    def checkpoint_state(self):
+        self.low_water.mark(self.get_state(), self.queue.qsize())
+        return self.low_water.safe_state()
+
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+from gevent import monkey
+monkey.patch_all()
+
+import argparse
+import logging
+import logging.config
+import math
+import os
+import resource
+import signal
+import socket
+import uuid
+import psutil
+from array import array
+from couchdb import Server
+from time import time
+from gevent import fork, sleep, spawn
+from gevent.pywsgi import WSGIServer
+from yaml import load
+from openprocurement.edge.capture import Capture
+from openprocurement.edge.databridge import EdgeDataBridge
+from openprocurement.edge.fakeapi import add_api_arguments, create_api
+from openprocurement.edge.metrics import (
+    DOCUMENT_TIMESHIFT,
+    SAVED_DOCS,
+    HistogramChild
+)
+from openprocurement.edge.replay import ReplayEdgeDataBridge
+
+logger = logging.getLogger(__name__)
+
+
+def percentile(values, percent):
+    """Nearest rank percentile.
+
+    >>> percentile([3, 1, 2, 4], 50), percentile([3, 1, 2, 4], 99)
+    (2, 4)
+    >>> percentile([], 99)
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(int(math.ceil(len(values) * percent / 100.0)), 1) - 1]
+
+
+# Results of doc writes which leave the doc synced
+SYNCED_RESULTS = ('created', 'updated', 'written', 'unchanged')
+
+
+def synced_docs(resource_name):
+    """Count docs of ``resource_name`` written or found up to date, whether
+    they were new or not.
+
+    >>> before = synced_docs('benchmarks')
+    >>> SAVED_DOCS.labels('benchmarks', 'written').inc(2)
+    >>> SAVED_DOCS.labels('benchmarks', 'failed').inc()
+    >>> synced_docs('benchmarks') - before
+    2
+    """
+    return sum(SAVED_DOCS.labels(resource_name, result).get()
+               for result in SYNCED_RESULTS)
+
+
+class LagRecorder(HistogramChild):
+
+    """Timeshift histogram child which keeps lags of docs modified after
+    ``start``, so percentiles of the live feed are exact."""
+
+    def __init__(self, buckets, start):
+        super(LagRecorder, self).__init__(buckets)
+        self.start = start
+        self.values = array('d')
+
+    def observe(self, value):
+        super(LagRecorder, self).observe(value)
+        if value <= time() - self.start:
+            self.values.append(value)
+
+
+def serve_api(api):
+    """Run the API in a child process, so it doesn't take CPU of the
+    measured bridge. Return its pid and url."""
+    listener = socket.socket()
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(500)
+    port = listener.getsockname()[1]
+    pid = fork()
+    if pid == 0:
+        api.start_updates()
+        WSGIServer(listener, api, log=None).serve_forever()
+        os._exit(0)
+    listener.close()
+    return pid, 'http://127.0.0.1:{}'.format(port)
+
+
+def bridge_config(api_url, couch_url, db_name, resource_name, extra=None):
+    config = {'main': dict(extra or {})}
+    config['main'].update({
+        'resources_api_server': api_url,
+        'resources_api_version': '2.3',
+        'resource': resource_name,
+        'couch_url': couch_url,
+        'db_name': db_name,
+        'retrievers_params': {'down_requests_sleep': 0.1,
+                              'up_requests_sleep': 0.1,
+                              'up_wait_sleep': 30,
+                              'up_wait_sleep_min': 1,
+                              'queue_size': 1001}
+    })
+    return config
+
+
+def run_benchmark(bridge, expected, live=30, timeout=600):
+    """Sync ``expected`` docs of the initial feed, then follow the live
+    feed for ``live`` seconds. Return docs/s of the initial sync, lags of
+    live docs, CPU seconds and RSS bytes of the bridge."""
+    resource_name = bridge.workers_config['resource']
+    process = psutil.Process()
+    cpu = sum(process.cpu_times()[:2])
+    start = time()
+    recorder = LagRecorder(DOCUMENT_TIMESHIFT.buckets, start)
+    DOCUMENT_TIMESHIFT.children[(resource_name,)] = recorder
+    synced_before = synced_docs(resource_name)
+    bridge.start_sync()
+    bridge.controller = spawn(bridge.queues_controller)
+    while synced_docs(resource_name) - synced_before < expected and \
+            time() - start < timeout:
+        bridge.workers_watcher()
+        sleep(1)
+    synced = synced_docs(resource_name) - synced_before
+    sync_time = time() - start
+    sleep(live)
+    bridge.drain()
+    return {
+        'resource': resource_name,
+        'synced': synced,
+        'expected': expected,
+        'sync_time': sync_time,
+        'docs_per_sec': synced / sync_time,
+        'lag_p50': percentile(recorder.values, 50),
+        'lag_p99': percentile(recorder.values, 99),
+        'live_docs': len(recorder.values),
+        'cpu': sum(process.cpu_times()[:2]) - cpu,
+        'elapsed': time() - start,
+        'rss': process.memory_info().rss,
+        # Kilobytes on Linux
+        'max_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    }
+
+
+def report(result):
+    lines = [
+        'Synced {synced} of {expected} {resource} in {sync_time:.1f} sec.: '
+        '{docs_per_sec:.1f} docs/s'.format(**result),
+        'CPU {:.1f} sec. ({:.0f}%), RSS {:.1f} MB, max RSS {:.1f} '
+        'MB'.format(result['cpu'], 100 * result['cpu'] / result['elapsed'],
+                    result['rss'] / 2.0 ** 20, result['max_rss'] / 2.0 ** 20)
+    ]
+    if result['live_docs']:
+        lines.insert(1, 'Live feed lag p50 {:.3f} sec., p99 {:.3f} sec. of '
+                        '{} docs'.format(result['lag_p50'], result['lag_p99'],
+                                         result['live_docs']))
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='---- Edge Bridge benchmark against a fake API ----')
+    parser.add_argument('--couch-url', type=str,
+                        default='http://127.0.0.1:5984')
+    parser.add_argument('--resource', type=str, default='tenders')
+    parser.add_argument('--config', type=str, default=None,
+                        help='Configuration file, its \'main\' section '
+                             'overrides bridge settings')
+    parser.add_argument('--live', type=float, default=30,
+                        help='Seconds to follow the live feed after sync')
+    parser.add_argument('--timeout', type=float, default=600,
+                        help='Max seconds of the initial sync')
+    parser.add_argument('--keep-db', action='store_true',
+                        help='Don\'t delete the benchmark database')
+    parser.add_argument('--capture', type=str, nargs='+', default=None,
+                        help='Replay capture files of \'capture_dir\' '
+                             'instead of the fake API')
+    parser.add_argument('--speed', type=float, default=0,
+                        help='Replay speed factor, 0 is max speed')
+    add_api_arguments(parser)
+    params = parser.parse_args()
+    extra = {}
+    if params.config:
+        with open(params.config) as config_file_obj:
+            config = load(config_file_obj.read())
+        logging.config.dictConfig(config)
+        extra = config.get('main', {})
+    else:
+        logging.basicConfig(level=logging.WARNING)
+    db_name = 'edge_benchmark_{}'.format(uuid.uuid4().hex[:8])
+    pid = None
+    if params.capture:
+        capture = Capture(params.capture, params.resource)
+        expected = capture.expected()
+        # Nothing listens the url, requests are answered from the capture
+        config = bridge_config('http://127.0.0.1', params.couch_url,
+                               db_name, params.resource, extra)
+    else:
+        api = create_api(params, resources=(params.resource,))
+        expected = api.resources[params.resource].live_count()
+        pid, api_url = serve_api(api)
+        config = bridge_config(api_url, params.couch_url, db_name,
+                               params.resource, extra)
+    try:
+        if params.capture:
+            bridge = ReplayEdgeDataBridge(config, capture, params.speed)
+        else:
+            bridge = EdgeDataBridge(config)
+        result = run_benchmark(bridge, expected, params.live, params.timeout)
+        print(report(result))
+    finally:
+        if pid is not None:
+            os.kill(pid, signal.SIGTERM)
+            os.waitpid(pid, 0)
+        if not params.keep_db:
+            server = Server(params.couch_url)
+            if db_name in server:
+                del server[db_name]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import logging
+from collections import OrderedDict
+from json import dumps
+from openprocurement.edge.raw import RawDoc
+
+logger = logging.getLogger(__name__)
+
+COUCHDB_FIELDS = ('_id', '_rev', '_revisions', 'doc_type')
+
+
+class LRUCache(object):
+
+    """Bounded least recently used mapping with hit/miss counters."""
+
+    def __init__(self, capacity=100000):
+        self.capacity = capacity
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def get(self, key):
+        value = self.data.pop(key, None)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.data[key] = value
+        return value
+
+    def set(self, key, value):
+        self.data.pop(key, None)
+        self.data[key] = value
+        if len(self.data) > self.capacity:
+            self.data.popitem(last=False)
+
+    def pop(self, key):
+        return self.data.pop(key, None)
+
+
+class RevCache(LRUCache):
+
+    """Bounded LRU ``id -> _rev`` cache of stored docs.
+
+    Filled from ``_bulk_docs`` responses; misses are resolved in batches
+    with ``_all_docs?keys=`` without ``include_docs``, so old bodies are
+    never downloaded just to learn their revision.
+    """
+
+    def lookup(self, db, item_ids):
+        """Return ``{id: rev}`` of item_ids which exist in db."""
+        revs = {}
+        missing = []
+        for item_id in item_ids:
+            rev = self.get(item_id)
+            if rev is None:
+                missing.append(item_id)
+            else:
+                revs[item_id] = rev
+        if missing:
+            for row in db.view('_all_docs', keys=missing):
+                if row.value is None or row.value.get('deleted'):
+                    continue  # New or deleted doc is saved without _rev
+                revs[row.id] = row.value['rev']
+                self.set(row.id, row.value['rev'])
+        return revs
+
+
+class EtagCache(LRUCache):
+
+    """Bounded LRU ``id -> (ETag, size)`` cache for conditional GETs.
+
+    An ETag received from the API is staged with the doc dateModified and
+    only becomes usable once that doc is saved, so a 304 never hides a
+    version which didn't reach the db.
+    """
+
+    def __init__(self, capacity=100000):
+        super(EtagCache, self).__init__(capacity)
+        self.staged = LRUCache(capacity)
+        self.not_modified = 0
+        self.bytes_saved = 0
+
+    def stage(self, item_id, date_modified, etag, size):
+        self.staged.set(item_id, (date_modified, etag, size))
+
+    def commit(self, item_id, date_modified):
+        staged = self.staged.pop(item_id)
+        if staged is not None and staged[0] == date_modified:
+            self.set(item_id, staged[1:])
+
+    def count_not_modified(self, size):
+        self.not_modified += 1
+        self.bytes_saved += size
+
+
+def fingerprint(doc):
+    """Hash of the doc body without dateModified and couchdb fields.
+
+    Decoded docs are dumped with sorted keys, raw bodies are hashed as
+    received. In both the value of the top level dateModified is blanked
+    wherever it occurs, so nested dates bumped together with it don't
+    count as a change either.
+
+    >>> doc = {'id': 'a', 'dateModified': '2017-01-01', 'title': 'x',
+    ...        'auctionPeriod': {'startDate': '2017-01-01'}}
+    >>> fingerprint(doc) == fingerprint(dict(
+    ...     doc, dateModified='2017-01-02', _rev='1-a',
+    ...     auctionPeriod={'startDate': '2017-01-02'}))
+    True
+    >>> fingerprint(doc) == fingerprint(RawDoc.from_doc(doc))
+    True
+    >>> fingerprint(doc) == fingerprint(dict(doc, title='y'))
+    False
+    """
+    if isinstance(doc, RawDoc):
+        body = doc.body
+    else:
+        body = dumps(dict((key, value) for key, value in doc.items()
+                          if key not in COUCHDB_FIELDS),
+                     sort_keys=True)
+    if doc.get('dateModified'):
+        body = body.replace('"{}"'.format(doc['dateModified']), '""')
+    return hashlib.sha1(body).digest()
+
+
+class FingerprintCache(LRUCache):
+
+    """Bounded LRU ``id -> fingerprint`` cache of saved doc bodies.
+
+    A doc with the fingerprint of its saved version differs from it only
+    by dateModified, so it isn't written again. Ids missing in the cache,
+    e.g. after a restart, are written once to learn the fingerprint. The
+    db keeps the older dateModified of such docs, so the bridge requires
+    the dateModified index to skip their feed repeats.
+    """
+
+    def __init__(self, capacity=100000):
+        super(FingerprintCache, self).__init__(capacity)
+        self.unchanged = 0
+
+    def is_unchanged(self, item_id, digest):
+        if self.get(item_id) == digest:
+            self.unchanged += 1
+            return True
+        return False
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+import gzip
+import logging
+import zlib
+from json import dumps, loads
+from time import time
+from urlparse import parse_qs, urlparse
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+CAPTURED_HEADERS = ('Content-Type', 'ETag', 'Retry-After')
+
+
+def parse_url(url):
+    """Resource name, item id and query of a feed or an item url.
+
+    >>> parse_url('http://api/api/2.3/tenders?descending=True&offset=5')
+    ('tenders', None, {'descending': 'True', 'offset': '5'})
+    >>> parse_url('http://api/api/2.3/tenders/abc')[:2]
+    ('tenders', 'abc')
+    >>> parse_url('http://api/api/2.3/spore')
+    (None, None, {})
+    """
+    parsed = urlparse(url)
+    parts = parsed.path.strip('/').split('/')
+    if len(parts) not in (3, 4) or parts[0] != 'api' or parts[2] == 'spore':
+        return None, None, {}
+    query = dict((key, values[0])
+                 for key, values in parse_qs(parsed.query).items())
+    return parts[2], parts[3] if len(parts) == 4 else None, query
+
+
+class CaptureWriter(object):
+
+    """Gzip compressed capture of API responses.
+
+    Every GET response is a JSON header line with its time, url, status,
+    duration, some headers and body length, followed by the raw body.
+    The file is opened for append, so a restarted bridge adds a new gzip
+    member to the same capture.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = gzip.open(path, 'ab')
+        self.records = 0
+
+    def write(self, url, status, headers, body, duration, now=None):
+        header = {
+            't': time() if now is None else now,
+            'url': url,
+            'status': status,
+            'duration': duration,
+            'headers': dict((key, headers[key]) for key in CAPTURED_HEADERS
+                            if key in headers),
+            'length': len(body)
+        }
+        self.file.write(dumps(header) + '\n' + body + '\n')
+        self.records += 1
+
+    def adapter(self):
+        return CaptureAdapter(self)
+
+    def mount(self, session):
+        adapter = self.adapter()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class CaptureAdapter(HTTPAdapter):
+
+    """Transport adapter which writes GET responses to a capture."""
+
+    def __init__(self, writer, **kwargs):
+        super(CaptureAdapter, self).__init__(**kwargs)
+        self.writer = writer
+
+    def send(self, request, **kwargs):
+        start = time()
+        response = super(CaptureAdapter, self).send(request, **kwargs)
+        if request.method == 'GET':
+            try:
+                self.writer.write(request.url, response.status_code,
+                                  response.headers, response.content,
+                                  time() - start, start)
+            except Exception as e:
+                logger.error('Error while writing capture: {}'.format(
+                    repr(e)), extra={'MESSAGE_ID': 'exceptions'})
+        return response
+
+
+def read_capture(path):
+    """Iterate ``(header, body)`` records of a capture file.
+
+    A record torn by a crash of the recording bridge ends the capture.
+    """
+    capture = gzip.open(path, 'rb')
+    try:
+        while True:
+            line = capture.readline()
+            if not line.endswith('\n'):
+                break
+            header = loads(line)
+            body = capture.read(header['length'] + 1)
+            if len(body) != header['length'] + 1:
+                break
+            yield header, body[:-1]
+    except (IOError, EOFError, ValueError, zlib.error) as e:
+        logger.warning('Capture {} is truncated: {}'.format(path, repr(e)),
+                       extra={'MESSAGE_ID': 'capture_truncated'})
+    finally:
+        capture.close()
+
+
+class Capture(object):
+
+    """Feed pages and item responses of a resource from capture files.
+
+    Records of several files, e.g. of shards, are merged by time. Pages
+    are ``(time, priority, items)`` of successful feed responses, the
+    descending feed gets the backward priority. Item responses are kept
+    in order of time for every id.
+    """
+
+    def __init__(self, paths, resource):
+        self.resource = resource
+        self.pages = []
+        self.items = {}
+        records = []
+        for path in paths:
+            records.extend(read_capture(path))
+        records.sort(key=lambda record: record[0]['t'])
+        for header, body in records:
+            resource, item_id, query = parse_url(header['url'])
+            if resource != self.resource:
+                continue
+            if item_id is not None:
+                self.items.setdefault(item_id, []).append((header, body))
+            elif header['status'] == 200:
+                descending = query.get('descending', '') not in (
+                    '', '0', 'False', 'false')
+                self.pages.append((header['t'], 1000 if descending else 1,
+                                   loads(body)['data']))
+
+    def start(self):
+        times = [self.pages[0][0]] if self.pages else []
+        times += [responses[0][0]['t'] for responses in self.items.values()]
+        return min(times) if times else None
+
+    def expected(self):
+        """Count of fed ids which were received at least once."""
+        ids = set(item['id'] for t, priority, data in self.pages
+                  for item in data)
+        return len([item_id for item_id in ids
+                    if any(header['status'] == 200 for header, body in
+                           self.items.get(item_id, ()))])
@@ -8,12 +8,12 @@ import logging.config
 import os
 import psutil
 import argparse
+import signal
 import uuid
 from couchdb import Server, Session
 from httplib import IncompleteRead
 from yaml import load
 from urlparse import urlparse
-from openprocurement_client.sync import ResourceFeeder
 from openprocurement_client.exceptions import RequestFailed
 from openprocurement_client.client import TendersClient as APIClient
 from openprocurement.edge.utils import (
@@ -23,9 +23,36 @@ from openprocurement.edge.utils import (
 )
 import gevent.pool
 from gevent import spawn, sleep
+from gevent.event import Event
 from gevent.queue import PriorityQueue, Queue, Empty
-from datetime import datetime, timedelta
-from .workers import ResourceItemWorker
+from datetime import datetime
+from .autoscale import WorkerAutoscaler
+from .backfill import BackfillFeeder
+from .capture import CaptureWriter
+from .deadletters import DeadLetterStore
+from .cache import EtagCache, FingerprintCache, RevCache
+from .feeder import CheckpointResourceFeeder, FeedCheckpoint
+from .index import DateModifiedIndex
+from .inflight import InFlight
+from .design import conflicts_by_doc_type_view
+from .journal import QueueJournal
+from .logs import EventLog, LazyMessage, configure_events
+from .metrics import (
+    API_REQUEST_DURATION,
+    FEED_ITEMS,
+    API_RATE_LIMIT,
+    API_REQUESTS,
+    PRUNED_CONFLICTS,
+    QUEUE_SIZE,
+    RollingHistogram,
+    bucket_percentiles,
+    start_metrics_server
+)
+from .queues import IndexedPriorityQueue
+from .ratelimit import AIMDRateController, TokenBucket
+from .retry import RetryScheduler
+from .revs import prune_conflicts
+from .workers import BulkWriter, ResourceItemWorker
 from time import time
 
 try:
@@ -36,6 +63,12 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+# Per document events, sampled by ``configure_events``
+RECEIVED_FROM_SYNC = EventLog(logger, 'received_from_sync')
+ADD_TO_INPUT = EventLog(logger, 'add_to_input_dict')
+ADD_TO_QUEUE = EventLog(logger, 'add_to_resource_items_queue')
+SKIPPED = EventLog(logger, 'skipped')
+
 WORKER_CONFIG = {
     'resource': 'tenders',
     'client_inc_step_timeout': 0.1,
@@ -43,10 +76,16 @@ WORKER_CONFIG = {
     'drop_threshold_client_cookies': 2,
     'worker_sleep': 5,
     'retry_default_timeout': 3,
+    'retry_max_timeout': 300,
+    'retry_jitter': 0.5,
     'retries_count': 10,
     'queue_timeout': 3,
     'bulk_save_limit': 1000,
-    'bulk_save_interval': 5
+    'bulk_save_interval': 5,
+    'bulk_save_bytes': None,
+    'bulk_writers': 2,
+    'raw_ingest': False,
+    'deterministic_revs': False
 }
 
 DEFAULTS = {
@@ -73,7 +112,39 @@ DEFAULTS = {
     'bulk_query_limit': 1000,
     'couch_url': 'http://127.0.0.1:5984',
     'db_name': 'edge_db',
-    'perfomance_window': 300
+    'perfomance_window': 300,
+    'date_modified_index': False,
+    'date_modified_index_batch': 10000,
+    'rev_cache_size': 100000,
+    'conditional_get': False,
+    'etag_cache_size': 100000,
+    'content_fingerprint': False,
+    'fingerprint_cache_size': 100000,
+    'metrics_host': '127.0.0.1',
+    'metrics_port': None,
+    'rate_control': False,
+    'rate_initial': 10,
+    'rate_min': 1,
+    'rate_max': 100,
+    'rate_increase': 1,
+    'rate_decrease': 0.5,
+    'rate_latency_threshold': None,
+    'workers_autoscale': False,
+    'autoscale_interval': 5,
+    'autoscale_cooldown': 12,
+    'backfill': False,
+    'backfill_ranges': 8,
+    'backfill_limit': 1000,
+    'backfill_bulk_save_limit': 5000,
+    'journal_dir': None,
+    'journal_max_bytes': 64 * 1024 * 1024,
+    'dead_letters': False,
+    'drain_timeout': 30,
+    'capture_dir': None,
+    'log_sample_every': 1,
+    'log_rate_limit': None,
+    'conflicts_prune_limit': 1000,
+    'fetch_dedup': False
 }
 
 
@@ -81,7 +152,9 @@ class EdgeDataBridge(object):
 
     """Edge Bridge"""
 
-    def __init__(self, config):
+    def __init__(self, config, resource=None, db=None, server=None,
+                 api_clients_queue=None, api_clients_info=None,
+                 rate_controller=None):
         super(EdgeDataBridge, self).__init__()
         self.config = config
         self.workers_config = {}
@@ -101,11 +174,30 @@ class EdgeDataBridge(object):
         for key in WORKER_CONFIG:
             self.workers_config[key] = (self.config_get(key) or
                                         WORKER_CONFIG[key])
+        if resource is not None:
+            self.workers_config['resource'] = resource
 
         # Init config
         for key in DEFAULTS:
             setattr(self, key, self.config_get(key) or DEFAULTS[key])
 
+        # Per document logs, the summaries of bulks aren't sampled
+        if self.log_sample_every < 1:
+            raise DataBridgeConfigError('Invalid \'log_sample_every\'. Value '
+                                        'must be grater than 0.')
+        configure_events(self.log_sample_every, self.log_rate_limit)
+
+        # Unchanged docs keep the old dateModified in db, only the index
+        # knows the feed repeats of the new one are done
+        if self.content_fingerprint and not self.date_modified_index:
+            raise DataBridgeConfigError('\'content_fingerprint\' requires '
+                                        '\'date_modified_index\'.')
+        # The plan of ranges and the live offset it hands over to are kept
+        # by the feed checkpoint, which is only saved with the journal
+        if self.backfill and not self.journal_dir:
+            raise DataBridgeConfigError('\'backfill\' requires '
+                                        '\'journal_dir\'.')
+
         # Pools
         self.workers_pool = gevent.pool.Pool(self.workers_max)
         self.retry_workers_pool = gevent.pool.Pool(self.retry_workers_max)
@@ -118,21 +210,30 @@ class EdgeDataBridge(object):
             self.input_queue = PriorityQueue(self.input_queue_size)
 
         if self.resource_items_queue_size == -1:
-            self.resource_items_queue = PriorityQueue()
+            self.resource_items_queue = IndexedPriorityQueue()
         else:
-            self.resource_items_queue = PriorityQueue(
+            self.resource_items_queue = IndexedPriorityQueue(
                 self.resource_items_queue_size
             )
 
-        self.api_clients_queue = Queue()
-        # self.retry_api_clients_queue = Queue()
+        # Api clients and couchdb connections may be shared between bridges
+        # of a MultiResourceEdgeDataBridge
+        if api_clients_queue is None:
+            api_clients_queue = Queue()
+        self.api_clients_queue = api_clients_queue
+        if api_clients_info is None:
+            api_clients_info = {}
+        self.api_clients_info = api_clients_info
+        if rate_controller is None and self.rate_control:
+            rate_controller = self.create_rate_controller()
+        self.rate_controller = rate_controller
 
         if self.retry_resource_items_queue_size == -1:
-            self.retry_resource_items_queue = PriorityQueue()
+            self.retry_resource_items_queue = IndexedPriorityQueue()
         else:
-            self.retry_resource_items_queue = PriorityQueue(
+            self.retry_resource_items_queue = IndexedPriorityQueue(
                 self.retry_resource_items_queue_size)
-
+        self.retry_scheduler = RetryScheduler(self.retry_resource_items_queue)
 
         if self.api_host != '' and self.api_host is not None:
             api_host = urlparse(self.api_host)
@@ -142,24 +243,57 @@ class EdgeDataBridge(object):
         else:
             raise DataBridgeConfigError('In config dictionary empty or missing'
                                         ' \'tenders_api_server\'')
-        self.db = prepare_couchdb(self.couch_url, self.db_name, logger)
+        if db is None:
+            db = prepare_couchdb(self.couch_url, self.db_name, logger)
+        self.db = db
         db_url = self.couch_url + '/' + self.db_name
         prepare_couchdb_views(db_url, self.workers_config['resource'], logger)
-        self.server = Server(self.couch_url,
-                             session=Session(retry_delays=range(10)))
+        if self.workers_config['deterministic_revs']:
+            conflicts_by_doc_type_view.sync(self.db)
+        if server is None:
+            server = Server(self.couch_url,
+                            session=Session(retry_delays=range(10)))
+        self.server = server
         self.view_path = '_design/{}/_view/by_dateModified'.format(
             self.workers_config['resource'])
         extra_params = {
             'mode': self.retrieve_mode,
             'limit': self.resource_items_limit
         }
-        self.feeder = ResourceFeeder(host=self.api_host,
-                                     version=self.api_version, key='',
-                                     resource=self.workers_config['resource'],
-                                     extra_params=extra_params,
-                                     retrievers_params=self.retrievers_params,
-                                     adaptive=True, with_priority=True)
-        self.api_clients_info = {}
+        self.journal = self.create_journal()
+        self.checkpoint = self.create_checkpoint()
+        self.capture = self.create_capture()
+        self.feeder = CheckpointResourceFeeder(
+            checkpoint=self.checkpoint, capture=self.capture,
+            host=self.api_host,
+            version=self.api_version, key='',
+            resource=self.workers_config['resource'],
+            extra_params=extra_params,
+            retrievers_params=self.retrievers_params,
+            adaptive=True, with_priority=True)
+        self.backfill_feeder = None
+        self.skip_freshness_check = False
+        if self.date_modified_index:
+            self.date_modified_index = DateModifiedIndex()
+        else:
+            self.date_modified_index = None
+        self.rev_cache = RevCache(self.rev_cache_size)
+        if self.conditional_get:
+            self.etag_cache = EtagCache(self.etag_cache_size)
+        else:
+            self.etag_cache = None
+        if self.content_fingerprint:
+            self.fingerprint_cache = FingerprintCache(
+                self.fingerprint_cache_size)
+        else:
+            self.fingerprint_cache = None
+        self.in_flight = InFlight() if self.fetch_dedup else None
+        if self.dead_letters:
+            self.dead_letters = self.create_dead_letter_store()
+        else:
+            self.dead_letters = None
+        self.bulk_writer = self.create_bulk_writer()
+        self.stopping = Event()
 
     def config_get(self, name):
         try:
@@ -168,15 +302,21 @@ class EdgeDataBridge(object):
             raise DataBridgeConfigError('In config dictionary missed section'
                                         ' \'main\'')
 
+    def new_api_client(self, user_agent):
+        api_client = APIClient(
+            host_url=self.api_host, user_agent=user_agent,
+            api_version=self.api_version, key='',
+            resource=self.workers_config['resource'])
+        if self.capture is not None:
+            self.capture.mount(api_client.session)
+        return api_client
+
     def create_api_client(self):
         client_user_agent = self.user_agent + '/' + self.bridge_id
         timeout = 0.1
         while 1:
             try:
-                api_client = APIClient(
-                    host_url=self.api_host, user_agent=client_user_agent,
-                    api_version=self.api_version, key='',
-                    resource=self.workers_config['resource'])
+                api_client = self.new_api_client(client_user_agent)
                 client_id = uuid.uuid4().hex
                 logger.info('Started api_client {}'.format(
                     api_client.session.headers['User-Agent']),
@@ -189,7 +329,8 @@ class EdgeDataBridge(object):
                 }
                 self.api_clients_info[api_client_dict['id']] = {
                     'drop_cookies': False,
-                    'request_durations': {},
+                    'request_durations': RollingHistogram(
+                        self.perfomance_window),
                     'request_interval': 0,
                     'avg_duration': 0
                 }
@@ -212,32 +353,226 @@ class EdgeDataBridge(object):
                     'create_api_client will be sleep {} sec.'.format(timeout))
                 sleep(timeout)
 
+    def spawn_worker(self, resource_items_queue):
+        return ResourceItemWorker.spawn(self.api_clients_queue,
+                                        resource_items_queue,
+                                        self.db, self.workers_config,
+                                        self.retry_resource_items_queue,
+                                        self.api_clients_info,
+                                        self.date_modified_index,
+                                        self.retry_scheduler,
+                                        self.bulk_writer,
+                                        self.rev_cache,
+                                        self.etag_cache,
+                                        self.rate_controller,
+                                        self.journal,
+                                        self.dead_letters,
+                                        self.fingerprint_cache,
+                                        self.in_flight)
+
+    def create_rate_controller(self, shares=1):
+        """Rate controller of ``1 / shares`` of the configured rates, for
+        processes which share the API rate limit."""
+        shares = float(shares)
+        return AIMDRateController(
+            rate=self.rate_initial / shares, min_rate=self.rate_min / shares,
+            max_rate=self.rate_max / shares,
+            increase=self.rate_increase / shares,
+            decrease=self.rate_decrease,
+            latency_threshold=self.rate_latency_threshold)
+
+    def create_bulk_writer(self):
+        bulk_writer = BulkWriter(db=self.db, config_dict=self.workers_config,
+                                 retry_resource_items_queue=(
+                                     self.retry_resource_items_queue),
+                                 date_modified_index=self.date_modified_index,
+                                 retry_scheduler=self.retry_scheduler,
+                                 rev_cache=self.rev_cache,
+                                 etag_cache=self.etag_cache,
+                                 journal=self.journal,
+                                 dead_letters=self.dead_letters,
+                                 fingerprint_cache=self.fingerprint_cache)
+        if self.backfill_feeder is not None:
+            bulk_writer.bulk_save_limit = self.backfill_bulk_save_limit
+        return bulk_writer
+
+    def create_journal(self):
+        if not self.journal_dir:
+            return None
+        if not os.path.isdir(self.journal_dir):
+            os.makedirs(self.journal_dir)
+        return QueueJournal(
+            os.path.join(self.journal_dir, '{}.journal'.format(
+                self.workers_config['resource'])),
+            self.journal_max_bytes)
+
+    def create_capture(self, name=None):
+        """Writer of API responses to '<resource>.capture.gz' in
+        'capture_dir' for replay benchmarks."""
+        if not self.capture_dir:
+            return None
+        if not os.path.isdir(self.capture_dir):
+            os.makedirs(self.capture_dir)
+        path = os.path.join(self.capture_dir, '{}.capture.gz'.format(
+            name or self.workers_config['resource']))
+        logger.info('Capture API responses to {}'.format(path),
+                    extra={'MESSAGE_ID': 'capture_start'})
+        return CaptureWriter(path)
+
+    def create_dead_letter_store(self):
+        return DeadLetterStore(
+            prepare_couchdb(self.couch_url, self.log_db_name, logger),
+            self.workers_config['resource'])
+
+    def replay_journal(self):
+        """Put ids which were pending at the last stop back to queues."""
+        items = self.journal.items()
+        logger.info('Replay {} pending {} from journal'.format(
+            len(items), self.workers_config['resource']),
+            extra={'MESSAGE_ID': 'journal_replay'})
+        for item_id, priority, date_modified in items:
+            if date_modified is not None:
+                self.input_queue.put((priority, {
+                    'id': item_id, 'dateModified': date_modified}))
+            else:
+                self.resource_items_queue.put((priority, item_id))
+
+    def add_main_worker(self):
+        self.create_api_client()
+        self.workers_pool.add(self.spawn_worker(self.resource_items_queue))
+
+    def remove_main_worker(self):
+        wi = self.workers_pool.greenlets.pop()
+        wi.shutdown()
+        # Fetched doc is handed over to the bulk writer before exit
+        wi.join(timeout=self.drain_timeout)
+        api_client_dict = self.api_clients_queue.get()
+        del self.api_clients_info[api_client_dict['id']]
+        API_REQUEST_DURATION.remove(api_client_dict['id'])
+
     def fill_api_clients_queue(self):
         while self.api_clients_queue.qsize() < self.workers_min:
             self.create_api_client()
 
+    def create_checkpoint(self):
+        if not self.journal_dir:
+            # Saved offsets are past the ids of the queues and bulks, they
+            # are only safe if the journal keeps these ids
+            logger.warning('{} feed checkpoint is off, set journal_dir to '
+                           'resume the feed after restart'.format(
+                               self.workers_config['resource']),
+                           extra={'MESSAGE_ID': 'checkpoint_disabled'})
+            return None
+        return FeedCheckpoint(self.db, self.workers_config['resource'])
+
+    def create_backfill_feeder(self):
+        """Plan a crawl of the feed history by dateModified ranges for an
+        empty node or resume an unfinished one from the checkpoint."""
+        state = self.checkpoint.load()
+        if 'backfill' not in state and state.get('forward_offset'):
+            return None  # Node is synced by the regular feed
+        if state.get('backfill') == []:
+            return None  # Backfill finished
+        feeder = BackfillFeeder(
+            self.api_host, self.api_version, self.workers_config['resource'],
+            state.get('backfill', ()),
+            extra_params={'mode': self.retrieve_mode,
+                          'limit': self.backfill_limit},
+            queue_size=self.retrievers_params.get('queue_size', 101))
+        if 'backfill' not in state:
+            # The live feed takes over from the moment of planning
+            self.checkpoint.save({
+                'forward_offset': feeder.live_offset(),
+                'backward_offset': None,
+                'backward_finished': True,
+                'backfill': feeder.plan(self.backfill_ranges)
+            })
+        return feeder
+
+    def start_backfill(self):
+        self.backfill_feeder = self.create_backfill_feeder()
+        if self.backfill_feeder is None:
+            return
+        # Nothing can be fresher in an empty db than in the feed
+        self.skip_freshness_check = not self.db.view(self.view_path,
+                                                     limit=1).rows
+        self.bulk_writer.bulk_save_limit = self.backfill_bulk_save_limit
+        logger.info('Backfill {} by {} date ranges, freshness check {}'.format(
+            self.workers_config['resource'],
+            len(self.backfill_feeder.get_state()),
+            'off' if self.skip_freshness_check else 'on'),
+            extra={'MESSAGE_ID': 'backfill_start'})
+
+    def finish_backfill(self):
+        self.save_backfill_checkpoint()
+        self.backfill_feeder = None
+        self.skip_freshness_check = False
+        self.bulk_writer.bulk_save_limit = self.workers_config[
+            'bulk_save_limit']
+        logger.info('Backfill of {} finished, switch to the live '
+                    'feed'.format(self.workers_config['resource']),
+                    extra={'MESSAGE_ID': 'backfill_finish'})
+
+    def save_backfill_checkpoint(self):
+        if self.backfill_feeder is None or self.checkpoint is None:
+            return False
+        state = self.backfill_feeder.checkpoint_state()
+        if state is None:
+            return False
+        try:
+            return self.checkpoint.save({'backfill': state})
+        except Exception as e:
+            logger.error('Error while saving {} backfill checkpoint: '
+                         '{}'.format(self.workers_config['resource'],
+                                     repr(e)),
+                         extra={'MESSAGE_ID': 'exceptions'})
+            return False
+
     def fill_input_queue(self):
+        feed_items = FEED_ITEMS.labels(self.workers_config['resource'])
+        if self.backfill:
+            if self.backfill_feeder is None:
+                self.start_backfill()
+            if self.backfill_feeder is not None:
+                for resource_item in (
+                        self.backfill_feeder.get_resource_items()):
+                    self.put_to_input_queue(resource_item)
+                    feed_items.inc()
+                self.finish_backfill()
+            self.backfill = False
         for resource_item in self.feeder.get_resource_items():
-            self.input_queue.put(resource_item)
-            logger.debug('Add to temp queue from sync: {} {} {}'.format(
+            self.put_to_input_queue(resource_item)
+            feed_items.inc()
+            RECEIVED_FROM_SYNC.log(
+                'Add to temp queue from sync: {} {} {}',
                 self.workers_config['resource'][:-1], resource_item[1]['id'],
-                resource_item[1]['dateModified']),
-                extra={'MESSAGE_ID': 'received_from_sync',
-                       'TEMP_QUEUE_SIZE': self.input_queue.qsize()})
+                resource_item[1]['dateModified'],
+                TEMP_QUEUE_SIZE=self.input_queue.qsize())
 
-    def send_bulk(self, input_dict, priority_cache):
+    def put_to_input_queue(self, resource_item):
+        self.input_queue.put(resource_item)
+        if self.journal is not None:
+            priority, item = resource_item
+            self.journal.add(item['id'], priority, item['dateModified'])
+
+    def load_date_modified_index(self):
+        self.date_modified_index.load(self.db, self.view_path,
+                                      self.date_modified_index_batch)
+
+    def _get_bulk_from_db(self, input_dict):
         sleep_before_retry = 2
         for i in xrange(0, 3):
             try:
-                logger.debug('Send check bulk: {}'.format(len(input_dict)),
+                logger.debug(LazyMessage('Send check bulk: {}',
+                                         (len(input_dict),)),
                              extra={'CHECK_BULK_LEN': len(input_dict)})
                 start = time()
                 rows = self.db.view(self.view_path, keys=input_dict.values())
                 end = time() - start
-                logger.debug('Duration bulk check: {} sec.'.format(end),
+                logger.debug(LazyMessage('Duration bulk check: {} sec.',
+                                         (end,)),
                              extra={'CHECK_BULK_DURATION': end * 1000})
-                resp_dict = {k.id: k.key for k in rows}
-                break
+                return {k.id: k.key for k in rows}
             except (IncompleteRead, Exception) as e:
                 logger.error('Error while send bulk {}'.format(e.message),
                              extra={'MESSAGE_ID': 'exceptions'})
@@ -245,25 +580,59 @@ class EdgeDataBridge(object):
                     raise e
                 sleep(sleep_before_retry)
                 sleep_before_retry *= 2
+
+    def send_bulk(self, input_dict, priority_cache):
+        if self.skip_freshness_check:
+            actual_ids = set()
+        elif (self.date_modified_index is not None and
+                self.date_modified_index.loaded):
+            actual_ids = set(
+                item_id for item_id, date_modified in input_dict.items()
+                if self.date_modified_index.is_actual(item_id, date_modified)
+            )
+        else:
+            resp_dict = self._get_bulk_from_db(input_dict)
+            actual_ids = set(
+                item_id for item_id, date_modified in input_dict.items()
+                if resp_dict.get(item_id) == date_modified
+            )
+        resource = self.workers_config['resource'][:-1]
+        queued = in_queue = in_flight = 0
         for item_id, date_modified in input_dict.items():
-            if item_id in resp_dict and date_modified == resp_dict[item_id]:
-                logger.debug('Skipped {} {}: In db exist newest.'.format(
-                    self.workers_config['resource'][:-1], item_id),
-                    extra={'MESSAGE_ID': 'skipped'})
-            elif ((1, item_id) not in self.resource_items_queue.queue and
-                    (1000, item_id) not in self.resource_items_queue.queue):
+            if item_id in actual_ids:
+                if self.journal is not None:
+                    self.journal.discard(item_id, date_modified)
+                SKIPPED.log('Skipped {} {}: In db exist newest.', resource,
+                            item_id)
+            elif (self.in_flight is not None and
+                    self.in_flight.note(item_id, date_modified)):
+                # Fetched again after the running fetch if it gets an
+                # older doc
+                in_flight += 1
+                SKIPPED.log('Skipped {} {}: Is being fetched', resource,
+                            item_id)
+            elif item_id not in self.resource_items_queue:
                 self.resource_items_queue.put(
                     (priority_cache[item_id], item_id)
                 )
-                logger.debug('Put to main queue {}: {}'.format(
-                    self.workers_config['resource'][:-1], item_id),
-                    extra={'MESSAGE_ID': 'add_to_resource_items_queue'})
+                queued += 1
+                ADD_TO_QUEUE.log('Put to main queue {}: {}', resource,
+                                 item_id)
             else:
-                logger.debug(
-                    'Skipped {} {}: In queue exist with same id'.format(
-                        self.workers_config['resource'][:-1], item_id
-                    ),
-                    extra={'MESSAGE_ID': 'skipped'})
+                # Keeps the highest priority of the queued id
+                self.resource_items_queue.put(
+                    (priority_cache[item_id], item_id)
+                )
+                in_queue += 1
+                SKIPPED.log('Skipped {} {}: In queue exist with same id',
+                            resource, item_id)
+        logger.debug(LazyMessage(
+            'Checked {} {}s: {} put to main queue, {} newest in db, {} in '
+            'queue, {} being fetched', (len(input_dict), resource, queued,
+                                        len(actual_ids), in_queue,
+                                        in_flight)),
+            extra={'MESSAGE_ID': 'check_bulk', 'CHECK_BULK_LEN':
+                   len(input_dict)})
 
     def fill_resource_items_queue(self):
         start_time = datetime.now()
@@ -287,7 +656,7 @@ class EdgeDataBridge(object):
 
             # Add resource_item to bulk
             if resource_item is not None:
-                logger.debug('Add to input_dict {}'.format(resource_item['id']))
+                ADD_TO_INPUT.log('Add to input_dict {}', resource_item['id'])
                 input_dict[resource_item['id']] = resource_item['dateModified']
                 priority_cache[resource_item['id']] = priority
 
@@ -319,17 +688,17 @@ class EdgeDataBridge(object):
 
     def _get_average_requests_duration(self):
         req_durations = []
-        delta = timedelta(seconds=self.perfomance_window)
-        current_date = datetime.now() - delta
+        now = time()
         for cid, info in self.api_clients_info.items():
-            if len(info['request_durations']) > 0:
-                if min(info['request_durations'].keys()) <= current_date:
+            durations = info['request_durations']
+            if durations.count(now) > 0:
+                if durations.age(now) >= self.perfomance_window:
                     info['grown'] = True
-                avg = round(
-                    sum(info['request_durations'].values()) * 1.0 /
-                    len(info['request_durations']), 3)
+                avg = round(durations.mean(now), 3)
                 req_durations.append(avg)
                 info['avg_duration'] = avg
+                info['p50'], info['p95'], info['p99'] = \
+                    durations.percentiles((50, 95, 99), now)
 
         if len(req_durations) > 0:
             return round(sum(req_durations) /
@@ -337,46 +706,97 @@ class EdgeDataBridge(object):
         else:
             return 0, req_durations
 
+    def _get_requests_counts(self, now):
+        return dict((cid, info['request_durations'].merged_counts(now))
+                    for cid, info in self.api_clients_info.items())
+
+    def _get_requests_percentiles(self, percents=(50, 95, 99)):
+        """Percentiles of requests of all api clients within the window."""
+        counts = self._get_requests_counts(time()).values()
+        return bucket_percentiles(map(sum, zip(*counts)), percents)
+
     # TODO: Add logic for restart sync if last response grater than some values
     # and no active tasks specific for resource
 
+    def _queue_fill(self, queue, size):
+        """Percent of queue filled. Unbounded queues are measured against
+        one feed batch of 'resource_items_limit' items."""
+        if size <= 0:
+            size = self.resource_items_limit
+        return round(queue.qsize() / (float(size) / 100), 2)
+
     def queues_controller(self):
+        if self.workers_autoscale:
+            return self.autoscale_controller()
         while True:
+            filled_resource_items_queue = self._queue_fill(
+                self.resource_items_queue, self.resource_items_queue_size)
             if (self.workers_pool.free_count() > 0 and
-                (self.resource_items_queue.qsize() >
-                 ((float(self.resource_items_queue_size) / 100) *
-                  self.workers_inc_threshold))):
-                self.create_api_client()
-                w = ResourceItemWorker.spawn(self.api_clients_queue,
-                                             self.resource_items_queue,
-                                             self.db, self.workers_config,
-                                             self.retry_resource_items_queue,
-                                             self.api_clients_info)
-                self.workers_pool.add(w)
+                    filled_resource_items_queue > self.workers_inc_threshold):
+                self.add_main_worker()
                 logger.info('Queue controller: Create main queue worker.')
-            elif (self.resource_items_queue.qsize() <
-                  ((float(self.resource_items_queue_size) / 100) *
-                   self.workers_dec_threshold)):
+            elif filled_resource_items_queue < self.workers_dec_threshold:
                 if len(self.workers_pool) > self.workers_min:
-                    wi = self.workers_pool.greenlets.pop()
-                    wi.shutdown()
-                    api_client_dict = self.api_clients_queue.get()
-                    del self.api_clients_info[api_client_dict['id']]
+                    self.remove_main_worker()
                     logger.info('Queue controller: Kill main queue worker.')
-            filled_resource_items_queue = round(
-                self.resource_items_queue.qsize() /
-                (float(self.resource_items_queue_size) / 100), 2)
             logger.info('Resource items queue filled on {} %'.format(
                 filled_resource_items_queue))
-            filled_retry_resource_items_queue \
-                = round(self.retry_resource_items_queue.qsize() / float(
-                    self.retry_resource_items_queue_size) / 100, 2)
+            filled_retry_resource_items_queue = self._queue_fill(
+                self.retry_resource_items_queue,
+                self.retry_resource_items_queue_size)
             logger.info('Retry resource items queue filled on {} %'.format(
                 filled_retry_resource_items_queue))
             sleep(self.queues_controller_timeout)
 
+    def _autoscale_sample(self):
+        resource = self.workers_config['resource']
+        durations = API_REQUEST_DURATION.children.values()
+        return (time(),
+                API_REQUESTS.labels(resource, 'ok').get() +
+                API_REQUESTS.labels(resource, 'not_modified').get(),
+                API_REQUESTS.labels(resource, 'throttled').get(),
+                sum(child.sum for child in durations),
+                sum(sum(child.counts) for child in durations))
+
+    def autoscale_controller(self):
+        autoscaler = WorkerAutoscaler(self.workers_min, self.workers_max,
+                                      cooldown=self.autoscale_cooldown)
+        sample = self._autoscale_sample()
+        while True:
+            sleep(self.autoscale_interval)
+            previous, sample = sample, self._autoscale_sample()
+            throughput = round((sample[1] - previous[1]) /
+                               max(sample[0] - previous[0], 1e-9), 2)
+            throttled = sample[2] - previous[2]
+            requests = sample[4] - previous[4]
+            # Series of removed api clients may make deltas negative
+            latency = (round((sample[3] - previous[3]) / requests, 3)
+                       if requests > 0 and sample[3] >= previous[3]
+                       else None)
+            workers = len(self.workers_pool)
+            target = autoscaler.update(
+                workers, throughput, latency, throttled,
+                self.resource_items_queue.qsize())
+            logger.info(
+                'Autoscaler: {} docs/s with {} workers, latency {} sec., '
+                '{} throttled, next workers count {}'.format(
+                    throughput, workers, latency, throttled, target),
+                extra={'MESSAGE_ID': 'autoscaler', 'THROUGHPUT': throughput,
+                       'WORKERS': workers, 'WORKERS_TARGET': target})
+            while len(self.workers_pool) < target:
+                self.add_main_worker()
+            while len(self.workers_pool) > target:
+                self.remove_main_worker()
+
     def gevent_watcher(self):
         self.perfomance_watcher()
+        self.resource_watcher()
+
+    def resource_watcher(self):
+        self.feeder.save_checkpoint()
+        self.save_backfill_checkpoint()
+        if self.capture is not None:
+            self.capture.flush()
         for t in self.server.tasks():
             if (t['type'] == 'indexer' and t['database'] == self.db_name and
                     t.get('design_document', None) == '_design/{}'.format(
@@ -384,7 +804,66 @@ class EdgeDataBridge(object):
                 logger.info(
                     'Watcher: Waiting for end of view indexing. Current'
                     ' progress: {} %'.format(t['progress']))
+        self.fillers_watcher()
+        self.workers_watcher()
+        self.journal_watcher()
+        self.conflicts_watcher()
+
+        # Log queues size and API clients count
+        main_queue_size = self.resource_items_queue.qsize()
+        logger.info('Resource items queue size {}'.format(
+            main_queue_size), extra={'MAIN_QUEUE_SIZE': main_queue_size})
+        retry_queue_size = self.retry_resource_items_queue.qsize()
+        logger.info('Resource items retry queue size {}'.format(
+            retry_queue_size), extra={'RETRY_QUEUE_SIZE': retry_queue_size})
+        retry_scheduled = self.retry_scheduler.pending()
+        logger.info('Resource items scheduled for retry {}'.format(
+            retry_scheduled), extra={'RETRY_SCHEDULED': retry_scheduled})
+        api_clients_count = len(self.api_clients_info)
+        logger.info('API Clients count: {}'.format(api_clients_count),
+                    extra={'API_CLIENTS': api_clients_count})
+        if self.rate_controller is not None:
+            rate = round(self.rate_controller.rate, 2)
+            logger.info('API requests rate {} per sec., throttled {} '
+                        'times'.format(rate, self.rate_controller.throttled),
+                        extra={'API_RATE_LIMIT': rate,
+                               'API_THROTTLED': (
+                                   self.rate_controller.throttled)})
 
+    def journal_watcher(self):
+        if self.journal is None:
+            return
+        try:
+            self.journal.sync()
+            self.journal.maybe_compact()
+        except (IOError, OSError) as e:
+            logger.error('Error while compacting {} journal: {}'.format(
+                self.workers_config['resource'], repr(e)),
+                extra={'MESSAGE_ID': 'exceptions'})
+        logger.info('Journal pending {} {}, {} bytes'.format(
+            len(self.journal), self.workers_config['resource'],
+            self.journal.size),
+            extra={'JOURNAL_PENDING': len(self.journal),
+                   'JOURNAL_BYTES': self.journal.size})
+
+    def conflicts_watcher(self):
+        if not self.workers_config['deterministic_revs']:
+            return
+        resource = self.workers_config['resource']
+        try:
+            pruned = prune_conflicts(self.db, resource[:-1].title(),
+                                     self.conflicts_prune_limit)
+        except Exception as e:
+            logger.error('Error while pruning {} conflicts: {}'.format(
+                resource, repr(e)), extra={'MESSAGE_ID': 'exceptions'})
+            return
+        PRUNED_CONFLICTS.labels(resource).inc(pruned)
+        if pruned:
+            logger.info('Pruned {} conflicting revisions of {}'.format(
+                pruned, resource), extra={'MESSAGE_ID': 'prune_conflicts',
+                                          'PRUNED_CONFLICTS': pruned})
+
+    def fillers_watcher(self):
         # Check fill threads
         input_threads = 1
         if self.input_queue_filler.ready():
@@ -405,20 +884,67 @@ class EdgeDataBridge(object):
         logger.info('Filter threads {}'.format(fill_threads),
                     extra={'FILTER_THREADS': fill_threads})
 
+    def workers_watcher(self):
+        if self.retry_scheduler.dead and self.retry_scheduler.pending():
+            logger.error('Retry scheduler error: {}'.format(
+                self.retry_scheduler.exception),
+                extra={'MESSAGE_ID': 'exception'})
+            retry_scheduler = RetryScheduler(self.retry_resource_items_queue)
+            retry_scheduler.heap = self.retry_scheduler.heap
+            retry_scheduler.start()
+            self.retry_scheduler = retry_scheduler
+            self.bulk_writer.retry_scheduler = retry_scheduler
+            for worker in self.workers_pool.greenlets | \
+                    self.retry_workers_pool.greenlets:
+                worker.retry_scheduler = retry_scheduler
+        if self.bulk_writer.dead:
+            logger.error('Bulk writer error: {}'.format(
+                self.bulk_writer.exception),
+                extra={'MESSAGE_ID': 'exception'})
+            bulk_writer = self.create_bulk_writer()
+            bulk_writer.queue = self.bulk_writer.queue
+            bulk_writer.bulk = self.bulk_writer.bulk
+            bulk_writer.priority_cache = self.bulk_writer.priority_cache
+            bulk_writer.on_saved = self.bulk_writer.on_saved
+            bulk_writer.start()
+            self.bulk_writer = bulk_writer
+            for worker in self.workers_pool.greenlets | \
+                    self.retry_workers_pool.greenlets:
+                worker.bulk_writer = bulk_writer
+        logger.info('Rev cache size {}, hits {}, misses {}'.format(
+            len(self.rev_cache), self.rev_cache.hits, self.rev_cache.misses),
+            extra={'REV_CACHE_SIZE': len(self.rev_cache),
+                   'REV_CACHE_HITS': self.rev_cache.hits,
+                   'REV_CACHE_MISSES': self.rev_cache.misses})
+        if self.etag_cache is not None:
+            logger.info(
+                'Not modified {} docs, saved {} bytes of API traffic'.format(
+                    self.etag_cache.not_modified, self.etag_cache.bytes_saved),
+                extra={'NOT_MODIFIED_DOCS': self.etag_cache.not_modified,
+                       'BANDWIDTH_SAVED': self.etag_cache.bytes_saved})
+        if self.fingerprint_cache is not None:
+            logger.info('Skipped {} unchanged docs'.format(
+                self.fingerprint_cache.unchanged),
+                extra={'UNCHANGED_DOCS': self.fingerprint_cache.unchanged})
+        if self.in_flight is not None:
+            logger.info('Coalesced {} fetches, {} {} being fetched'.format(
+                self.in_flight.coalesced, len(self.in_flight),
+                self.workers_config['resource']),
+                extra={'COALESCED_FETCHES': self.in_flight.coalesced,
+                       'IN_FLIGHT_FETCHES': len(self.in_flight)})
+        bulk_writers = len(self.bulk_writer.pool)
+        logger.info('Bulk writer threads {}, bulk queue size {}'.format(
+            bulk_writers, self.bulk_writer.queue.qsize()),
+            extra={'BULK_WRITER_THREADS': bulk_writers,
+                   'BULK_QUEUE_SIZE': self.bulk_writer.queue.qsize()})
         main_threads = self.workers_max - self.workers_pool.free_count()
         logger.info('Main threads {}'.format(main_threads),
                     extra={'MAIN_THREADS': main_threads})
 
         if len(self.workers_pool) < self.workers_min:
             for i in xrange(0, (self.workers_min - len(self.workers_pool))):
-                w = ResourceItemWorker.spawn(self.api_clients_queue,
-                                             self.resource_items_queue,
-                                             self.db, self.workers_config,
-                                             self.retry_resource_items_queue,
-                                             self.api_clients_info)
-                self.workers_pool.add(w)
+                self.add_main_worker()
                 logger.info('Watcher: Create main queue worker.')
-                self.create_api_client()
         retry_threads = self.retry_workers_max -\
             self.retry_workers_pool.free_count()
         logger.info('Retry threads {}'.format(retry_threads),
@@ -427,25 +953,10 @@ class EdgeDataBridge(object):
             for i in xrange(0, self.retry_workers_min -
                             len(self.retry_workers_pool)):
                 self.create_api_client()
-                w = ResourceItemWorker.spawn(self.api_clients_queue,
-                                             self.retry_resource_items_queue,
-                                             self.db, self.workers_config,
-                                             self.retry_resource_items_queue,
-                                             self.api_clients_info)
+                w = self.spawn_worker(self.retry_resource_items_queue)
                 self.retry_workers_pool.add(w)
                 logger.info('Watcher: Create retry queue worker.')
 
-        # Log queues size and API clients count
-        main_queue_size = self.resource_items_queue.qsize()
-        logger.info('Resource items queue size {}'.format(
-            main_queue_size), extra={'MAIN_QUEUE_SIZE': main_queue_size})
-        retry_queue_size = self.retry_resource_items_queue.qsize()
-        logger.info('Resource items retry queue size {}'.format(
-            retry_queue_size), extra={'RETRY_QUEUE_SIZE': retry_queue_size})
-        api_clients_count = len(self.api_clients_info)
-        logger.info('API Clients count: {}'.format(api_clients_count),
-                    extra={'API_CLIENTS': api_clients_count})
-
     def _calculate_st_dev(self, values):
         if len(values) > 0:
             avg = sum(values) * 1.0 / len(values)
@@ -456,17 +967,24 @@ class EdgeDataBridge(object):
         else:
             return 0
 
-    def _mark_bad_clients(self, dev):
-        # Mark bad api clients
+    def _mark_bad_clients(self, percent=95):
+        # Mark api clients which median request is slower than the tail
+        # of requests of all other clients as bad
+        counts = self._get_requests_counts(time())
+        total = map(sum, zip(*counts.values()))
         for cid, info in self.api_clients_info.items():
-            if info.get('grown', False) and info['avg_duration'] > dev:
+            threshold = bucket_percentiles(
+                [a - b for a, b in zip(total, counts[cid])], (percent,))[0]
+            if not threshold:
+                continue  # Nothing to compare with
+            p50 = info.get('p50', 0)
+            if info.get('grown', False) and p50 > threshold:
                 info['drop_cookies'] = True
                 logger.debug(
-                    'Perfomance watcher: Mark client {} as bad, avg.'
-                    ' request_duration is {} sec.'.format(
-                        cid, info['avg_duration']),
+                    'Perfomance watcher: Mark client {} as bad, p50'
+                    ' request_duration is {} sec.'.format(cid, p50),
                     extra={'MESSAGE_ID': 'marked_as_bad'})
-            elif info['avg_duration'] < dev and info['request_interval'] > 0:
+            elif p50 < threshold and info['request_interval'] > 0:
                 info['drop_cookies'] = True
                 logger.debug(
                     'Perfomance watcher: Mark client {} as bad,'
@@ -475,19 +993,10 @@ class EdgeDataBridge(object):
                     extra={'MESSAGE_ID': 'marked_as_bad'})
 
     def perfomance_watcher(self):
+            # Request durations are kept in rolling histograms, samples older
+            # than perfomance_window expire without pruning
             avg_duration, values = self._get_average_requests_duration()
-            for _, info in self.api_clients_info.items():
-                delta = timedelta(
-                    seconds=self.perfomance_window + self.watch_interval)
-                current_date = datetime.now() - delta
-                delete_list = []
-                for key in info['request_durations']:
-                    if key < current_date:
-                        delete_list.append(key)
-                for k in delete_list:
-                    del info['request_durations'][k]
-                delete_list = []
-
+            p50, p95, p99 = self._get_requests_percentiles()
             st_dev = self._calculate_st_dev(values)
             if len(values) > 0:
                 min_avg = min(values) * 1000
@@ -495,41 +1004,335 @@ class EdgeDataBridge(object):
             else:
                 max_avg = 0
                 min_avg = 0
-            dev = round(st_dev + avg_duration, 3)
 
             logger.info(
                 'Perfomance watcher:\nREQUESTS_STDEV - {} sec.\n'
-                'REQUESTS_DEV - {} ms.\nREQUESTS_MIN_AVG - {} ms.\n'
+                'REQUESTS_P50 - {} ms.\nREQUESTS_P95 - {} ms.\n'
+                'REQUESTS_P99 - {} ms.\nREQUESTS_MIN_AVG - {} ms.\n'
                 'REQUESTS_MAX_AVG - {} ms.\nREQUESTS_AVG - {} sec.'.format(
-                    round(st_dev, 3), dev, min_avg, max_avg, avg_duration),
-                extra={'REQUESTS_DEV': dev * 1000,
+                    round(st_dev, 3), round(p50 * 1000, 1),
+                    round(p95 * 1000, 1), round(p99 * 1000, 1), min_avg,
+                    max_avg, avg_duration),
+                extra={'REQUESTS_P50': p50 * 1000,
+                       'REQUESTS_P95': p95 * 1000,
+                       'REQUESTS_P99': p99 * 1000,
                        'REQUESTS_MIN_AVG': min_avg,
                        'REQUESTS_MAX_AVG': max_avg,
                        'REQUESTS_AVG': avg_duration * 1000})
-            self._mark_bad_clients(dev)
+            self._mark_bad_clients()
+
+    def register_metrics(self):
+        resource = self.workers_config['resource']
+        QUEUE_SIZE.labels(resource, 'input').set_function(
+            self.input_queue.qsize)
+        QUEUE_SIZE.labels(resource, 'main').set_function(
+            lambda: self.resource_items_queue.qsize())
+        QUEUE_SIZE.labels(resource, 'retry').set_function(
+            lambda: self.retry_resource_items_queue.qsize())
+        QUEUE_SIZE.labels(resource, 'retry_scheduled').set_function(
+            lambda: self.retry_scheduler.pending())
+        QUEUE_SIZE.labels(resource, 'bulk').set_function(
+            lambda: self.bulk_writer.queue.qsize())
+        if self.rate_controller is not None:
+            API_RATE_LIMIT.labels().set_function(
+                lambda: self.rate_controller.rate)
+
+    def start_metrics_server(self):
+        if self.metrics_port:
+            self.metrics_server = start_metrics_server(self.metrics_host,
+                                                       self.metrics_port)
+
+    def reset_checkpoint(self):
+        # A checkpoint saved with the journal on is reset as well
+        checkpoint = self.checkpoint or FeedCheckpoint(
+            self.db, self.workers_config['resource'])
+        checkpoint.reset()
+
+    def _replay_finished(self):
+        return not (self.resource_items_queue.qsize() or
+                    self.retry_resource_items_queue.qsize() or
+                    self.retry_scheduler.pending())
+
+    def replay_dead_letters(self, rate=1):
+        """Sync dead letters again without the feed.
+
+        Items are put to the main queue at 'rate' per second with the
+        whole retries budget, a letter is removed only when the bulk writer
+        saved its item or found it up to date.
+        """
+        if self.dead_letters is None:
+            self.dead_letters = self.create_dead_letter_store()
+            self.bulk_writer.dead_letters = self.dead_letters
+        saved_ids = set()
+        self.bulk_writer.on_saved = saved_ids.add
+        self.bulk_writer.start()
+        self.workers_watcher()
+        bucket = TokenBucket(rate)
+        letters = []
+        for letter in self.dead_letters.letters():
+            bucket.acquire()
+            self.resource_items_queue.put((1000, letter['item_id']))
+            letters.append(letter)
+        logger.info('Replay {} dead letters of {}'.format(
+            len(letters), self.workers_config['resource']),
+            extra={'MESSAGE_ID': 'replay_dead_letters'})
+        while True:
+            while not self._replay_finished():
+                sleep(1)
+            # Workers finish their items before exit
+            for pool in (self.workers_pool, self.retry_workers_pool):
+                for worker in pool.greenlets:
+                    worker.shutdown()
+                pool.join()
+            if self._replay_finished():
+                break
+            self.workers_watcher()
+        self.bulk_writer.shutdown()
+        self.bulk_writer.join()
+        removed = len([letter for letter in letters
+                       if letter['item_id'] in saved_ids and
+                       self.dead_letters.remove(letter)])
+        logger.info('Replayed {} dead letters of {}, {} not saved'.format(
+            removed, self.workers_config['resource'],
+            len(letters) - removed),
+            extra={'MESSAGE_ID': 'replay_dead_letters'})
+        return removed
+
+    def start_sync(self):
+        self.bulk_writer.start()
+        if self.date_modified_index is not None:
+            spawn(self.load_date_modified_index)
+        if self.journal is not None:
+            spawn(self.replay_journal)
+        self.input_queue_filler = spawn(self.fill_input_queue)
+        self.filler = spawn(self.fill_resource_items_queue)
+
+    def stop(self):
+        self.stopping.set()
+
+    def handle_signals(self):
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            gevent.signal(signum, self.stop)
+
+    def stop_intake(self):
+        for greenlet in (getattr(self, 'controller', None),
+                         getattr(self, 'input_queue_filler', None),
+                         getattr(self, 'filler', None)):
+            if greenlet is not None:
+                greenlet.kill()
+
+    def drain(self):
+        """Stop intake, let workers finish fetched items and flush bulks
+        within 'drain_timeout' seconds, then save checkpoints and journal.
+        """
+        deadline = time() + self.drain_timeout
+        logger.info('Drain {} within {} sec.'.format(
+            self.workers_config['resource'], self.drain_timeout),
+            extra={'MESSAGE_ID': 'edge_bridge_drain'})
+        self.stop_intake()
+        workers = list(self.workers_pool.greenlets |
+                       self.retry_workers_pool.greenlets)
+        for worker in workers:
+            worker.shutdown()
+        gevent.joinall(workers, timeout=max(deadline - time(), 0))
+        self.bulk_writer.shutdown()
+        self.bulk_writer.join(timeout=max(deadline - time(), 0))
+        drained = (all(worker.ready() for worker in workers) and
+                   self.bulk_writer.ready())
+        self.persist()
+        left = (self.input_queue.qsize() + self.resource_items_queue.qsize() +
+                self.retry_resource_items_queue.qsize() +
+                self.retry_scheduler.pending())
+        if not drained:
+            logger.error('Drain of {} timed out'.format(
+                self.workers_config['resource']),
+                extra={'MESSAGE_ID': 'edge_bridge_drain'})
+        if left and self.journal is None:
+            logger.warning('{} {} left in queues are lost, set journal_dir '
+                           'to keep them'.format(
+                               left, self.workers_config['resource']),
+                           extra={'MESSAGE_ID': 'edge_bridge_drain'})
+        logger.info('Drained {}, {} items left in queues'.format(
+            self.workers_config['resource'], left),
+            extra={'MESSAGE_ID': 'edge_bridge_drain'})
+        return drained
+
+    def persist(self):
+        self.feeder.save_checkpoint()
+        self.save_backfill_checkpoint()
+        if self.journal is not None:
+            self.journal.sync()
+        if self.capture is not None:
+            self.capture.flush()
 
     def run(self):
         logger.info('Start Edge Bridge',
                     extra={'MESSAGE_ID': 'edge_bridge_start_bridge'})
         logger.info('Start data sync...',
                     extra={'MESSAGE_ID': 'edge_bridge__data_sync'})
-        self.input_queue_filler = spawn(self.fill_input_queue)
-        self.filler = spawn(self.fill_resource_items_queue)
-        spawn(self.queues_controller)
+        self.handle_signals()
+        self.register_metrics()
+        self.start_metrics_server()
+        self.start_sync()
+        self.controller = spawn(self.queues_controller)
         while True:
             self.gevent_watcher()
-            sleep(self.watch_interval)
+            if self.stopping.wait(self.watch_interval):
+                break
+        self.drain()
+
+
+class MultiResourceEdgeDataBridge(object):
+
+    """Edge Bridge syncing several resources in one process.
+
+    Every resource gets its own EdgeDataBridge with a feeder and queues,
+    while api clients, couchdb connections and the watcher loop are shared.
+    'workers_max' is a global budget split across resources by backlog.
+    """
+
+    def __init__(self, config):
+        super(MultiResourceEdgeDataBridge, self).__init__()
+        self.config = config
+        resources = self.config_get('resources')
+        if isinstance(resources, basestring):
+            resources = [r.strip() for r in resources.split(',')]
+        if not resources:
+            raise DataBridgeConfigError('In config dictionary empty or '
+                                        'missing \'resources\'')
+        self.resources = resources
+        for key in ('couch_url', 'db_name', 'workers_min', 'workers_max',
+                    'watch_interval', 'queues_controller_timeout'):
+            setattr(self, key, self.config_get(key) or DEFAULTS[key])
+
+        self.db = prepare_couchdb(self.couch_url, self.db_name, logger)
+        self.server = Server(self.couch_url,
+                             session=Session(retry_delays=range(10)))
+        self.api_clients_queue = Queue()
+        self.api_clients_info = {}
+        self.bridges = []
+        rate_controller = None
+        for resource in self.resources:
+            bridge = EdgeDataBridge(config, resource=resource, db=self.db,
+                                    server=self.server,
+                                    api_clients_queue=self.api_clients_queue,
+                                    api_clients_info=self.api_clients_info,
+                                    rate_controller=rate_controller)
+            # The first bridge creates the rate controller for all
+            rate_controller = bridge.rate_controller
+            self.bridges.append(bridge)
+
+    def config_get(self, name):
+        try:
+            return self.config.get('main').get(name)
+        except AttributeError:
+            raise DataBridgeConfigError('In config dictionary missed section'
+                                        ' \'main\'')
+
+    def reset_checkpoint(self):
+        for bridge in self.bridges:
+            bridge.reset_checkpoint()
+
+    def split_workers(self):
+        backlogs = [bridge.resource_items_queue.qsize()
+                    for bridge in self.bridges]
+        total_backlog = sum(backlogs)
+        free_budget = max(
+            self.workers_max - self.workers_min * len(self.bridges), 0)
+        targets = []
+        for backlog in backlogs:
+            target = self.workers_min
+            if total_backlog > 0:
+                target += free_budget * backlog // total_backlog
+            targets.append(target)
+        return targets
+
+    def queues_controller(self):
+        while True:
+            for bridge, target in zip(self.bridges, self.split_workers()):
+                while len(bridge.workers_pool) < target:
+                    bridge.add_main_worker()
+                    logger.info('Queue controller: Create {} main queue '
+                                'worker.'.format(bridge.workers_config[
+                                    'resource'][:-1]))
+                while len(bridge.workers_pool) > target:
+                    bridge.remove_main_worker()
+                    logger.info('Queue controller: Kill {} main queue '
+                                'worker.'.format(bridge.workers_config[
+                                    'resource'][:-1]))
+            sleep(self.queues_controller_timeout)
+
+    def gevent_watcher(self):
+        # api_clients_info is shared, so any bridge can watch it
+        self.bridges[0].perfomance_watcher()
+        for bridge in self.bridges:
+            bridge.resource_watcher()
+
+    def run(self):
+        logger.info('Start Edge Bridge for {}'.format(
+            ', '.join(self.resources)),
+            extra={'MESSAGE_ID': 'edge_bridge_start_bridge'})
+        for bridge in self.bridges:
+            bridge.register_metrics()
+        self.bridges[0].start_metrics_server()
+        for bridge in self.bridges:
+            bridge.start_sync()
+        stopping = self.bridges[0].stopping
+        self.bridges[0].handle_signals()
+        controller = spawn(self.queues_controller)
+        while True:
+            self.gevent_watcher()
+            if stopping.wait(self.watch_interval):
+                break
+        controller.kill()
+        gevent.joinall([spawn(bridge.drain) for bridge in self.bridges])
 
 
 def main():
     parser = argparse.ArgumentParser(description='---- Edge Bridge ----')
+    parser.add_argument('command', nargs='?', choices=['replay-dead-letters'],
+                        help='Sync dead letters again instead of the feed')
     parser.add_argument('config', type=str, help='Path to configuration file')
+    parser.add_argument('--reset-checkpoint', action='store_true',
+                        help='Forget saved feed offsets and resync from '
+                             'scratch')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='Number of shard processes with workers')
+    parser.add_argument('--rate', type=float, default=1,
+                        help='Dead letters replayed per second')
+    parser.add_argument('--resource', type=str, default=None,
+                        help='Resource of dead letters to replay')
     params = parser.parse_args()
     if os.path.isfile(params.config):
         with open(params.config) as config_file_obj:
             config = load(config_file_obj.read())
         logging.config.dictConfig(config)
-        EdgeDataBridge(config).run()
+        resources = config.get('main', {}).get('resources')
+        if params.command == 'replay-dead-letters':
+            # The journal and the feed belong to the running bridge
+            config['main']['journal_dir'] = None
+            config['main']['backfill'] = False
+            if params.resource:
+                resources = [params.resource]
+            elif isinstance(resources, basestring):
+                resources = [r.strip() for r in resources.split(',')]
+            for resource in resources or [None]:
+                bridge = EdgeDataBridge(config, resource=resource)
+                bridge.replay_dead_letters(params.rate)
+            return
+        if params.processes > 1:
+            if resources:
+                raise DataBridgeConfigError('--processes can\'t be used '
+                                            'with multiple resources')
+            from openprocurement.edge.sharding import ShardedEdgeDataBridge
+            bridge = ShardedEdgeDataBridge(config, params.processes)
+        elif resources:
+            bridge = MultiResourceEdgeDataBridge(config)
+        else:
+            bridge = EdgeDataBridge(config)
+        if params.reset_checkpoint:
+            bridge.reset_checkpoint()
+        bridge.run()
 
 
 ##############################################################
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import logging
+from couchdb.http import ResourceConflict
+from openprocurement.edge.utils import get_now
+
+logger = logging.getLogger(__name__)
+
+
+class DeadLetterStore(object):
+
+    """Resource items dropped after 'retries_count' retries.
+
+    Every dropped item is a ``DeadLetter`` doc with ``<resource>:<id>`` id
+    in a couchdb database with its last error, status code, times of the
+    first and the last drop and the drops count, so a drop of the same
+    item again updates its letter.
+    """
+
+    def __init__(self, db, resource):
+        self.db = db
+        self.resource = resource
+
+    def doc_id(self, item_id):
+        return u'{}:{}'.format(self.resource, item_id)
+
+    def put(self, item_id, priority, status_code=0, error=None, now=None):
+        now = (now or get_now()).isoformat()
+        doc = self.db.get(self.doc_id(item_id)) or {
+            '_id': self.doc_id(item_id),
+            'doc_type': 'DeadLetter',
+            'resource': self.resource,
+            'item_id': item_id,
+            'first_dropped': now,
+            'dropped_count': 0
+        }
+        doc.update({
+            'last_dropped': now,
+            'dropped_count': doc['dropped_count'] + 1,
+            'priority': priority,
+            'status_code': status_code,
+            'error': error
+        })
+        self.db.save(doc)
+        return doc
+
+    def letters(self, batch=1000):
+        """Iterate letters of the resource by batches of _all_docs."""
+        params = {'startkey': self.doc_id(''),
+                  'endkey': self.doc_id(u'\ufff0'),
+                  'limit': batch, 'include_docs': True}
+        while True:
+            rows = list(self.db.view('_all_docs', **params))
+            for row in rows:
+                yield row.doc
+            if len(rows) < batch:
+                break
+            params['startkey'] = rows[-1].id
+            params['skip'] = 1
+
+    def remove(self, doc):
+        """Remove the letter unless it was dropped again since read."""
+        try:
+            self.db.delete(doc)
+        except ResourceConflict:
+            return False
+        return True
@@ -173,3 +173,11 @@ conflicts_view = ViewDefinition('conflicts', 'all', '''function(doc) {
         emit(doc._rev, [doc._rev].concat(doc._conflicts));
     }
 }''')
+
+
+conflicts_by_doc_type_view = ViewDefinition('conflicts', 'by_doc_type', '''
+function(doc) {
+    if (doc._conflicts) {
+        emit(doc.doc_type, [doc._rev].concat(doc._conflicts));
+    }
+}''')
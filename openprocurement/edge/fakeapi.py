@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+from gevent import monkey
+monkey.patch_all()
+
+import argparse
+import logging
+import math
+import random
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from json import dumps
+from time import time
+from urlparse import parse_qs
+from gevent import sleep, spawn
+from gevent.pywsgi import WSGIServer
+from iso8601 import parse_date
+from pytz import utc
+from openprocurement.edge.utils import TZ
+
+logger = logging.getLogger(__name__)
+
+RESOURCES = ('tenders', 'plans', 'contracts', 'auctions')
+EPOCH = datetime(1970, 1, 1, tzinfo=utc)
+STATUSES = {200: '200 OK', 304: '304 Not Modified', 404: '404 Not Found',
+            410: '410 Gone', 429: '429 Too Many Requests'}
+
+
+def parse_offset(offset, feed):
+    """Changes feed offsets are sequence numbers, dateModified feed
+    offsets are timestamps or ISO dates.
+
+    >>> parse_offset('5', 'changes'), parse_offset('', 'changes')
+    (5, None)
+    >>> parse_offset('2017-01-01T02:00:00+02:00', 'dateModified')
+    1483228800.0
+    """
+    if not offset:
+        return None
+    if feed == 'changes':
+        return int(offset)
+    try:
+        return float(offset)
+    except ValueError:
+        return (parse_date(offset) - EPOCH).total_seconds()
+
+
+def format_stamp(stamp):
+    """
+    >>> format_stamp(1483228800.000001)
+    '2017-01-01T02:00:00.000001+02:00'
+    """
+    return datetime.fromtimestamp(stamp, TZ).isoformat()
+
+
+class FakeResource(object):
+
+    """Generated items of a resource and their feed.
+
+    Every change of an item appends a ``(seq, timestamp, id)`` entry to
+    the feed, entries of older versions stay in place and are skipped, so
+    both feeds are bisects over the same ordered lists.
+    """
+
+    def __init__(self, name, docs=1000, gone_rate=0.0, history=86400,
+                 rand=None):
+        self.name = name
+        self.random = rand or random.Random()
+        self.items = {}
+        self.seqs = []
+        self.stamps = []
+        self.ids = []
+        start = time() - history
+        for i in xrange(0, docs):
+            item_id = '{:032x}'.format(self.random.getrandbits(128))
+            self.items[item_id] = {
+                'gone': self.random.random() < gone_rate}
+            self.touch(item_id, start + float(history) * i / max(docs, 1))
+
+    def touch(self, item_id, now=None):
+        now = time() if now is None else now
+        if self.stamps and now <= self.stamps[-1]:
+            now = self.stamps[-1] + 1e-6
+        # Offsets of ISO dates are exact
+        now = round(now, 6)
+        item = self.items[item_id]
+        item['seq'] = len(self.seqs) + 1
+        item['stamp'] = now
+        item['dateModified'] = format_stamp(now)
+        self.seqs.append(item['seq'])
+        self.stamps.append(now)
+        self.ids.append(item_id)
+
+    def update_random(self, now=None):
+        self.touch(self.random.choice(self.ids), now)
+
+    def live_count(self):
+        return len([item for item in self.items.values()
+                    if not item['gone']])
+
+    def page(self, feed='changes', offset=None, limit=100, descending=False):
+        """Return live entries after offset and offsets of both ends."""
+        keys = self.seqs if feed == 'changes' else self.stamps
+        if descending:
+            index = (len(keys) if offset is None
+                     else bisect_left(keys, offset)) - 1
+            step = -1
+        else:
+            index = 0 if offset is None else bisect_right(keys, offset)
+            step = 1
+        data = []
+        while 0 <= index < len(keys) and len(data) < limit:
+            item_id = self.ids[index]
+            item = self.items[item_id]
+            if item['seq'] == self.seqs[index]:
+                data.append((keys[index], {
+                    'id': item_id, 'dateModified': item['dateModified']}))
+            index += step
+        if data:
+            return [d for key, d in data], data[-1][0], data[0][0]
+        if offset is None and keys:
+            # Feed end for the next request
+            offset = keys[-1] if descending else keys[0] - 1
+        return [], offset, offset
+
+
+class FakeAPI(object):
+
+    """Local stand-in of the CDB API for benchmarks.
+
+    Serves ``changes`` and ``dateModified`` feeds and items of generated
+    resources with configurable doc size, lognormal latency and rates of
+    429 and 410 responses, items are updated at ``update_rate`` per
+    second by ``start_updates``.
+    """
+
+    def __init__(self, resources=RESOURCES, docs=1000, doc_size=2048,
+                 latency_median=0.0, latency_sigma=0.5, throttle_rate=0.0,
+                 retry_after=1, gone_rate=0.0, update_rate=0.0,
+                 page_limit=100, seed=None):
+        self.random = random.Random(seed)
+        self.resources = dict(
+            (name, FakeResource(name, docs, gone_rate, rand=self.random))
+            for name in resources)
+        self.doc_size = doc_size
+        self.latency_median = latency_median
+        self.latency_sigma = latency_sigma
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.update_rate = update_rate
+        self.page_limit = page_limit
+        self.requests = 0
+
+    def latency(self):
+        if self.latency_median <= 0:
+            return 0
+        return self.random.lognormvariate(math.log(self.latency_median),
+                                          self.latency_sigma)
+
+    def start_updates(self):
+        if self.update_rate > 0:
+            return spawn(self.updater)
+
+    def updater(self):
+        while True:
+            sleep(1.0 / self.update_rate)
+            for resource in self.resources.values():
+                resource.update_random()
+
+    def feed(self, resource, params):
+        feed = params.get('feed', 'changes')
+        descending = params.get('descending', '') not in ('', '0', 'False',
+                                                          'false')
+        limit = min(int(params.get('limit') or self.page_limit), 1000)
+        data, next_offset, prev_offset = resource.page(
+            feed, parse_offset(params.get('offset'), feed), limit,
+            descending)
+        if feed != 'changes' and next_offset is not None:
+            # str() of a float in query params loses microseconds
+            next_offset = format_stamp(next_offset)
+            prev_offset = format_stamp(prev_offset)
+        return 200, {}, {'data': data,
+                         'next_page': {'offset': next_offset},
+                         'prev_page': {'offset': prev_offset}}
+
+    def item(self, resource, item_id, environ):
+        item = resource.items.get(item_id)
+        if item is None:
+            return 404, {}, {'status': 'error', 'errors': [
+                {'location': 'url', 'name': 'tender_id',
+                 'description': 'Not Found'}]}
+        if self.random.random() < self.throttle_rate:
+            return 429, {'Retry-After': str(self.retry_after)}, {}
+        if item['gone']:
+            return 410, {}, {'status': 'error', 'errors': [
+                {'location': 'url', 'name': 'tender_id',
+                 'description': 'Archived'}]}
+        etag = 'W/"{}"'.format(item['seq'])
+        if environ.get('HTTP_IF_NONE_MATCH') == etag:
+            return 304, {'ETag': etag}, None
+        doc = {'id': item_id, 'dateModified': item['dateModified'],
+               'status': 'active', 'description': ''}
+        padding = self.doc_size - len(dumps({'data': doc}))
+        doc['description'] = 'x' * max(padding, 0)
+        return 200, {'ETag': etag}, {'data': doc}
+
+    def __call__(self, environ, start_response):
+        self.requests += 1
+        sleep(self.latency())
+        parts = environ['PATH_INFO'].strip('/').split('/')
+        params = dict((key, values[0]) for key, values in
+                      parse_qs(environ.get('QUERY_STRING', '')).items())
+        status, headers, body = 404, {}, {'status': 'error'}
+        if len(parts) >= 3 and parts[0] == 'api':
+            resource = self.resources.get(parts[2])
+            if parts[2] == 'spore' and len(parts) == 3:
+                status, body = 200, {}
+            elif resource is not None and len(parts) == 3:
+                status, headers, body = self.feed(resource, params)
+            elif resource is not None and len(parts) == 4:
+                status, headers, body = self.item(resource, parts[3],
+                                                  environ)
+        content = dumps(body) if body is not None else ''
+        headers = [(key, value) for key, value in headers.items()]
+        headers += [('Content-Type', 'application/json'),
+                    ('Content-Length', str(len(content)))]
+        start_response(STATUSES[status], headers)
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            return ['']
+        return [content]
+
+
+def add_api_arguments(parser):
+    parser.add_argument('--docs', type=int, default=1000,
+                        help='Items of every resource')
+    parser.add_argument('--doc-size', type=int, default=2048,
+                        help='Bytes of an item response')
+    parser.add_argument('--latency-median', type=float, default=0.0,
+                        help='Median of lognormal response latency, sec.')
+    parser.add_argument('--latency-sigma', type=float, default=0.5,
+                        help='Sigma of lognormal response latency')
+    parser.add_argument('--throttle-rate', type=float, default=0.0,
+                        help='Share of item requests answered with 429')
+    parser.add_argument('--retry-after', type=float, default=1,
+                        help='Retry-After of 429 responses, sec.')
+    parser.add_argument('--gone-rate', type=float, default=0.0,
+                        help='Share of archived items answered with 410')
+    parser.add_argument('--update-rate', type=float, default=0.0,
+                        help='Item updates per second for every resource')
+    parser.add_argument('--seed', type=int, default=None)
+
+
+def create_api(params, resources=RESOURCES):
+    return FakeAPI(resources, params.docs, params.doc_size,
+                   params.latency_median, params.latency_sigma,
+                   params.throttle_rate, params.retry_after, params.gone_rate,
+                   params.update_rate, seed=params.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='---- Fake CDB API ----')
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6543)
+    add_api_arguments(parser)
+    params = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    api = create_api(params)
+    api.start_updates()
+    logger.info('Fake API with {} items of {} at http://{}:{}'.format(
+        params.docs, ', '.join(RESOURCES), params.host, params.port))
+    WSGIServer((params.host, params.port), api, log=None).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+from gevent import monkey
+monkey.patch_all()
+
+import logging
+from collections import deque
+from gevent import spawn
+from openprocurement_client.sync import ResourceFeeder
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_DOC_ID = '_local/edge_bridge_checkpoint_{}'
+
+
+class FeedCheckpoint(object):
+
+    """Forward/backward feed offsets stored in a CouchDB ``_local`` doc.
+
+    ``_local`` documents are not replicated and are not indexed by views,
+    so the checkpoint never leaks into the edge API.
+    """
+
+    def __init__(self, db, resource):
+        self.db = db
+        self.resource = resource
+        self.doc_id = CHECKPOINT_DOC_ID.format(resource)
+        self.saved_state = {}
+
+    def load(self):
+        try:
+            doc = self.db.get(self.doc_id)
+        except Exception as e:
+            logger.error('Error while loading {} feed checkpoint: {}'.format(
+                self.resource, repr(e)), extra={'MESSAGE_ID': 'exceptions'})
+            return {}
+        if not doc:
+            return {}
+        self.saved_state = {
+            'forward_offset': doc.get('forward_offset'),
+            'backward_offset': doc.get('backward_offset'),
+            'backward_finished': doc.get('backward_finished', False)
+        }
+        if 'backfill' in doc:
+            self.saved_state['backfill'] = doc['backfill']
+        logger.info('Loaded {} feed checkpoint: {}'.format(
+            self.resource, self.saved_state),
+            extra={'MESSAGE_ID': 'load_checkpoint'})
+        return dict(self.saved_state)
+
+    def save(self, state):
+        # Keys missing in state, e.g. 'backfill', are kept in the doc
+        merged = dict(self.saved_state, **state)
+        if merged == self.saved_state:
+            return False
+        doc = self.db.get(self.doc_id) or {'_id': self.doc_id}
+        doc.update(state)
+        self.db.save(doc)
+        self.saved_state = merged
+        logger.debug('Saved {} feed checkpoint: {}'.format(
+            self.resource, state), extra={'MESSAGE_ID': 'save_checkpoint'})
+        return True
+
+    def reset(self):
+        doc = self.db.get(self.doc_id)
+        if doc:
+            self.db.delete(doc)
+        self.saved_state = {}
+        logger.info('Reset {} feed checkpoint.'.format(self.resource),
+                    extra={'MESSAGE_ID': 'reset_checkpoint'})
+
+
+class LowWaterMark(object):
+
+    """Newest feed state whose items are all handed over to the bridge.
+
+    Feed offsets move past a page as soon as its items are put to the feed
+    queue. A state marked with the number of items queued at that moment
+    becomes safe to checkpoint when as many items were taken from the
+    feed and put to the bridge queues, i.e. journaled.
+
+    >>> low_water = LowWaterMark()
+    >>> items = low_water.iterate(iter('abc'))
+    >>> next(items)
+    'a'
+    >>> low_water.mark({'offset': 1}, queued=2)
+    >>> low_water.safe_state() is None
+    True
+    >>> next(items), next(items)
+    ('b', 'c')
+    >>> low_water.safe_state() is None
+    True
+    >>> list(items), low_water.safe_state()
+    ([], {'offset': 1})
+    """
+
+    def __init__(self):
+        self.taken = 0
+        self.handed = 0
+        self.marks = deque()
+
+    def iterate(self, items):
+        for item in items:
+            self.taken += 1
+            yield item
+            # The consumer asks for the next item after the previous one
+            # is put to the queues
+            self.handed += 1
+
+    def mark(self, state, queued):
+        if self.marks and self.marks[-1][1] == state:
+            return  # The earlier mark of the state becomes safe sooner
+        self.marks.append((self.taken + queued, state))
+
+    def safe_state(self):
+        state = None
+        while self.marks and self.marks[0][0] <= self.handed:
+            state = self.marks.popleft()[1]
+        return state
+
+
+class CheckpointResourceFeeder(ResourceFeeder):
+
+    """ResourceFeeder which resumes from the offsets of a FeedCheckpoint.
+
+    Offsets are only persisted by an explicit ``save_checkpoint`` call, the
+    bridge does it from its watcher loop. Only offsets whose items were
+    handed over to the bridge are saved, the bridge journals them. Feed
+    pages are written to ``capture`` if it is given.
+    """
+
+    def __init__(self, checkpoint=None, capture=None, **kwargs):
+        super(CheckpointResourceFeeder, self).__init__(**kwargs)
+        self.checkpoint = checkpoint
+        self.capture = capture
+        self.state = None
+        self.backward_finished = False
+        self.low_water = LowWaterMark()
+
+    def init_api_clients(self):
+        if self.state is None:
+            self.state = self.checkpoint.load() if self.checkpoint else {}
+            self.backward_finished = self.state.get('backward_finished',
+                                                    False)
+        else:
+            # restart_sync: continue from the last seen offsets
+            self.state = self.get_state()
+        super(CheckpointResourceFeeder, self).init_api_clients()
+        if self.capture is not None:
+            self.capture.mount(self.forward_client.session)
+            self.capture.mount(self.backward_client.session)
+        if self.state.get('forward_offset'):
+            self.forward_params['offset'] = self.state['forward_offset']
+        if self.state.get('backward_offset'):
+            self.backward_params['offset'] = self.state['backward_offset']
+
+    def start_sync(self):
+        if not self.forward_params.get('offset'):
+            return super(CheckpointResourceFeeder, self).start_sync()
+        logger.info('Resume {} feed from checkpoint: forward offset {}, '
+                    'backward offset {}, backward finished {}'.format(
+                        self.resource, self.forward_params['offset'],
+                        self.backward_params.get('offset'),
+                        self.backward_finished),
+                    extra={'MESSAGE_ID': 'resume_from_checkpoint'})
+        if self.backward_finished:
+            self.backward_worker = spawn(lambda: 0)
+        else:
+            self.backward_worker = spawn(self.retriever_backward)
+        self.forward_worker = spawn(self.retriever_forward)
+
+    def get_resource_items(self):
+        return self.low_water.iterate(
+            super(CheckpointResourceFeeder, self).get_resource_items())
+
+    def retriever_backward(self):
+        result = super(CheckpointResourceFeeder, self).retriever_backward()
+        if result == 0:
+            self.backward_finished = True
+        return result
+
+    def get_state(self):
+        forward_params = getattr(self, 'forward_params', {})
+        backward_params = getattr(self, 'backward_params', {})
+        return {
+            'forward_offset': forward_params.get('offset'),
+            'backward_offset': backward_params.get('offset'),
+            'backward_finished': self.backward_finished
+        }
+
+    def save_checkpoint(self):
+        if self.checkpoint is None or self.state is None:
+            return False
+        state = self.get_state()
+        if state['forward_offset']:
+            self.low_water.mark(state, self.queue.qsize())
+        state = self.low_water.safe_state()
+        if state is None:
+            return False
+        try:
+            return self.checkpoint.save(state)
+        except Exception as e:
+            logger.error('Error while saving {} feed checkpoint: {}'.format(
+                self.resource, repr(e)), extra={'MESSAGE_ID': 'exceptions'})
+            return False
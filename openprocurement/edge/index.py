@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+import logging
+from array import array
+from binascii import unhexlify
+from calendar import timegm
+from struct import unpack_from
+from time import time
+from iso8601 import parse_date
+
+logger = logging.getLogger(__name__)
+
+KEY_SIZE = 16
+EMPTY = 0
+MAX_LOAD = 0.8
+GROWTH = 1.5
+INITIAL_CAPACITY = 1 << 16
+# Stored seconds are counted from 2000 till 2136, 0 marks an empty slot
+BASE = timegm((2000, 1, 1, 0, 0, 0)) - 1
+
+
+def date_to_microseconds(date_modified):
+    """Convert an ISO 8601 dateModified into microseconds since epoch.
+
+    >>> date_to_microseconds('1970-01-01T00:00:01.000002+00:00')
+    1000002
+    >>> date_to_microseconds('2017-01-01T03:00:00+03:00')
+    1483228800000000
+    """
+    try:
+        # Fast path for the 'YYYY-MM-DDTHH:MM:SS[.ffffff]+HH:MM' format
+        seconds = timegm((int(date_modified[0:4]), int(date_modified[5:7]),
+                          int(date_modified[8:10]), int(date_modified[11:13]),
+                          int(date_modified[14:16]),
+                          int(date_modified[17:19])))
+        if date_modified[19] == '.':
+            fraction = date_modified[20:26]
+            microseconds = int(fraction.ljust(6, '0'))
+            tz = date_modified[20 + len(fraction):]
+        else:
+            microseconds = 0
+            tz = date_modified[19:]
+        if tz[0] in '+-' and len(tz) == 6 and tz[3] == ':':
+            offset = int(tz[1:3]) * 3600 + int(tz[4:6]) * 60
+            seconds = seconds - offset if tz[0] == '+' else seconds + offset
+        elif tz != 'Z':
+            raise ValueError(tz)
+    except (ValueError, IndexError):
+        date = parse_date(date_modified)
+        seconds = timegm(date.utctimetuple())
+        microseconds = date.microsecond
+    return seconds * 1000000 + microseconds
+
+
+class DateModifiedIndex(object):
+
+    """Compact in-memory ``id -> dateModified`` index of stored docs.
+
+    Hex ids are packed as 16 bytes into one bytearray, dateModified is kept
+    as seconds since 2000 and microseconds of the second in two
+    ``array('I')``; they form an open addressing table with linear probing,
+    24 bytes per slot. The table is kept at most 80% full and grows by 1.5,
+    so it takes 30 to 45 bytes per doc, ``load`` presizes it to the lower
+    bound. Ids which aren't 32 hex digits fall back to a plain dict.
+    Values only ever grow, as the validate_doc_update function of the db
+    only accepts newer documents.
+    """
+
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        self.loaded = False
+        self.size = 0
+        self.extra = {}
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        self.capacity = capacity
+        self.keys = bytearray(capacity * KEY_SIZE)
+        self.values = array('I', [EMPTY]) * capacity
+        self.fractions = array('I', [EMPTY]) * capacity
+
+    def __len__(self):
+        return self.size + len(self.extra)
+
+    @property
+    def nbytes(self):
+        """Memory taken by the table."""
+        return (len(self.keys) + self.values.itemsize * self.capacity +
+                self.fractions.itemsize * self.capacity)
+
+    def _pack(self, item_id):
+        if len(item_id) != 32:
+            return None
+        try:
+            return unhexlify(item_id)
+        except (TypeError, ValueError):
+            return None
+
+    def _split(self, date_modified):
+        seconds, microseconds = divmod(date_to_microseconds(date_modified),
+                                       1000000)
+        return seconds - BASE, microseconds
+
+    def _slot(self, key):
+        keys = self.keys
+        values = self.values
+        capacity = self.capacity
+        slot = unpack_from('<Q', key)[0] % capacity
+        while values[slot] != EMPTY:
+            offset = slot * KEY_SIZE
+            if keys[offset:offset + KEY_SIZE] == key:
+                return slot
+            slot += 1
+            if slot == capacity:
+                slot = 0
+        return slot
+
+    def _resize(self, capacity):
+        keys = self.keys
+        values = self.values
+        fractions = self.fractions
+        self._allocate(capacity)
+        for slot, value in enumerate(values):
+            if value != EMPTY:
+                key = bytes(keys[slot * KEY_SIZE:(slot + 1) * KEY_SIZE])
+                new_slot = self._slot(key)
+                offset = new_slot * KEY_SIZE
+                self.keys[offset:offset + KEY_SIZE] = key
+                self.values[new_slot] = value
+                self.fractions[new_slot] = fractions[slot]
+
+    def reserve(self, count):
+        """Presize the table for count docs at once."""
+        capacity = int(count / MAX_LOAD) + 1
+        if capacity > self.capacity:
+            self._resize(capacity)
+
+    def get(self, item_id):
+        """Return stored dateModified as microseconds or None."""
+        key = self._pack(item_id)
+        if key is None:
+            value = self.extra.get(item_id)
+            if value is None:
+                return None
+            return (value[0] + BASE) * 1000000 + value[1]
+        slot = self._slot(key)
+        value = self.values[slot]
+        if value == EMPTY:
+            return None
+        return (value + BASE) * 1000000 + self.fractions[slot]
+
+    def set(self, item_id, date_modified):
+        """Store dateModified of item_id unless a newer one is known."""
+        seconds, fraction = self._split(date_modified)
+        key = self._pack(item_id)
+        if key is None:
+            if (seconds, fraction) > self.extra.get(item_id, (EMPTY, EMPTY)):
+                self.extra[item_id] = (seconds, fraction)
+            return
+        slot = self._slot(key)
+        if self.values[slot] == EMPTY:
+            if (self.size + 1) > self.capacity * MAX_LOAD:
+                self._resize(int(self.capacity * GROWTH))
+                slot = self._slot(key)
+            offset = slot * KEY_SIZE
+            self.keys[offset:offset + KEY_SIZE] = key
+            self.size += 1
+        if (seconds, fraction) > (self.values[slot], self.fractions[slot]):
+            self.values[slot] = seconds
+            self.fractions[slot] = fraction
+
+    def is_actual(self, item_id, date_modified):
+        """True if the stored doc isn't older than date_modified."""
+        stored = self.get(item_id)
+        if stored is None:
+            return False
+        return stored >= date_to_microseconds(date_modified)
+
+    def load(self, db, view_path, batch=10000):
+        """Fill the index by paging through by_dateModified view."""
+        start = time()
+        self.reserve(db.view(view_path, limit=0).total_rows)
+        for row in db.iterview(view_path, batch):
+            self.set(row.id, row.key)
+        self.loaded = True
+        logger.info('Loaded {} docs to dateModified index ({} bytes) in {} '
+                    'sec.'.format(len(self), self.nbytes,
+                                  round(time() - start, 3)),
+                    extra={'MESSAGE_ID': 'load_date_modified_index',
+                           'INDEX_SIZE': len(self)})
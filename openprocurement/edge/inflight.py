@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+
+class InFlight(object):
+
+    """Ids being fetched from the API by the workers of a bridge.
+
+    The same id may be taken from the main and the retry queue at once. A
+    second fetch of an id in flight is coalesced into the running one,
+    the doc it gets serves both. A newer dateModified reported by the feed
+    meanwhile is kept and the id is fetched once more if the running fetch
+    got an older doc.
+
+    >>> in_flight = InFlight()
+    >>> in_flight.start('a'), in_flight.start('a')
+    (True, False)
+    >>> in_flight.note('a', '2017-01-02'), in_flight.note('b', '2017-01-02')
+    (True, False)
+    >>> in_flight.finish('a', '2017-01-01')
+    '2017-01-02'
+    >>> in_flight.start('a'), in_flight.finish('a', '2017-01-01')
+    (True, None)
+    >>> in_flight.coalesced
+    2
+    """
+
+    def __init__(self):
+        self.fetching = {}
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self.fetching)
+
+    def __contains__(self, item_id):
+        return item_id in self.fetching
+
+    def start(self, item_id):
+        """Register a fetch of item_id, False if it's fetched already."""
+        if item_id in self.fetching:
+            self.coalesced += 1
+            return False
+        self.fetching[item_id] = None
+        return True
+
+    def note(self, item_id, date_modified):
+        """Keep a dateModified reported for item_id if it's fetched now.
+
+        Returns False if item_id isn't in flight and has to be queued.
+        """
+        if item_id not in self.fetching:
+            return False
+        reported = self.fetching[item_id]
+        if reported is None or reported < date_modified:
+            self.fetching[item_id] = date_modified
+        self.coalesced += 1
+        return True
+
+    def finish(self, item_id, date_modified=None):
+        """End the fetch of item_id which got a doc with date_modified or
+        nothing.
+
+        Returns the dateModified reported meanwhile which wasn't fetched,
+        so item_id has to be fetched again, otherwise None.
+        """
+        reported = self.fetching.pop(item_id, None)
+        if reported is not None and (date_modified is None or
+                                     date_modified < reported):
+            return reported
+        return None
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+class QueueJournal(object):
+
+    """Append-only file journal of resource item ids pending in the bridge
+    queues.
+
+    An id is added with its priority and dateModified when it is received
+    from the feed or put to the retry queue and discarded when its doc is
+    saved or turns out to be actual, so ids which are left at a restart are
+    the ones to replay. Lines are flushed on every write, which survives a
+    crash of the process, and the file is synced by ``sync`` and on
+    compaction. ``compact`` rewrites the file with pending ids only, it's
+    done when the file grows over ``max_bytes`` or over twice the size of
+    pending ids; ids which don't fit ``max_bytes`` even after compaction
+    are not journaled.
+
+    >>> import tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), 'tenders.journal')
+    >>> journal = QueueJournal(path)
+    >>> journal.add('a', 1, '2017-01-01T00:00:00+02:00')
+    >>> journal.add('b', 1, '2017-01-02T00:00:00+02:00')
+    >>> journal.add('a', 1002)
+    >>> journal.discard('b', '2017-01-02T00:00:00+02:00')
+    >>> journal.close()
+    >>> QueueJournal(path).items()
+    [('a', 1002, '2017-01-01T00:00:00+02:00')]
+    """
+
+    def __init__(self, path, max_bytes=64 * 1024 * 1024,
+                 min_compact_bytes=1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.min_compact_bytes = min_compact_bytes
+        self.pending = {}
+        self.size = 0
+        self.live_bytes = 0
+        self.not_journaled = 0
+        torn = self.load()
+        self.file = open(self.path, 'ab')
+        if torn:
+            # Next lines must not be glued to the torn one
+            self.compact()
+
+    @staticmethod
+    def _add_line(item_id, priority, date_modified):
+        return 'A {} {} {}\n'.format(priority, item_id, date_modified or '-')
+
+    @staticmethod
+    def _discard_line(item_id):
+        return 'D {}\n'.format(item_id)
+
+    def load(self):
+        """Read pending ids, return True if the last write was torn."""
+        if not os.path.exists(self.path):
+            return False
+        torn = False
+        with open(self.path, 'rb') as journal_file:
+            for line in journal_file:
+                self.size += len(line)
+                if not line.endswith('\n'):
+                    torn = True
+                    break
+                fields = line.split()
+                if fields[0] == 'A' and len(fields) == 4:
+                    self._set(fields[2], int(fields[1]),
+                              fields[3] if fields[3] != '-' else None)
+                elif fields[0] == 'D' and len(fields) == 2:
+                    self._unset(fields[1])
+        logger.info('Journal {}: {} pending ids'.format(
+            self.path, len(self.pending)),
+            extra={'MESSAGE_ID': 'journal_load'})
+        return torn
+
+    def _set(self, item_id, priority, date_modified):
+        self._unset(item_id)
+        self.pending[item_id] = (priority, date_modified)
+        self.live_bytes += len(self._add_line(item_id, priority,
+                                              date_modified))
+
+    def _unset(self, item_id):
+        entry = self.pending.pop(item_id, None)
+        if entry is not None:
+            self.live_bytes -= len(self._add_line(item_id, *entry))
+
+    def _write(self, line):
+        self.file.write(line)
+        self.file.flush()
+        self.size += len(line)
+
+    def add(self, item_id, priority, date_modified=None):
+        """Journal a pending id, a retry keeps the known dateModified."""
+        entry = self.pending.get(item_id)
+        if entry is not None and date_modified is None:
+            date_modified = entry[1]
+        if entry == (priority, date_modified):
+            return
+        line = self._add_line(item_id, priority, date_modified)
+        if self.size + len(line) > self.max_bytes:
+            self.compact()
+            if self.live_bytes + len(line) > self.max_bytes:
+                self.not_journaled += 1
+                logger.warning('Journal {} is full, {} {} is not '
+                               'journaled'.format(self.path, item_id,
+                                                  date_modified),
+                               extra={'MESSAGE_ID': 'journal_full'})
+                return
+        self._write(line)
+        self._set(item_id, priority, date_modified)
+
+    def discard(self, item_id, date_modified=None):
+        """Forget an id unless a newer dateModified of it is pending."""
+        entry = self.pending.get(item_id)
+        if entry is None:
+            return
+        if (date_modified is not None and entry[1] is not None and
+                entry[1] > date_modified):
+            return
+        self._write(self._discard_line(item_id))
+        self._unset(item_id)
+
+    def items(self):
+        """Pending ``(id, priority, dateModified)`` by priority."""
+        return sorted(((item_id, priority, date_modified)
+                       for item_id, (priority, date_modified)
+                       in self.pending.items()),
+                      key=lambda item: item[1])
+
+    def __len__(self):
+        return len(self.pending)
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def compact(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as tmp_file:
+            for item_id, (priority, date_modified) in self.pending.items():
+                tmp_file.write(self._add_line(item_id, priority,
+                                              date_modified))
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+        os.rename(tmp_path, self.path)
+        self.file.close()
+        self.file = open(self.path, 'ab')
+        logger.debug('Journal {} compacted from {} to {} bytes'.format(
+            self.path, self.size, self.live_bytes),
+            extra={'MESSAGE_ID': 'journal_compact'})
+        self.size = self.live_bytes
+
+    def maybe_compact(self):
+        if self.size > max(self.live_bytes * 2, self.min_compact_bytes):
+            self.compact()
+            return True
+        return False
+
+    def close(self):
+        self.file.close()
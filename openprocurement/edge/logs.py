@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+import logging
+from time import time
+
+EVENT_LOGS = []
+
+
+class LazyMessage(object):
+
+    """``str.format`` message which is formatted only if a handler emits
+    the record.
+
+    >>> str(LazyMessage('{} {}', ('a', 1)))
+    'a 1'
+    """
+
+    __slots__ = ('fmt', 'args')
+
+    def __init__(self, fmt, args):
+        self.fmt = fmt
+        self.args = args
+
+    def __str__(self):
+        return self.fmt.format(*self.args)
+
+
+class EventLog(object):
+
+    """Log of a per document event with one ``MESSAGE_ID``.
+
+    ``log`` returns before building the message unless the logger is
+    enabled for the level, 1 of ``every`` events and at most ``rate``
+    events per second get through, the number of events skipped before a
+    record is in its ``SKIPPED_EVENTS`` extra.
+
+    >>> log = EventLog(logging.getLogger('doctest'), 'save', logging.INFO)
+    >>> log.every = 2
+    >>> log.logger.setLevel(logging.INFO)
+    >>> [log.log('Save {}', item_id) for item_id in 'abc']
+    [False, True, False]
+    >>> log.skipped, log.count
+    (1, 3)
+    """
+
+    def __init__(self, logger, message_id, level=logging.DEBUG):
+        self.logger = logger
+        self.message_id = message_id
+        self.level = level
+        self.every = 1
+        self.rate = None
+        self.count = 0
+        self.skipped = 0
+        self.second = 0
+        self.second_count = 0
+        EVENT_LOGS.append(self)
+
+    def allowed(self):
+        self.count += 1
+        if self.every > 1 and self.count % self.every:
+            return False
+        if self.rate is not None:
+            second = int(time())
+            if second != self.second:
+                self.second = second
+                self.second_count = 0
+            if self.second_count >= self.rate:
+                return False
+            self.second_count += 1
+        return True
+
+    def log(self, fmt, *args, **extra):
+        if not self.logger.isEnabledFor(self.level):
+            return False
+        if not self.allowed():
+            self.skipped += 1
+            return False
+        extra.setdefault('MESSAGE_ID', self.message_id)
+        if self.skipped:
+            extra['SKIPPED_EVENTS'] = self.skipped
+            self.skipped = 0
+        self.logger.log(self.level, LazyMessage(fmt, args), extra=extra)
+        return True
+
+
+def configure_events(every=1, rate=None):
+    """Sample all per document events, 1 of ``every`` and at most
+    ``rate`` per second of every event."""
+    for event_log in EVENT_LOGS:
+        event_log.every = every
+        event_log.rate = rate
@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+from gevent import monkey
+monkey.patch_all()
+
+import logging
+import math
+from bisect import bisect_left
+from collections import OrderedDict
+from time import time
+from gevent.pywsgi import WSGIServer
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+                    30)
+
+
+def format_labels(labelnames, labelvalues, extra=()):
+    """Render a Prometheus label set.
+
+    >>> format_labels(('resource', 'queue'), ('tenders', 'm"a\\\\in'))
+    '{resource="tenders",queue="m\\\\"a\\\\\\\\in"}'
+    >>> format_labels((), ())
+    ''
+    """
+    pairs = zip(labelnames, labelvalues) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\')
+                         .replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs) + '}'
+
+
+class GaugeChild(object):
+
+    """Gauge set directly or computed by a function on every scrape."""
+
+    def __init__(self):
+        self.value = 0
+        self.function = None
+
+    def set(self, value):
+        self.value = value
+
+    def set_function(self, function):
+        self.function = function
+
+    def get(self):
+        return self.function() if self.function is not None else self.value
+
+
+class Metric(object):
+
+    """Metric family, values are kept by children per label values.
+
+    ``labels(...)`` children may be cached by the caller, so that hot path
+    updates are a single attribute change. A plain Metric is untyped, its
+    children are values set like gauges; subclasses set ``new_child``.
+    """
+
+    type = 'untyped'
+    new_child = GaugeChild
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.children = {}
+
+    def labels(self, *labelvalues):
+        child = self.children.get(labelvalues)
+        if child is None:
+            child = self.children[labelvalues] = self.new_child()
+        return child
+
+    def remove(self, *labelvalues):
+        self.children.pop(labelvalues, None)
+
+    def samples(self):
+        for labelvalues, child in self.children.items():
+            yield self.name, labelvalues, (), child.get()
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.documentation),
+                 '# TYPE {} {}'.format(self.name, self.type)]
+        for name, labelvalues, extra, value in self.samples():
+            lines.append('{}{} {}'.format(
+                name, format_labels(self.labelnames, labelvalues, extra),
+                repr(float(value))))
+        return '\n'.join(lines)
+
+
+class CounterChild(object):
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def get(self):
+        return self.value
+
+
+class Counter(Metric):
+
+    type = 'counter'
+    new_child = CounterChild
+
+
+class Gauge(Metric):
+
+    type = 'gauge'
+    new_child = GaugeChild
+
+
+class HistogramChild(object):
+
+    """Fixed buckets histogram, observe is a bisect and two additions."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Histogram(Metric):
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(),
+                 buckets=DURATION_BUCKETS):
+        super(Histogram, self).__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def new_child(self):
+        return HistogramChild(self.buckets)
+
+    def samples(self):
+        for labelvalues, child in self.children.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), child.counts):
+                cumulative += count
+                yield (self.name + '_bucket', labelvalues,
+                       (('le', bound),), cumulative)
+            yield self.name + '_sum', labelvalues, (), child.sum
+            yield self.name + '_count', labelvalues, (), cumulative
+
+
+class Registry(object):
+
+    def __init__(self):
+        self.metrics = OrderedDict()
+
+    def register(self, metric):
+        return self.metrics.setdefault(metric.name, metric)
+
+    def render(self):
+        return '\n'.join(metric.render()
+                         for metric in self.metrics.values()) + '\n'
+
+
+REGISTRY = Registry()
+
+FEED_ITEMS = REGISTRY.register(Counter(
+    'edge_bridge_feed_items_total', 'Items received from the feed.',
+    ('resource',)))
+QUEUE_SIZE = REGISTRY.register(Gauge(
+    'edge_bridge_queue_size', 'Items waiting in bridge queues.',
+    ('resource', 'queue')))
+API_RATE_LIMIT = REGISTRY.register(Gauge(
+    'edge_bridge_api_rate_limit',
+    'Requests per second allowed to all api clients.'))
+API_REQUESTS = REGISTRY.register(Counter(
+    'edge_bridge_api_requests_total', 'Item requests to the API by result.',
+    ('resource', 'result')))
+API_REQUEST_DURATION = REGISTRY.register(Histogram(
+    'edge_bridge_api_request_duration_seconds',
+    'Duration of item requests to the API.', ('client',)))
+BULK_SAVE_DURATION = REGISTRY.register(Histogram(
+    'edge_bridge_bulk_save_duration_seconds',
+    'Duration of _bulk_docs requests.', ('resource',)))
+BULK_SAVE_SIZE = REGISTRY.register(Histogram(
+    'edge_bridge_bulk_save_docs', 'Docs in a _bulk_docs request.',
+    ('resource',), buckets=(1, 10, 50, 100, 250, 500, 1000, 2500, 5000)))
+BULK_SAVE_BYTES = REGISTRY.register(Histogram(
+    'edge_bridge_bulk_save_bytes', 'Doc bytes in a _bulk_docs request.',
+    ('resource',), buckets=tuple(2 ** power for power in range(16, 30, 2))))
+SAVED_DOCS = REGISTRY.register(Counter(
+    'edge_bridge_saved_docs_total', 'Results of doc writes.',
+    ('resource', 'result')))
+RETRIES = REGISTRY.register(Counter(
+    'edge_bridge_retries_total', 'Items put to the retry queue.',
+    ('resource',)))
+DROPPED = REGISTRY.register(Counter(
+    'edge_bridge_dropped_docs_total', 'Items dropped after retries.',
+    ('resource',)))
+PRUNED_CONFLICTS = REGISTRY.register(Counter(
+    'edge_bridge_pruned_conflicts_total',
+    'Losing revisions deleted by conflict pruning.', ('resource',)))
+DOCUMENT_TIMESHIFT = REGISTRY.register(Histogram(
+    'edge_bridge_document_timeshift_seconds',
+    'Time from dateModified to save of a doc.', ('resource',),
+    buckets=(1, 5, 10, 30, 60, 300, 900, 3600, 21600, 86400)))
+
+
+def metrics_app(environ, start_response):
+    if environ['PATH_INFO'] != '/metrics':
+        start_response('404 Not Found', [('Content-Type', 'text/plain')])
+        return ['Not Found\n']
+    body = REGISTRY.render()
+    start_response('200 OK', [('Content-Type', CONTENT_TYPE),
+                              ('Content-Length', str(len(body)))])
+    return [body]
+
+
+def start_metrics_server(host, port):
+    server = WSGIServer((host, port), metrics_app, log=None)
+    server.start()
+    logger.info('Metrics are served at http://{}:{}/metrics'.format(
+        host, server.server_port),
+        extra={'MESSAGE_ID': 'edge_bridge_metrics_server'})
+    return server
+
+
+LATENCY_MIN = 0.001
+LATENCY_FACTOR = 1.25
+LATENCY_LOG_FACTOR = math.log(LATENCY_FACTOR)
+LATENCY_BUCKETS = 54  # up to ~170 sec., slower requests share the last one
+
+
+def latency_bucket(value):
+    """Index of the log-spaced bucket of value.
+
+    >>> latency_bucket(0.0005), latency_bucket(0.001), latency_bucket(0.0011)
+    (0, 0, 1)
+    >>> latency_bucket(10 ** 6) == LATENCY_BUCKETS
+    True
+    """
+    if value <= LATENCY_MIN:
+        return 0
+    return min(int(math.ceil(math.log(value / LATENCY_MIN) /
+                             LATENCY_LOG_FACTOR - 1e-9)), LATENCY_BUCKETS)
+
+
+def bucket_percentiles(counts, percents):
+    """Upper bounds of buckets holding the given percentiles.
+
+    >>> bucket_percentiles([2, 0, 1, 1], (50, 75, 100))
+    [0.001, 0.0015625, 0.001953125]
+    >>> bucket_percentiles([0, 0], (50, 99))
+    [0, 0]
+    """
+    total = sum(counts)
+    if not total:
+        return [0] * len(percents)
+    result = []
+    for percent in percents:
+        rank = max(int(math.ceil(total * percent / 100.0)), 1)
+        seen = 0
+        for index, count in enumerate(counts):
+            seen += count
+            if seen >= rank:
+                break
+        result.append(LATENCY_MIN * LATENCY_FACTOR ** index)
+    return result
+
+
+class RollingHistogram(object):
+
+    """Request latencies over a sliding time window.
+
+    The window is a ring of ``slots`` time slices, each holding counts of
+    log-spaced buckets (1 ms * 1.25 ** N), so ``record`` is O(1) and slices
+    older than the window are reused instead of pruned. Percentiles are
+    upper bounds of buckets, within 25% of the exact value.
+    """
+
+    def __init__(self, window=300, slots=30):
+        self.window = window
+        self.slots = slots
+        self.width = float(window) / slots
+        self.reset()
+
+    def reset(self):
+        self.epochs = [None] * self.slots
+        self.counts = [None] * self.slots
+        self.sums = [0.0] * self.slots
+        self.first = None
+
+    def record(self, value, now=None):
+        now = time() if now is None else now
+        epoch = int(now / self.width)
+        slot = epoch % self.slots
+        if self.epochs[slot] != epoch:
+            self.epochs[slot] = epoch
+            self.counts[slot] = [0] * (LATENCY_BUCKETS + 1)
+            self.sums[slot] = 0.0
+        self.counts[slot][latency_bucket(value)] += 1
+        self.sums[slot] += value
+        if self.first is None:
+            self.first = now
+
+    def live_slots(self, now=None):
+        epoch = int((time() if now is None else now) / self.width)
+        return [slot for slot in xrange(0, self.slots)
+                if self.epochs[slot] is not None and
+                epoch - self.epochs[slot] < self.slots]
+
+    def merged_counts(self, now=None):
+        counts = [0] * (LATENCY_BUCKETS + 1)
+        for slot in self.live_slots(now):
+            for index, count in enumerate(self.counts[slot]):
+                counts[index] += count
+        return counts
+
+    def count(self, now=None):
+        return sum(sum(self.counts[slot]) for slot in self.live_slots(now))
+
+    def mean(self, now=None):
+        slots = self.live_slots(now)
+        count = sum(sum(self.counts[slot]) for slot in slots)
+        if not count:
+            return 0
+        return sum(self.sums[slot] for slot in slots) / count
+
+    def age(self, now=None):
+        if self.first is None:
+            return 0
+        return (time() if now is None else now) - self.first
+
+    def percentiles(self, percents=(50, 95, 99), now=None):
+        return bucket_percentiles(self.merged_counts(now), percents)
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+from gevent import monkey
+monkey.patch_all()
+
+import heapq
+from gevent.queue import PriorityQueue
+
+REMOVED = False
+ACTIVE = True
+
+
+class IndexedPriorityQueue(PriorityQueue):
+
+    """Priority queue of ``(priority, item_id)`` unique by ``item_id``.
+
+    Membership is tracked in a dict, so ``item_id in queue`` is O(1).
+    Putting an id which is already queued never adds a second entry: the
+    highest priority (the lowest number) wins, lowering the priority of a
+    queued id is done in place (decrease-key).
+    """
+
+    def copy(self):
+        return type(self)(self.maxsize, [tuple(entry[:2]) for entry in
+                                         self.entries.values()])
+
+    def _init(self, maxsize, items=None):
+        self.queue = []
+        self.entries = {}
+        for item in items or []:
+            self._put(item)
+
+    def _put(self, item):
+        priority, item_id = item
+        entry = self.entries.get(item_id)
+        if entry is not None:
+            if entry[0] <= priority:
+                return
+            # Lazy deletion, stale entry is dropped when it reaches the top
+            entry[-1] = REMOVED
+        entry = [priority, item_id, ACTIVE]
+        self.entries[item_id] = entry
+        heapq.heappush(self.queue, entry)
+        if len(self.queue) > 2 * len(self.entries) + 100:
+            self._compact()
+
+    def _compact(self):
+        self.queue = [entry for entry in self.queue if entry[-1] is ACTIVE]
+        heapq.heapify(self.queue)
+
+    def _drop_removed(self):
+        while self.queue and self.queue[0][-1] is REMOVED:
+            heapq.heappop(self.queue)
+
+    def _get(self):
+        self._drop_removed()
+        priority, item_id, _ = heapq.heappop(self.queue)
+        del self.entries[item_id]
+        self._drop_removed()
+        return priority, item_id
+
+    def _peek(self):
+        self._drop_removed()
+        return tuple(self.queue[0][:2])
+
+    def qsize(self):
+        return len(self.entries)
+
+    def put(self, item, block=True, timeout=None):
+        if item[1] in self.entries:
+            # Already queued, doesn't take a free slot
+            self._put(item)
+            return
+        super(IndexedPriorityQueue, self).put(item, block=block,
+                                              timeout=timeout)
+
+    def __contains__(self, item_id):
+        return item_id in self.entries
+
+    def priority(self, item_id):
+        return self.entries[item_id][0]
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+from gevent import monkey
+monkey.patch_all()
+
+import logging
+from time import time
+from gevent import sleep
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket(object):
+
+    """Token bucket refilled with ``rate`` tokens per second.
+
+    ``acquire`` takes a token in advance and sleeps off the deficit, so
+    concurrent greenlets queue up at ``rate`` without a dispatcher.
+
+    >>> bucket = TokenBucket(rate=10, burst=2)
+    >>> bucket.acquire(now=100, wait=False)
+    0
+    >>> bucket.acquire(now=100, wait=False)
+    0
+    >>> round(bucket.acquire(now=100, wait=False), 3)
+    0.1
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time()
+        self.paused_until = 0
+
+    def refill(self, now):
+        elapsed = now - max(self.updated, self.paused_until)
+        if elapsed > 0:
+            self.tokens = min(self.tokens + elapsed * self.rate, self.burst)
+        self.updated = max(now, self.updated)
+
+    def set_rate(self, rate, now=None):
+        self.refill(time() if now is None else now)
+        self.rate = float(rate)
+
+    def pause(self, seconds, now=None):
+        """Give no tokens for seconds, e.g. after ``Retry-After``."""
+        now = time() if now is None else now
+        self.refill(now)
+        self.paused_until = max(self.paused_until, now + seconds)
+        self.tokens = min(self.tokens, 0)
+
+    def acquire(self, now=None, wait=True):
+        """Take a token, return seconds waited for it."""
+        now = time() if now is None else now
+        self.refill(now)
+        self.tokens -= 1
+        delay = max(self.paused_until - now, 0)
+        if self.tokens < 0:
+            delay += -self.tokens / self.rate
+        if delay > 0 and wait:
+            sleep(delay)
+        return delay
+
+
+class AIMDRateController(object):
+
+    """Shared request rate of all api clients.
+
+    The rate grows by ``increase`` requests per second for every
+    ``interval`` without congestion in which requests waited for tokens, so
+    it doesn't drift above demand, and is multiplied by ``decrease`` on a
+    429 or on a request slower than ``latency_threshold``. Decreases are
+    applied once per ``interval`` too, so a burst of 429s from requests
+    already in flight cuts the rate only once.
+    """
+
+    def __init__(self, rate=10, min_rate=1, max_rate=100, increase=1,
+                 decrease=0.5, latency_threshold=None, interval=1, burst=1):
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_threshold = latency_threshold
+        self.interval = interval
+        self.bucket = TokenBucket(min(max(rate, min_rate), max_rate), burst)
+        self.last_increase = 0
+        self.last_decrease = 0
+        self.throttled = 0
+        # Requests waited for tokens since the last increase
+        self.limited = False
+
+    @property
+    def rate(self):
+        return self.bucket.rate
+
+    def acquire(self, now=None, wait=True):
+        delay = self.bucket.acquire(now, wait=False)
+        if self.bucket.tokens < 0:
+            self.limited = True
+        if delay > 0 and wait:
+            sleep(delay)
+        return delay
+
+    def on_success(self, duration, now=None):
+        now = time() if now is None else now
+        if self.latency_threshold and duration > self.latency_threshold:
+            self._decrease(now)
+        elif self.limited and now - max(self.last_increase,
+                                        self.last_decrease) >= self.interval:
+            self.last_increase = now
+            self.limited = False
+            self.bucket.set_rate(min(self.rate + self.increase,
+                                     self.max_rate), now)
+
+    def on_throttle(self, retry_after=0, now=None):
+        now = time() if now is None else now
+        self.throttled += 1
+        if retry_after:
+            self.bucket.pause(retry_after, now)
+        self._decrease(now)
+
+    def _decrease(self, now):
+        if now - self.last_decrease < self.interval:
+            return
+        self.last_decrease = now
+        rate = max(self.rate * self.decrease, self.min_rate)
+        self.bucket.set_rate(rate, now)
+        logger.info('Decrease API requests rate to {} per sec.'.format(
+            round(rate, 2)), extra={'MESSAGE_ID': 'rate_decreased',
+                                    'API_RATE_LIMIT': rate})
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+import re
+from json import JSONDecoder, dumps
+from weakref import WeakKeyDictionary
+from couchdb.http import ResourceConflict, Session
+
+# JSON strings and brackets, everything else is skipped by the regex engine
+TOKEN = re.compile(r'"(?:[^"\\]|\\.)*"|[{}\[\]]')
+STRING_VALUE = re.compile(r'\s*:\s*"((?:[^"\\]|\\.)*)"')
+OBJECT_VALUE = re.compile(r'\s*:\s*\{')
+DATA_ENVELOPE = re.compile(r'\s*\{\s*"data"\s*:\s*\{')
+RAW_FIELDS = ('id', 'dateModified')
+DECODER = JSONDecoder()
+NO_RETRY_SESSIONS = WeakKeyDictionary()
+
+
+def scan_object(body, start=0, fields=(), objects=()):
+    """Scan the JSON object starting at ``body[start]`` without decoding it.
+
+    Returns the end of the object, raw values of its top level string
+    ``fields`` and ``(start, end)`` spans of its top level ``objects``.
+
+    >>> end, values = scan_object('{"a": {"id": "x"}, "id": "y", "b": ["id"]}',
+    ...                           fields=('id',), objects=('a',))
+    >>> end, values['id'], values['a']
+    (42, 'y', (6, 17))
+    """
+    values = {}
+    depth = 0
+    object_key = object_start = None
+    for match in TOKEN.finditer(body, start):
+        token = match.group()
+        if token[0] == '"':
+            if depth != 1:
+                continue
+            key = token[1:-1]
+            if key in fields:
+                value = STRING_VALUE.match(body, match.end())
+                if value is not None:
+                    values[key] = value.group(1)
+            elif key in objects:
+                value = OBJECT_VALUE.match(body, match.end())
+                if value is not None:
+                    object_key = key
+                    object_start = value.end() - 1
+        elif token in ('{', '['):
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return match.end(), values
+            if depth == 1 and object_key is not None:
+                values[object_key] = (object_start, match.end())
+                object_key = None
+    raise ValueError('Unterminated JSON object')
+
+
+class RawDoc(dict):
+
+    """Document kept as the raw JSON bytes received from the API.
+
+    Only ``id`` and ``dateModified`` are extracted. Items set on the doc
+    (``_id``, ``_rev``, ``doc_type``) are spliced into the body when it is
+    dumped, the rest of the body is written as is.
+    """
+
+    def __init__(self, body, **fields):
+        super(RawDoc, self).__init__(**fields)
+        self.body = body
+
+    @classmethod
+    def from_doc(cls, doc):
+        """Serialize a decoded doc once, so it's kept and written as
+        bytes.
+
+        >>> RawDoc.from_doc({'id': 'a', 'dateModified': 'b'}).body
+        '{"dateModified": "b", "id": "a"}'
+        """
+        return cls(dumps(doc, sort_keys=True), id=doc['id'],
+                   dateModified=doc['dateModified'])
+
+    @classmethod
+    def from_response(cls, content):
+        """Build RawDoc from the ``{"data": {...}}`` API response.
+
+        The doc is decoded by the C decoder, which also gives the end of
+        its body, only to take ``id`` and ``dateModified``; the envelope is
+        scanned only if ``data`` isn't its first key.
+
+        >>> doc = RawDoc.from_response('{"data": {"id": "a", "x": [1]}}')
+        >>> doc.body, doc['id']
+        ('{"id": "a", "x": [1]}', 'a')
+        """
+        envelope = DATA_ENVELOPE.match(content)
+        if envelope is not None:
+            start = envelope.end() - 1
+        else:
+            _, values = scan_object(content, content.index('{'),
+                                    objects=('data',))
+            start = values['data'][0]
+        data, end = DECODER.raw_decode(content, start)
+        fields = dict((key, data[key].encode('utf-8')) for key in RAW_FIELDS
+                      if key in data)
+        return cls(content[start:end], **fields)
+
+    def dumps(self):
+        spliced = ','.join('{}:{}'.format(dumps(key), dumps(value))
+                           for key, value in self.items()
+                           if key not in RAW_FIELDS)
+        rest = self.body[1:]
+        if not spliced:
+            return self.body
+        if rest.lstrip().startswith('}'):
+            return '{' + spliced + rest
+        return '{' + spliced + ',' + rest
+
+
+def doc_size(doc):
+    """Serialized size of a RawDoc body, 0 for decoded docs."""
+    return len(doc.body) if isinstance(doc, RawDoc) else 0
+
+
+class BulkDocsBody(object):
+
+    """File-like ``_bulk_docs`` body which dumps docs as it is read.
+
+    couchdb-python sends file-like bodies with chunked transfer encoding,
+    so only one chunk of the request is in memory at a time. A read
+    returns whole docs and may exceed ``size`` by one doc. Decoded docs
+    are dumped as JSON.
+
+    >>> body = BulkDocsBody([RawDoc('{"id": "a"}'), RawDoc('{"id": "b"}')])
+    >>> body.read(1), body.read(), body.read()
+    ('{"docs":[', '{"id": "a"},{"id": "b"}]}', '')
+    >>> BulkDocsBody([{'id': 'c'}], new_edits=False).read()
+    '{"new_edits":false,"docs":[{"id": "c"}]}'
+    """
+
+    def __init__(self, documents, new_edits=True):
+        self.parts = self.dump_parts(documents, new_edits)
+        self.size = 0
+
+    @staticmethod
+    def dump_parts(documents, new_edits=True):
+        yield '{"docs":[' if new_edits else '{"new_edits":false,"docs":['
+        separator = ''
+        for doc in documents:
+            yield separator + (doc.dumps() if isinstance(doc, RawDoc)
+                               else dumps(doc))
+            separator = ','
+        yield ']}'
+
+    def read(self, size=-1):
+        chunks = []
+        length = 0
+        for part in self.parts:
+            chunks.append(part)
+            length += len(part)
+            if 0 <= size <= length:
+                break
+        self.size += length
+        return ''.join(chunks)
+
+
+def post_bulk_docs(db, body):
+    """POST a streamed ``_bulk_docs`` body, return the results.
+
+    couchdb-python resends a request with the same body object on socket
+    errors, a streamed body can only be read once, so the request goes
+    through a session of the db which doesn't retry; the bridge retries
+    failed bulks itself.
+    """
+    session = db.resource.session
+    no_retry = NO_RETRY_SESSIONS.get(session)
+    if no_retry is None:
+        no_retry = NO_RETRY_SESSIONS[session] = Session(
+            timeout=session._timeout, retry_delays=[])
+    resource = db.resource('_bulk_docs')
+    resource.session = no_retry
+    _, _, data = resource.post_json(
+        body=body, headers={'Content-Type': 'application/json'})
+    return data
+
+
+def update_raw(db, documents):
+    """``Database.update`` for RawDoc, streaming the raw bodies."""
+    data = post_bulk_docs(db, BulkDocsBody(documents))
+    results = []
+    for result in data:
+        if 'error' in result:
+            if result['error'] == 'conflict':
+                exc_type = ResourceConflict
+            else:
+                exc_type = Exception
+            results.append((False, result['id'],
+                            exc_type(result['reason'])))
+        else:
+            results.append((True, result['id'], result['rev']))
+    return results
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+from gevent import monkey
+monkey.patch_all()
+
+import logging
+from collections import deque
+from time import time
+from gevent import sleep
+from gevent.event import Event
+from openprocurement_client.api_base_client import APITemplateClient
+from openprocurement_client.client import TendersClient as APIClient
+from requests import Response
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from openprocurement.edge.capture import parse_url
+from openprocurement.edge.databridge import EdgeDataBridge
+
+logger = logging.getLogger(__name__)
+
+REASONS = {200: 'OK', 304: 'Not Modified', 404: 'Not Found', 410: 'Gone',
+           429: 'Too Many Requests'}
+
+
+class ReplayClock(object):
+
+    """Capture time to wall time at ``speed``, 0 is max speed."""
+
+    def __init__(self, start, speed=1):
+        self.start = start
+        self.speed = speed
+        self.wall_start = time()
+
+    def wait(self, t):
+        if self.speed > 0:
+            sleep(max((t - self.start) / self.speed -
+                      (time() - self.wall_start), 0))
+
+    def latency(self, duration):
+        if self.speed > 0:
+            sleep(duration / self.speed)
+
+
+class ReplayFeeder(object):
+
+    """Feeds captured pages in their order and pace instead of the API.
+
+    After the last page the feed stays idle like a live feed without
+    changes, ``finished`` is set then.
+    """
+
+    def __init__(self, capture, clock):
+        self.capture = capture
+        self.clock = clock
+        self.finished = Event()
+
+    def get_resource_items(self):
+        for t, priority, data in self.capture.pages:
+            self.clock.wait(t)
+            for item in data:
+                yield priority, item
+        if not self.finished.is_set():
+            logger.info('Replayed {} feed pages of {}'.format(
+                len(self.capture.pages), self.capture.resource),
+                extra={'MESSAGE_ID': 'replay_finished'})
+            self.finished.set()
+        Event().wait()
+
+    def save_checkpoint(self):
+        return False
+
+
+class ReplayAdapter(BaseAdapter):
+
+    """Transport adapter answering item requests from a capture.
+
+    Responses of an id are served in the captured order, the last one is
+    repeated. If-None-Match of the current ETag gets 304.
+    """
+
+    def __init__(self, capture, clock):
+        super(ReplayAdapter, self).__init__()
+        self.items = dict((item_id, deque(responses)) for item_id, responses
+                          in capture.items.items())
+        self.clock = clock
+
+    def next_response(self, item_id):
+        responses = self.items.get(item_id)
+        if not responses:
+            return None
+        if len(responses) > 1:
+            return responses.popleft()
+        return responses[0]
+
+    def send(self, request, **kwargs):
+        resource, item_id, query = parse_url(request.url)
+        status, headers, body = 200, {}, ''
+        if item_id is not None:
+            status, headers, body = 404, {}, ''
+            captured = self.next_response(item_id)
+            if captured is not None:
+                header, body = captured
+                status, headers = header['status'], header['headers']
+                self.clock.latency(header['duration'])
+            etag = headers.get('ETag')
+            if (status == 200 and etag and
+                    request.headers.get('If-None-Match') == etag):
+                status, body = 304, ''
+        response = Response()
+        response.status_code = status
+        response.reason = REASONS.get(status, '')
+        response.headers = CaseInsensitiveDict(headers)
+        response._content = body
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def close(self):
+        pass
+
+
+class ReplayClient(APIClient):
+
+    """API client on a replay adapter."""
+
+    def __init__(self, adapter, resource, host_url, api_version,
+                 user_agent=None):
+        # The spore request of APIBaseClient is skipped, there is no API
+        APITemplateClient.__init__(self, login_pass=('', ''),
+                                   headers=self.headers,
+                                   user_agent=user_agent)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.ds_client = None
+        self.host_url = host_url
+        self.api_version = api_version
+        self.params = {'mode': '_all_'}
+        self.prefix_path = '{}/api/{}/{}'.format(host_url, api_version,
+                                                 resource)
+
+
+class ReplayEdgeDataBridge(EdgeDataBridge):
+
+    """Edge Bridge fed by a capture instead of the API.
+
+    Captured pages go through ``fill_input_queue`` and item responses
+    through the workers at the captured pace times ``speed`` or as fast as
+    possible with ``speed`` 0, so the queues, filter and bulk saving run
+    on production shaped load without network.
+    """
+
+    def __init__(self, config, capture, speed=1):
+        self.source = capture
+        self.clock = ReplayClock(capture.start(), speed)
+        self.adapter = ReplayAdapter(capture, self.clock)
+        super(ReplayEdgeDataBridge, self).__init__(config)
+        self.feeder = ReplayFeeder(capture, self.clock)
+
+    def create_capture(self, name=None):
+        return None
+
+    def new_api_client(self, user_agent):
+        return ReplayClient(self.adapter, self.workers_config['resource'],
+                            self.api_host, self.api_version, user_agent)
+
+    def start_sync(self):
+        # The replay runs from the moment of the start
+        self.clock.wall_start = time()
+        super(ReplayEdgeDataBridge, self).start_sync()
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+from gevent import monkey
+monkey.patch_all()
+
+import heapq
+import logging
+from email.utils import parsedate_tz, mktime_tz
+from itertools import count
+from random import random
+from time import time
+from gevent import Greenlet
+from gevent.event import Event
+
+logger = logging.getLogger(__name__)
+
+
+def retry_delay(retries_count, base, max_delay, jitter=0):
+    """Exponential backoff, ``jitter`` is a fraction cut off at random.
+
+    >>> retry_delay(0, 3, 300)
+    0
+    >>> retry_delay(4, 3, 300)
+    24
+    >>> retry_delay(20, 3, 300)
+    300
+    >>> 6 <= retry_delay(3, 3, 300, 0.5) <= 12
+    True
+    """
+    if retries_count <= 0:
+        return 0
+    delay = min(base * 2 ** (retries_count - 1), max_delay)
+    return delay * (1 - jitter * random()) if jitter else delay
+
+
+def parse_retry_after(response):
+    """Seconds to wait from the ``Retry-After`` header of response.
+
+    >>> from munch import munchify
+    >>> parse_retry_after(munchify({'headers': {'Retry-After': '7'}}))
+    7.0
+    >>> parse_retry_after(munchify({'headers': {}}))
+    0
+    >>> parse_retry_after(None)
+    0
+    """
+    headers = getattr(response, 'headers', None) or {}
+    value = headers.get('Retry-After')
+    if not value:
+        return 0
+    try:
+        return max(float(value), 0)
+    except (TypeError, ValueError):
+        date = parsedate_tz(value)
+        if date is None:
+            return 0
+        return max(mktime_tz(date) - time(), 0)
+
+
+class RetryScheduler(Greenlet):
+
+    """Releases delayed retries into the retry queue when they are due.
+
+    Pending items are kept in a heap keyed on due time and served by one
+    greenlet, so workers hand a failed item over and continue immediately.
+    """
+
+    def __init__(self, queue):
+        Greenlet.__init__(self)
+        self.queue = queue
+        self.heap = []
+        self.counter = count()
+        self.wakeup = Event()
+        self.exit = False
+
+    def schedule(self, item, delay=0):
+        if delay <= 0:
+            self.queue.put(item)
+            return
+        heapq.heappush(self.heap, (time() + delay, next(self.counter), item))
+        self.wakeup.set()
+        if not self.started:
+            self.start()
+
+    def pending(self):
+        return len(self.heap)
+
+    def release_due(self):
+        now = time()
+        while self.heap and self.heap[0][0] <= now:
+            self.queue.put(heapq.heappop(self.heap)[2])
+
+    def _run(self):
+        while not self.exit:
+            self.wakeup.clear()
+            self.release_due()
+            timeout = (max(self.heap[0][0] - time(), 0) if self.heap
+                       else None)
+            self.wakeup.wait(timeout)
+
+    def shutdown(self):
+        self.exit = True
+        self.wakeup.set()
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import logging
+from couchdb.http import ResourceConflict
+from openprocurement.edge.cache import fingerprint
+from openprocurement.edge.design import conflicts_by_doc_type_view
+from openprocurement.edge.index import date_to_microseconds
+from openprocurement.edge.raw import BulkDocsBody, post_bulk_docs
+
+logger = logging.getLogger(__name__)
+
+CONFLICTS_VIEW = '_design/{}/_view/{}'.format(
+    conflicts_by_doc_type_view.design, conflicts_by_doc_type_view.name)
+
+
+def deterministic_rev(doc, stored_rev=None):
+    """Revision derived from the doc itself instead of the stored one.
+
+    The id is a hash of dateModified and the content fingerprint, so the
+    same version is written with the same revision every time. A new doc
+    gets dateModified in microseconds as the position, so of conflicting
+    revisions of one doc the newest dateModified always wins; an update of
+    ``stored_rev`` gets the next position, extending its branch.
+
+    >>> doc = {'id': 'a', 'dateModified': '1970-01-01T00:00:01+00:00'}
+    >>> deterministic_rev(doc) == deterministic_rev(dict(doc, _rev='1-b'))
+    True
+    >>> deterministic_rev(doc)[:8]
+    '1000000-'
+    >>> deterministic_rev(doc, '3-b')[:2]
+    '4-'
+    >>> rev = deterministic_rev(doc)
+    >>> deterministic_rev(doc, rev) == rev
+    True
+    """
+    digest = hashlib.md5(fingerprint(doc))
+    digest.update(doc['dateModified'])
+    rev_id = digest.hexdigest()
+    if stored_rev is None:
+        return '{}-{}'.format(date_to_microseconds(doc['dateModified']),
+                              rev_id)
+    position, stored_id = stored_rev.split('-', 1)
+    if stored_id == rev_id:
+        return stored_rev  # The version is stored already
+    return '{}-{}'.format(int(position) + 1, rev_id)
+
+
+def update_deterministic(db, documents, stored_revs=None):
+    """``Database.update`` with deterministic revisions and
+    ``new_edits=false``.
+
+    Docs are written as is, an already stored revision is a no-op. A doc
+    whose stored revision is in ``stored_revs`` is written as its child
+    with ``_revisions``, otherwise as a new root, which conflicts with a
+    stored one until ``prune_conflicts``. couchdb only returns errors for
+    ``new_edits=false``, every other doc is saved with its revision.
+    """
+    stored_revs = stored_revs or {}
+    revs = {}
+    for doc in documents:
+        stored_rev = stored_revs.get(doc['id'])
+        doc.pop('_revisions', None)
+        doc['_rev'] = revs[doc['id']] = deterministic_rev(doc, stored_rev)
+        if stored_rev is not None and doc['_rev'] != stored_rev:
+            position, rev_id = doc['_rev'].split('-', 1)
+            doc['_revisions'] = {'start': int(position),
+                                 'ids': [rev_id, stored_rev.split('-', 1)[1]]}
+    data = post_bulk_docs(db, BulkDocsBody(documents, new_edits=False))
+    errors = {}
+    for result in data:
+        if 'error' in result:
+            if result['error'] == 'conflict':
+                exc_type = ResourceConflict
+            else:
+                exc_type = Exception
+            errors[result['id']] = exc_type(result['reason'])
+    return [(False, doc['id'], errors[doc['id']]) if doc['id'] in errors
+            else (True, doc['id'], revs[doc['id']]) for doc in documents]
+
+
+def prune_conflicts(db, doc_type, limit=1000):
+    """Delete losing revisions of conflicting docs of ``doc_type``.
+
+    Only the winning revision, the one with the newest dateModified for
+    deterministic revisions, is kept. Returns the number of deleted
+    revisions.
+    """
+    tombstones = []
+    for row in db.view(CONFLICTS_VIEW, key=doc_type, limit=limit):
+        tombstones.extend({'_id': row.id, '_rev': rev, '_deleted': True}
+                          for rev in row.value[1:])
+    pruned = 0
+    if tombstones:
+        for success, doc_id, rev_or_exc in db.update(tombstones):
+            if success:
+                pruned += 1
+            else:
+                # Pruned concurrently, e.g. by a bridge of another process
+                logger.warning('Failed to prune conflict of {}: {}'.format(
+                    doc_id, repr(rev_or_exc)),
+                    extra={'MESSAGE_ID': 'prune_conflicts'})
+    return pruned
@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+from gevent import monkey
+monkey.patch_all()
+
+import logging
+import os
+import socket
+import sys
+import gevent
+from time import time
+from zlib import crc32
+from gevent import fork, spawn, sleep
+from gevent.lock import Semaphore
+from .databridge import EdgeDataBridge
+from .metrics import QUEUE_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class ShardConnection(object):
+
+    """Line based channel between the coordinator and a shard process.
+
+    The coordinator sends ``priority item_id`` lines, the shard answers
+    with ``item_id dateModified`` lines for every saved document.
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.reader = sock.makefile('rb')
+        self.lock = Semaphore()
+
+    def send(self, *fields):
+        with self.lock:
+            self.sock.sendall(' '.join(fields) + '\n')
+
+    def __iter__(self):
+        for line in self.reader:
+            yield line.split()
+
+    def shutdown(self):
+        """Tell the other side that nothing more will be sent."""
+        try:
+            self.sock.shutdown(socket.SHUT_WR)
+        except socket.error:
+            pass  # The other side is gone already
+
+    def close(self):
+        self.reader.close()
+        self.sock.close()
+
+
+class ShardRouter(object):
+
+    """Replaces resource_items_queue of the coordinator.
+
+    Ids are routed by hash to shard processes, deduplication and priorities
+    are handled by the IndexedPriorityQueue of every shard.
+    """
+
+    def __init__(self, connections):
+        self.connections = connections
+
+    def shard_for(self, item_id):
+        return (crc32(item_id) & 0xffffffff) % len(self.connections)
+
+    def put(self, item, block=True, timeout=None):
+        priority, item_id = item
+        self.connections[self.shard_for(item_id)].send(str(priority), item_id)
+
+    def __contains__(self, item_id):
+        return False
+
+
+class RemoteDateModifiedIndex(object):
+
+    """Forwards dateModified of saved docs to the coordinator index."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def set(self, item_id, date_modified):
+        self.connection.send(item_id, date_modified)
+
+
+class RemoteJournal(object):
+
+    """Forwards done ids of a shard to the coordinator journal.
+
+    Retries of a shard aren't journaled, the coordinator keeps the id
+    pending until it's discarded.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def add(self, item_id, priority, date_modified=None):
+        pass
+
+    def discard(self, item_id, date_modified=None):
+        self.connection.send(item_id, date_modified or '-')
+
+
+class ShardEdgeDataBridge(EdgeDataBridge):
+
+    """Bridge of a shard process: workers and bulk writers, no feeder."""
+
+    def __init__(self, config, connection, shard=0, shards=1):
+        self.shard = shard
+        self.shards = shards
+        super(ShardEdgeDataBridge, self).__init__(config)
+        self.connection = connection
+        if self.metrics_port:
+            # Coordinator listens metrics_port, shards the next ports
+            self.metrics_port += shard + 1
+        if self.journal_dir:
+            # Saved docs update the coordinator index by journal discards
+            self.journal = RemoteJournal(connection)
+            self.date_modified_index = None
+        elif self.date_modified_index is not None:
+            self.date_modified_index = RemoteDateModifiedIndex(connection)
+        self.bulk_writer.date_modified_index = self.date_modified_index
+        self.bulk_writer.journal = self.journal
+
+    def create_journal(self):
+        return None  # The coordinator journals
+
+    def create_checkpoint(self):
+        return None  # The coordinator owns the feed
+
+    def create_rate_controller(self):
+        # Every shard gets its part of the rate limit of the bridge
+        return super(ShardEdgeDataBridge, self).create_rate_controller(
+            self.shards)
+
+    def journal_watcher(self):
+        pass
+
+    def conflicts_watcher(self):
+        pass  # The coordinator prunes conflicts of all shards
+
+    def create_capture(self):
+        # Shards write own files of item responses, replay merges them
+        return super(ShardEdgeDataBridge, self).create_capture(
+            '{}.{}'.format(self.workers_config['resource'], self.shard))
+
+    def read_items(self):
+        for priority, item_id in self.connection:
+            self.resource_items_queue.put((int(priority), item_id))
+
+    def start_sync(self):
+        self.bulk_writer.start()
+        self.filler = spawn(self.read_items)
+
+    def fillers_watcher(self):
+        if self.filler.ready():
+            # The coordinator drains or is gone, fetched docs are saved
+            # before exit anyway
+            logger.warning('Shard: connection to coordinator is closed.',
+                           extra={'MESSAGE_ID': 'shard_exit'})
+            self.stop()
+
+    def persist(self):
+        # The coordinator owns checkpoints and journal
+        if self.capture is not None:
+            self.capture.flush()
+
+
+class ShardCoordinator(EdgeDataBridge):
+
+    """Bridge of the main process: feeder and bulk checks only."""
+
+    def __init__(self, config, connections, shard_pids):
+        super(ShardCoordinator, self).__init__(config)
+        self.connections = connections
+        self.shard_pids = shard_pids
+        self.resource_items_queue = ShardRouter(connections)
+        self.saved_readers = []
+
+    def read_saved(self, connection):
+        for item_id, date_modified in connection:
+            if date_modified == '-':
+                date_modified = None
+            if (self.date_modified_index is not None and
+                    date_modified is not None):
+                self.date_modified_index.set(item_id, date_modified)
+            if self.journal is not None:
+                self.journal.discard(item_id, date_modified)
+
+    def start_sync(self):
+        super(ShardCoordinator, self).start_sync()
+        if self.date_modified_index is not None or self.journal is not None:
+            self.saved_readers = [spawn(self.read_saved, connection)
+                                  for connection in self.connections]
+
+    def register_metrics(self):
+        QUEUE_SIZE.labels(self.workers_config['resource'], 'input')\
+            .set_function(self.input_queue.qsize)
+
+    def wait_shards(self, deadline):
+        pids = set(self.shard_pids)
+        while pids and time() < deadline:
+            pids = set(pid for pid in pids
+                       if os.waitpid(pid, os.WNOHANG) == (0, 0))
+            if pids:
+                sleep(0.1)
+        return not pids
+
+    def drain(self):
+        """Stop the feed, let shards drain and save their docs, then
+        save checkpoints and journal with the ids shards reported."""
+        deadline = time() + self.drain_timeout
+        logger.info('Drain coordinator within {} sec.'.format(
+            self.drain_timeout), extra={'MESSAGE_ID': 'edge_bridge_drain'})
+        self.stop_intake()
+        for connection in self.connections:
+            connection.shutdown()
+        drained = self.wait_shards(deadline)
+        gevent.joinall(self.saved_readers,
+                       timeout=max(deadline - time(), 0))
+        self.persist()
+        if not drained:
+            logger.error('Drain of shards timed out',
+                         extra={'MESSAGE_ID': 'edge_bridge_drain'})
+        return drained
+
+    def shards_watcher(self):
+        for pid in self.shard_pids:
+            if os.waitpid(pid, os.WNOHANG) != (0, 0):
+                logger.critical('Coordinator: shard process {} '
+                                'exited.'.format(pid),
+                                extra={'MESSAGE_ID': 'shard_exit'})
+                sys.exit(1)
+
+    def gevent_watcher(self):
+        self.feeder.save_checkpoint()
+        self.save_backfill_checkpoint()
+        self.fillers_watcher()
+        self.journal_watcher()
+        self.conflicts_watcher()
+        self.shards_watcher()
+
+    def run(self):
+        logger.info('Start Edge Bridge coordinator with {} shards'.format(
+            len(self.connections)),
+            extra={'MESSAGE_ID': 'edge_bridge_start_bridge'})
+        self.handle_signals()
+        self.register_metrics()
+        self.start_metrics_server()
+        self.start_sync()
+        while True:
+            self.gevent_watcher()
+            if self.stopping.wait(self.watch_interval):
+                break
+        self.drain()
+
+
+class ShardedEdgeDataBridge(object):
+
+    """Runs the bridge in ``processes`` processes.
+
+    The coordinator process runs the feeder and the bulk checks and routes
+    item ids by hash to shard processes, each of them running its own
+    ResourceItemWorker pools and bulk writers.
+    """
+
+    def __init__(self, config, processes):
+        self.config = config
+        self.processes = processes
+        self.connections = []
+        self.shard_pids = []
+        self.reset = False
+
+    def fork_shards(self):
+        for shard in xrange(0, self.processes):
+            coordinator_sock, shard_sock = socket.socketpair()
+            pid = fork()
+            if pid == 0:
+                coordinator_sock.close()
+                for connection in self.connections:
+                    connection.close()
+                self.run_shard(shard, ShardConnection(shard_sock))
+                os._exit(0)
+            shard_sock.close()
+            self.connections.append(ShardConnection(coordinator_sock))
+            self.shard_pids.append(pid)
+
+    def run_shard(self, shard, connection):
+        logger.info('Start Edge Bridge shard {}'.format(shard),
+                    extra={'MESSAGE_ID': 'edge_bridge_start_shard'})
+        ShardEdgeDataBridge(self.config, connection, shard,
+                            self.processes).run()
+
+    def reset_checkpoint(self):
+        self.reset = True
+
+    def run(self):
+        self.fork_shards()
+        coordinator = ShardCoordinator(self.config, self.connections,
+                                       self.shard_pids)
+        if self.reset:
+            coordinator.reset_checkpoint()
+        coordinator.run()
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+import unittest
+from openprocurement.edge.autoscale import WorkerAutoscaler
+
+
+class TestWorkerAutoscaler(unittest.TestCase):
+
+    def climb(self, autoscaler, curve, workers, steps):
+        history = []
+        for i in xrange(0, steps):
+            workers = autoscaler.update(workers, curve(workers), 0.1, 0, 100)
+            history.append(workers)
+        return history
+
+    def test_settles_at_knee(self):
+        # Throughput grows up to 5 workers and degrades after 8
+        curve = lambda w: min(w, 5) * 10 - max(w - 8, 0) * 5
+        autoscaler = WorkerAutoscaler(1, 20)
+        history = self.climb(autoscaler, curve, 1, 30)
+        self.assertEqual(history[:5], [2, 3, 4, 5, 6])
+        self.assertTrue(all(4 <= w <= 6 for w in history[5:]))
+
+    def test_constant_load_is_stable(self):
+        curve = lambda w: min(w, 5) * 10
+        autoscaler = WorkerAutoscaler(1, 20, cooldown=10)
+        history = self.climb(autoscaler, curve, 1, 30)
+        self.assertEqual(history[:8], [2, 3, 4, 5, 6, 5, 4, 5])
+        # Held for the cooldown, then probed once more
+        self.assertEqual(history[8:17], [5] * 9)
+        self.assertEqual(history[17:21], [6, 5, 4, 5])
+        self.assertEqual(history[21:30], [5] * 9)
+
+    def test_hold_ends_on_load_change(self):
+        autoscaler = WorkerAutoscaler(1, 20, cooldown=10)
+        self.assertEqual(autoscaler.update(5, 50, 0.1, 0, 100), 6)
+        self.assertEqual(autoscaler.update(6, 40, 0.1, 0, 100), 5)
+        self.assertEqual(autoscaler.update(5, 50, 0.1, 0, 100), 5)
+        # Noise within tolerance keeps the count
+        self.assertEqual(autoscaler.update(5, 51, 0.1, 0, 100), 5)
+        self.assertEqual(autoscaler.update(5, 49, 0.1, 0, 100), 5)
+        # Throughput grows, so more workers are tried
+        self.assertEqual(autoscaler.update(5, 60, 0.1, 0, 100), 6)
+        self.assertEqual(autoscaler.update(6, 70, 0.1, 0, 100), 7)
+
+    def test_bounds(self):
+        autoscaler = WorkerAutoscaler(1, 3)
+        history = self.climb(autoscaler, lambda w: w * 10, 1, 6)
+        self.assertEqual(max(history), 3)
+        self.assertEqual(min(history), 2)
+
+    def test_throttled(self):
+        autoscaler = WorkerAutoscaler(1, 10)
+        self.assertEqual(autoscaler.update(4, 40, 0.1, 3, 100), 3)
+        # More throughput with less workers keeps removing them
+        self.assertEqual(autoscaler.update(3, 45, 0.1, 0, 100), 2)
+
+    def test_latency(self):
+        autoscaler = WorkerAutoscaler(1, 10)
+        self.assertEqual(autoscaler.update(4, 40, 0.1, 0, 100), 5)
+        self.assertEqual(autoscaler.update(5, 50, 0.3, 0, 100), 4)
+
+    def test_no_backlog(self):
+        autoscaler = WorkerAutoscaler(2, 10)
+        self.assertEqual(autoscaler.update(4, 40, 0.1, 0, 0), 3)
+        self.assertEqual(autoscaler.update(3, 30, 0.1, 0, 0), 2)
+        self.assertEqual(autoscaler.update(2, 20, 0.1, 0, 0), 2)
+        # Backlog is back
+        self.assertEqual(autoscaler.update(2, 20, 0.1, 0, 50), 3)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestWorkerAutoscaler))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
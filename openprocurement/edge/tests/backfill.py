@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+import unittest
+from mock import MagicMock, patch
+from munch import munchify
+from openprocurement.edge.backfill import (
+    BACKFILL_PRIORITY,
+    BackfillFeeder,
+    split_date_ranges
+)
+
+
+def page(offset, *dates):
+    return munchify({
+        'data': [{'id': date, 'dateModified': date} for date in dates],
+        'next_page': {'offset': offset}
+    })
+
+
+class TestBackfillFeeder(unittest.TestCase):
+
+    def setUp(self):
+        self.ranges = split_date_ranges('2017-01-01T00:00:00+02:00',
+                                        '2017-01-03T00:00:00+02:00', 2)
+        self.feeder = BackfillFeeder('http://api', '2.3', 'tenders',
+                                     self.ranges, extra_params={'limit': 2})
+        self.feeder.create_client = MagicMock()
+
+    def test_split_date_ranges(self):
+        ranges = split_date_ranges('2017-01-01T00:00:00+02:00',
+                                   '2017-01-01T01:00:00+02:00', 3)
+        self.assertEqual(ranges[1], ['2017-01-01T00:20:00+02:00',
+                                     '2017-01-01T00:40:00+02:00'])
+        self.assertEqual(ranges[-1][1], '2017-01-01T01:00:00+02:00')
+
+    @patch('openprocurement.edge.backfill.get_response')
+    def test_crawl(self, mocked_get_response):
+        mocked_get_response.side_effect = [
+            page('o1', '2017-01-01T01:00:00+02:00',
+                 '2017-01-01T02:00:00+02:00'),
+            # Newer items belong to the next range
+            page('o2', '2017-01-01T23:00:00+02:00',
+                 '2017-01-02T00:00:00+02:00')
+        ]
+        self.feeder.crawl(0)
+        items = [self.feeder.queue.get() for i in xrange(0, 3)]
+        self.assertEqual([priority for priority, item in items],
+                         [BACKFILL_PRIORITY] * 3)
+        self.assertEqual(items[2][1]['dateModified'],
+                         '2017-01-01T23:00:00+02:00')
+        self.assertEqual(self.feeder.queue.qsize(), 0)
+        self.assertEqual(mocked_get_response.call_args_list[1][0][1],
+                         {'limit': 2, 'offset': 'o1'})
+        self.assertEqual(self.feeder.ranges[0], None)
+        self.assertEqual(self.feeder.get_state(), [self.ranges[1]])
+        self.assertEqual(self.feeder.finished(), False)
+
+    @patch('openprocurement.edge.backfill.get_response')
+    def test_get_resource_items(self, mocked_get_response):
+        responses = {
+            self.ranges[0][0]: page('a', '2017-01-01T01:00:00+02:00',
+                                    '2017-01-01T02:00:00+02:00'),
+            'a': page('a'),
+            self.ranges[1][0]: page('b', '2017-01-02T01:00:00+02:00'),
+            'b': page('b')
+        }
+        mocked_get_response.side_effect = \
+            lambda client, params: responses[params['offset']]
+        items = list(self.feeder.get_resource_items())
+        self.assertEqual(sorted(item['id'] for priority, item in items),
+                         ['2017-01-01T01:00:00+02:00',
+                          '2017-01-01T02:00:00+02:00',
+                          '2017-01-02T01:00:00+02:00'])
+        self.assertEqual(self.feeder.finished(), True)
+
+    @patch('openprocurement.edge.backfill.get_response')
+    def test_resume(self, mocked_get_response):
+        mocked_get_response.side_effect = [page('o3'), Exception('error')]
+        self.feeder.ranges[0][0] = 'o2'
+        with self.assertRaises(Exception):
+            list(self.feeder.get_resource_items())
+        # Failed range keeps its offset for a retry
+        self.assertEqual(self.feeder.get_state(), [self.ranges[1]])
+        self.assertEqual(
+            BackfillFeeder('http://api', '2.3', 'tenders',
+                           self.feeder.get_state()).ranges,
+            [self.ranges[1]])
+
+    @patch('openprocurement.edge.backfill.get_response')
+    def test_checkpoint_state(self, mocked_get_response):
+        mocked_get_response.side_effect = [
+            page('o1', '2017-01-01T01:00:00+02:00',
+                 '2017-01-01T02:00:00+02:00'),
+            page('o1')
+        ]
+        self.feeder.crawl(0)
+        # Range is crawled, but its items aren't handed over yet
+        self.assertEqual(self.feeder.checkpoint_state(), None)
+        items = self.feeder.low_water.iterate(
+            iter([self.feeder.queue.get(), self.feeder.queue.get()]))
+        next(items)
+        next(items)
+        self.assertEqual(self.feeder.checkpoint_state(), None)
+        self.assertEqual(list(items), [])
+        self.assertEqual(self.feeder.checkpoint_state(), [self.ranges[1]])
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestBackfillFeeder))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+import unittest
+import uuid
+from couchdb.client import Row
+from mock import MagicMock
+from openprocurement.edge.cache import (
+    EtagCache,
+    FingerprintCache,
+    RevCache,
+    fingerprint
+)
+from openprocurement.edge.raw import RawDoc
+
+
+class TestRevCache(unittest.TestCase):
+
+    def test_lru(self):
+        cache = RevCache(capacity=2)
+        cache.set('a', '1-a')
+        cache.set('b', '1-b')
+        self.assertEqual(cache.get('a'), '1-a')
+        # 'b' is the least recently used
+        cache.set('c', '1-c')
+        self.assertEqual(len(cache), 2)
+        self.assertNotIn('b', cache)
+        self.assertEqual(cache.get('b'), None)
+        cache.set('a', '2-a')
+        self.assertEqual(cache.get('a'), '2-a')
+        self.assertEqual(cache.pop('a'), '2-a')
+        self.assertNotIn('a', cache)
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+
+    def test_lookup(self):
+        cache = RevCache()
+        cached_id, stored_id, deleted_id, new_id = [uuid.uuid4().hex
+                                                    for i in xrange(0, 4)]
+        cache.set(cached_id, '3-c')
+        db = MagicMock()
+        db.view.return_value = [
+            Row(id=stored_id, key=stored_id, value={'rev': '2-s'}),
+            Row(id=deleted_id, key=deleted_id,
+                value={'rev': '4-d', 'deleted': True}),
+            Row(key=new_id, error='not_found')
+        ]
+        revs = cache.lookup(db, [cached_id, stored_id, deleted_id, new_id])
+        self.assertEqual(revs, {cached_id: '3-c', stored_id: '2-s'})
+        db.view.assert_called_once_with(
+            '_all_docs', keys=[stored_id, deleted_id, new_id])
+        self.assertEqual(cache.get(stored_id), '2-s')
+
+        # Nothing is requested when all revs are cached
+        db.view.reset_mock()
+        self.assertEqual(cache.lookup(db, [cached_id]), {cached_id: '3-c'})
+        self.assertEqual(db.view.called, False)
+
+
+class TestEtagCache(unittest.TestCase):
+
+    def test_stage_commit(self):
+        cache = EtagCache()
+        item_id = uuid.uuid4().hex
+        cache.stage(item_id, '2017-05-02T12:34:56+03:00', 'W/"1"', 100)
+        self.assertNotIn(item_id, cache)
+        # Other version was saved
+        cache.commit(item_id, '2017-05-02T12:35:56+03:00')
+        self.assertNotIn(item_id, cache)
+
+        cache.stage(item_id, '2017-05-02T12:34:56+03:00', 'W/"1"', 100)
+        cache.commit(item_id, '2017-05-02T12:34:56+03:00')
+        self.assertEqual(cache.get(item_id), ('W/"1"', 100))
+        self.assertEqual(len(cache.staged), 0)
+
+        cache.count_not_modified(100)
+        cache.count_not_modified(50)
+        self.assertEqual((cache.not_modified, cache.bytes_saved), (2, 150))
+
+
+class TestFingerprintCache(unittest.TestCase):
+
+    def test_raw_fingerprint(self):
+        body = ('{"id": "a", "dateModified": "%s", "documents": [{"id": "d", '
+                '"dateModified": "%s"}]}')
+        old = RawDoc(body % ('2017-01-01', '2016-01-01'), id='a',
+                     dateModified='2017-01-01')
+        bumped = RawDoc(body % ('2017-01-02', '2016-01-01'), id='a',
+                        dateModified='2017-01-02')
+        bumped['_rev'] = '1-a'
+        self.assertEqual(fingerprint(old), fingerprint(bumped))
+        changed = RawDoc(body % ('2017-01-03', '2017-01-02'), id='a',
+                         dateModified='2017-01-03')
+        self.assertNotEqual(fingerprint(old), fingerprint(changed))
+        # Nested date bumped together with the doc one
+        nested = RawDoc(body % ('2017-01-03', '2017-01-03'), id='a',
+                        dateModified='2017-01-03')
+        both = RawDoc(body % ('2017-01-04', '2017-01-04'), id='a',
+                      dateModified='2017-01-04')
+        self.assertEqual(fingerprint(nested), fingerprint(both))
+
+    def test_decoded_fingerprint(self):
+        # Same normalization as of raw bodies
+        doc = {'id': 'a', 'dateModified': '2017-01-03',
+               'documents': [{'id': 'd', 'dateModified': '2017-01-03'}]}
+        bumped = {'id': 'a', 'dateModified': '2017-01-04', '_rev': '1-a',
+                  'documents': [{'id': 'd', 'dateModified': '2017-01-04'}]}
+        self.assertEqual(fingerprint(doc), fingerprint(bumped))
+        self.assertEqual(fingerprint(doc), fingerprint(RawDoc.from_doc(doc)))
+        changed = dict(bumped, documents=[{'id': 'd',
+                                           'dateModified': '2017-01-03'}])
+        self.assertNotEqual(fingerprint(doc), fingerprint(changed))
+
+    def test_is_unchanged(self):
+        cache = FingerprintCache()
+        digest = fingerprint({'id': 'a', 'title': 'x'})
+        self.assertEqual(cache.is_unchanged('a', digest), False)
+        cache.set('a', digest)
+        self.assertEqual(cache.is_unchanged('a', digest), True)
+        self.assertEqual(cache.is_unchanged(
+            'a', fingerprint({'id': 'a', 'title': 'y'})), False)
+        self.assertEqual(cache.unchanged, 1)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestRevCache))
+    suite.addTest(unittest.makeSuite(TestEtagCache))
+    suite.addTest(unittest.makeSuite(TestFingerprintCache))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+from gevent import monkey
+monkey.patch_all()
+
+import os
+import shutil
+import tempfile
+import unittest
+from gevent.pywsgi import WSGIServer
+from requests import Session
+from openprocurement.edge.capture import Capture, CaptureWriter, read_capture
+from openprocurement.edge.fakeapi import FakeAPI
+
+
+class TestCapture(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'tenders.capture.gz')
+        self.api = FakeAPI(resources=('tenders', 'plans'), docs=3,
+                           doc_size=500, seed=1)
+        self.server = WSGIServer(('127.0.0.1', 0), self.api, log=None)
+        self.server.start()
+        self.url = 'http://127.0.0.1:{}/api/2.3/'.format(
+            self.server.server_port)
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.dir)
+
+    def record(self, *urls):
+        writer = CaptureWriter(self.path)
+        session = Session()
+        writer.mount(session)
+        session.head(self.url + 'spore')
+        for url in urls:
+            session.get(self.url + url)
+        writer.close()
+        return writer
+
+    def test_record(self):
+        item_id = self.api.resources['tenders'].ids[0]
+        writer = self.record('tenders?descending=True',
+                             'tenders/' + item_id, 'tenders/unknown')
+        self.assertEqual(writer.records, 3)
+        records = list(read_capture(self.path))
+        self.assertEqual([header['status'] for header, body in records],
+                         [200, 200, 404])
+        header, body = records[1]
+        self.assertEqual(len(body), 500)
+        self.assertEqual(header['headers']['ETag'], 'W/"1"')
+        self.assertGreaterEqual(header['duration'], 0)
+
+    def test_pages_and_items(self):
+        tenders = self.api.resources['tenders']
+        self.record('tenders?descending=True', 'tenders',
+                    'plans', 'tenders/' + tenders.ids[0],
+                    'tenders/' + tenders.ids[0])
+        # The next run appends
+        self.record('tenders/' + tenders.ids[1])
+        capture = Capture([self.path], 'tenders')
+        self.assertEqual([page[1] for page in capture.pages], [1000, 1])
+        self.assertEqual([item['id'] for item in capture.pages[1][2]],
+                         tenders.ids)
+        self.assertEqual(sorted(capture.items), sorted(tenders.ids[:2]))
+        self.assertEqual(len(capture.items[tenders.ids[0]]), 2)
+        self.assertEqual(capture.expected(), 2)
+        self.assertEqual(capture.start(), capture.pages[0][0])
+
+    def test_truncated(self):
+        self.record('tenders', 'tenders/' + self.api.resources[
+            'tenders'].ids[0])
+        with open(self.path, 'rb') as capture_file:
+            data = capture_file.read()
+        with open(self.path, 'wb') as capture_file:
+            capture_file.write(data[:-20])
+        self.assertEqual(len(list(read_capture(self.path))), 1)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestCapture))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -6,8 +6,11 @@ import unittest
 import datetime
 import os
 import logging
+import shutil
+import tempfile
 import uuid
-from gevent import sleep
+from copy import deepcopy
+from gevent import sleep, spawn
 from gevent.queue import Queue
 from couchdb import Server
 from mock import MagicMock, patch
@@ -15,7 +18,14 @@ from munch import munchify
 from httplib import IncompleteRead
 from openprocurement_client.exceptions import RequestFailed
 from openprocurement.edge.tests.base import TenderBaseWebTest, MockedResponse
-from openprocurement.edge.databridge import EdgeDataBridge
+from openprocurement.edge.databridge import (
+    EdgeDataBridge,
+    MultiResourceEdgeDataBridge
+)
+from openprocurement.edge.cache import fingerprint
+from openprocurement.edge.index import DateModifiedIndex
+from openprocurement.edge.revs import update_deterministic
+from openprocurement.edge.metrics import RollingHistogram
 from openprocurement.edge.utils import (
     DataBridgeConfigError,
     push_views,
@@ -275,6 +285,44 @@ class TestEdgeDataBridge(TenderBaseWebTest):
         self.assertEqual(bridge.input_queue.qsize(), 1)
         self.assertEqual(bridge.input_queue.get(), return_value[0])
 
+    @patch('openprocurement.edge.databridge.BackfillFeeder')
+    def test_fill_input_queue_with_backfill(self, mocked_backfill_feeder):
+        journal_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, journal_dir)
+        self.addCleanup(self.config['main'].pop, 'journal_dir')
+        self.config['main']['journal_dir'] = journal_dir
+        bridge = EdgeDataBridge(self.config)
+        bridge.backfill = True
+        feeder = mocked_backfill_feeder.return_value
+        feeder.live_offset.return_value = 'live'
+        feeder.plan.return_value = [['2017-01-01T00:00:00+02:00',
+                                     '2017-01-02T00:00:00+02:00']]
+        backfill_item = (1000, {'id': uuid.uuid4().hex,
+                                'dateModified': '2017-01-01T12:00:00+02:00'})
+        feeder.get_resource_items.return_value = [backfill_item]
+        feeder.get_state.return_value = []
+        feeder.checkpoint_state.return_value = []
+        live_item = (1, {'id': uuid.uuid4().hex,
+                         'dateModified': '2017-01-03T12:00:00+02:00'})
+        bridge.feeder.get_resource_items = MagicMock(return_value=[live_item])
+
+        bridge.fill_input_queue()
+        self.assertEqual(bridge.input_queue.get(), live_item)
+        self.assertEqual(bridge.input_queue.get(), backfill_item)
+        # Live feed continues from the moment the backfill was planned
+        self.assertEqual(bridge.checkpoint.load(), {
+            'forward_offset': 'live', 'backward_offset': None,
+            'backward_finished': True, 'backfill': []})
+        self.assertEqual(bridge.backfill_feeder, None)
+        self.assertEqual(bridge.skip_freshness_check, False)
+        self.assertEqual(bridge.bulk_writer.bulk_save_limit,
+                         bridge.workers_config['bulk_save_limit'])
+
+        # Finished backfill isn't planned again
+        bridge.backfill = True
+        bridge.fill_input_queue()
+        self.assertEqual(feeder.plan.call_count, 1)
+
     def test_send_bulk(self):
         old_date_modified = datetime.datetime.utcnow().isoformat()
         id_1 = uuid.uuid4().hex
@@ -292,6 +340,11 @@ class TestEdgeDataBridge(TenderBaseWebTest):
         self.assertEqual(bridge.resource_items_queue.qsize(), 0)
         bridge.send_bulk(input_dict, priority_cache)
         self.assertEqual(bridge.resource_items_queue.qsize(), 1)
+
+        # Queued id isn't duplicated and keeps the highest priority
+        bridge.send_bulk({id_2: date_modified_2}, {id_2: 1000})
+        self.assertEqual(bridge.resource_items_queue.qsize(), 1)
+        self.assertEqual(bridge.resource_items_queue.priority(id_2), 1)
         bridge.db.view.side_effect = [Exception(), Exception(),
                                       Exception('test')]
         input_dict = {}
@@ -299,6 +352,152 @@ class TestEdgeDataBridge(TenderBaseWebTest):
             bridge.send_bulk(input_dict, priority_cache)
         self.assertEqual(e.exception.message, 'test')
 
+        # Check with loaded dateModified index
+        bridge.resource_items_queue.get()
+        bridge.db.view.reset_mock()
+        bridge.date_modified_index = DateModifiedIndex()
+        bridge.date_modified_index.set(id_1, date_modified_1)
+        bridge.date_modified_index.loaded = True
+        input_dict = {id_1: old_date_modified, id_2: date_modified_2}
+        bridge.send_bulk(input_dict, priority_cache)
+        self.assertEqual(bridge.db.view.call_count, 0)
+        self.assertEqual(bridge.resource_items_queue.qsize(), 1)
+        self.assertEqual(bridge.resource_items_queue.get(), (1, id_2))
+
+    def test_checkpoint_without_journal(self):
+        bridge = EdgeDataBridge(self.config)
+        self.assertEqual(bridge.checkpoint, None)
+        self.assertEqual(bridge.feeder.checkpoint, None)
+        self.assertEqual(bridge.feeder.save_checkpoint(), False)
+
+    def test_content_fingerprint_requires_index(self):
+        self.config['main']['content_fingerprint'] = True
+        self.addCleanup(self.config['main'].pop, 'content_fingerprint')
+        with self.assertRaises(DataBridgeConfigError) as e:
+            EdgeDataBridge(self.config)
+        self.assertEqual(e.exception.message, '\'content_fingerprint\' '
+                         'requires \'date_modified_index\'.')
+
+    def test_backfill_requires_journal(self):
+        self.config['main']['backfill'] = True
+        self.addCleanup(self.config['main'].pop, 'backfill')
+        with self.assertRaises(DataBridgeConfigError) as e:
+            EdgeDataBridge(self.config)
+        self.assertEqual(e.exception.message,
+                         '\'backfill\' requires \'journal_dir\'.')
+
+    def test_send_bulk_unchanged_redelivery(self):
+        self.config['main']['content_fingerprint'] = True
+        self.config['main']['date_modified_index'] = True
+        self.addCleanup(self.config['main'].pop, 'content_fingerprint')
+        self.addCleanup(self.config['main'].pop, 'date_modified_index')
+        bridge = EdgeDataBridge(self.config)
+        bridge.date_modified_index.loaded = True
+        item_id = uuid.uuid4().hex
+        saved = {'id': item_id, 'dateModified': '2017-01-01T00:00:00+02:00',
+                 'title': 'x'}
+        bridge.fingerprint_cache.set(item_id, fingerprint(saved))
+        bumped = dict(saved, dateModified='2017-01-02T00:00:00+02:00')
+        bridge.db.update = MagicMock()
+        bridge.bulk_writer._write_bulk({item_id: bumped}, {item_id: 1})
+        self.assertEqual(bridge.db.update.called, False)
+
+        # Feed repeats of the bumped version aren't fetched again, though
+        # db keeps the older dateModified
+        bridge.db.view = MagicMock()
+        bridge.send_bulk({item_id: bumped['dateModified']}, {item_id: 1})
+        self.assertEqual(bridge.db.view.called, False)
+        self.assertEqual(bridge.resource_items_queue.qsize(), 0)
+
+    def test_deterministic_update_without_conflicts(self):
+        item_id = uuid.uuid4().hex
+        doc = {'_id': item_id, 'id': item_id, 'doc_type': 'Tender',
+               'dateModified': '2017-01-01T00:00:00+02:00', 'title': 'a'}
+        [(success, _, rev)] = update_deterministic(self.db, [dict(doc)])
+        self.assertEqual(success, True)
+        newer = dict(doc, dateModified='2017-01-02T00:00:00+02:00',
+                     title='b')
+        [(success, _, new_rev)] = update_deterministic(
+            self.db, [newer], {item_id: rev})
+        self.assertEqual(success, True)
+        stored = self.db.get(item_id, conflicts=True)
+        self.assertEqual(stored['_rev'], new_rev)
+        self.assertEqual(stored['title'], 'b')
+        self.assertNotIn('_conflicts', stored)
+
+    def test_journal(self):
+        journal_dir = tempfile.mkdtemp()
+        self.config['main']['journal_dir'] = journal_dir
+        try:
+            bridge = EdgeDataBridge(self.config)
+            self.assertEqual(bridge.bulk_writer.journal, bridge.journal)
+            id_1, id_2, id_3 = [uuid.uuid4().hex for i in xrange(0, 3)]
+            date_modified = '2017-01-01T00:00:00+02:00'
+            bridge.feeder.get_resource_items = MagicMock(return_value=[
+                (1, {'id': id_1, 'dateModified': date_modified}),
+                (1, {'id': id_2, 'dateModified': date_modified})])
+            bridge.fill_input_queue()
+            bridge.journal.add(id_3, 1001)
+            # Actual id is done
+            bridge.date_modified_index = DateModifiedIndex()
+            bridge.date_modified_index.set(id_1, date_modified)
+            bridge.date_modified_index.loaded = True
+            bridge.send_bulk({id_1: date_modified}, {id_1: 1})
+            bridge.journal.close()
+
+            # Restart
+            bridge = EdgeDataBridge(self.config)
+            bridge.replay_journal()
+            self.assertEqual(bridge.input_queue.get(timeout=0), (1, {
+                'id': id_2, 'dateModified': date_modified}))
+            self.assertEqual(bridge.resource_items_queue.get(timeout=0),
+                             (1001, id_3))
+        finally:
+            del self.config['main']['journal_dir']
+            shutil.rmtree(journal_dir)
+
+    def test_replay_dead_letters(self):
+        bridge = EdgeDataBridge(self.config)
+        replayed_id, dropped_id = uuid.uuid4().hex, uuid.uuid4().hex
+        letters = [{'_id': 'tenders:' + replayed_id, 'item_id': replayed_id},
+                   {'_id': 'tenders:' + dropped_id, 'item_id': dropped_id}]
+        bridge.dead_letters = MagicMock()
+        bridge.dead_letters.letters.return_value = letters
+        bridge.dead_letters.remove.return_value = True
+        bridge.workers_watcher = MagicMock()
+        bridge._replay_finished = MagicMock(return_value=True)
+        # Only the replayed item gets saved, the other one is retried
+        bridge.bulk_writer.join = MagicMock(
+            side_effect=lambda: bridge.bulk_writer.on_saved(replayed_id))
+        self.assertEqual(bridge.replay_dead_letters(rate=100), 1)
+        bridge.dead_letters.remove.assert_called_once_with(letters[0])
+        # Items get the whole retries budget
+        self.assertEqual(bridge.resource_items_queue.get(timeout=0),
+                         (1000, replayed_id))
+        self.assertEqual(bridge.resource_items_queue.get(timeout=0),
+                         (1000, dropped_id))
+        self.assertEqual(bridge.bulk_writer.dead, True)
+
+    def test_drain(self):
+        bridge = EdgeDataBridge(self.config)
+        bridge.drain_timeout = 1
+        bridge.filler = spawn(sleep, 10)
+        worker = MagicMock()
+        bridge.workers_pool.greenlets.add(worker)
+        bridge.bulk_writer = MagicMock()
+        bridge.persist = MagicMock()
+        bridge.resource_items_queue.put((1, uuid.uuid4().hex))
+        with patch('openprocurement.edge.databridge.gevent.joinall') as \
+                mocked_joinall:
+            self.assertEqual(bridge.drain(), True)
+        self.assertEqual(bridge.filler.dead, True)
+        worker.shutdown.assert_called_once_with()
+        self.assertEqual(mocked_joinall.call_args[0][0], [worker])
+        bridge.bulk_writer.shutdown.assert_called_once_with()
+        self.assertEqual(bridge.persist.call_count, 1)
+        # Queued ids stay for the journal
+        self.assertEqual(bridge.resource_items_queue.qsize(), 1)
+
     def test_fill_resource_items_queue(self):
         bridge = EdgeDataBridge(self.config)
         db_dict_list = [
@@ -380,6 +579,31 @@ class TestEdgeDataBridge(TenderBaseWebTest):
         self.assertEqual(len(bridge.workers_pool), 1)
         self.assertEqual(bridge.resource_items_queue.qsize(), 0)
 
+        # Unbounded queue is measured against resource_items_limit
+        bridge.resource_items_queue_size = -1
+        bridge.resource_items_limit = 10
+        for i in xrange(0, 10):
+            bridge.resource_items_queue.put('a')
+        with patch('__builtin__.True', AlmostAlwaysTrue()):
+            bridge.queues_controller()
+        self.assertEqual(len(bridge.workers_pool), 2)
+
+    @patch('openprocurement.edge.databridge.APIClient')
+    @patch('openprocurement.edge.databridge.ResourceItemWorker.spawn')
+    def test_autoscale_controller(self, mock_riw_spawn, mock_APIClient):
+        bridge = EdgeDataBridge(self.config)
+        bridge.workers_autoscale = True
+        bridge.autoscale_interval = 0
+        bridge.resource_items_queue.put((1, uuid.uuid4().hex))
+        bridge._autoscale_sample = MagicMock(side_effect=[
+            (100, 0, 0, 0, 0), (101, 10, 0, 1, 10), (102, 30, 0, 2, 30),
+            (103, 50, 2, 3, 50)
+        ])
+        with patch('__builtin__.True', AlmostAlwaysTrue(3)):
+            bridge.queues_controller()
+        # 0 -> 1 worker, throughput grows -> 2, 429s -> 1
+        self.assertEqual(len(bridge.workers_pool), 1)
+
     @patch('openprocurement.edge.databridge.APIClient')
     def test_create_api_client(self, mock_APIClient):
         mock_APIClient.side_effect = [
@@ -460,17 +684,18 @@ class TestEdgeDataBridge(TenderBaseWebTest):
         request_duration = 1
         for k in bridge.api_clients_info:
             for i in xrange(0, 3):
-                bridge.api_clients_info[k]['request_durations'][datetime.datetime.now()] =\
-                    request_duration
+                bridge.api_clients_info[k]['request_durations'].record(
+                    request_duration)
             request_duration += 1
         res, res_list = bridge._get_average_requests_duration()
         self.assertEqual(res, 2)
         self.assertEqual(len(res_list), 3)
 
-        delta = datetime.timedelta(seconds=301)
-        grown_date = datetime.datetime.now() - delta
+        grown_durations = RollingHistogram(bridge.perfomance_window)
+        grown_durations.record(1)
+        grown_durations.first -= 301
         bridge.api_clients_info[uuid.uuid4().hex] = {
-            'request_durations': {grown_date: 1},
+            'request_durations': grown_durations,
             'destroy': False,
             'request_interval': 0,
             'avg_duration': 0
@@ -505,23 +730,28 @@ class TestEdgeDataBridge(TenderBaseWebTest):
         bridge.create_api_client()
         bridge.create_api_client()
         self.assertEqual(len(bridge.api_clients_info), 3)
-        avg_duration = 1
+        request_duration = 1
         req_intervals = [0, 2, 0, 0]
         for cid in bridge.api_clients_info:
             self.assertEqual(bridge.api_clients_info[cid]['drop_cookies'], False)
-            bridge.api_clients_info[cid]['avg_duration'] = avg_duration
+            for i in xrange(0, 10):
+                bridge.api_clients_info[cid]['request_durations'].record(
+                    request_duration)
+            bridge.api_clients_info[cid]['request_interval'] = \
+                req_intervals[request_duration]
+            request_duration += 1
+        bridge._get_average_requests_duration()
+        for cid in bridge.api_clients_info:
             bridge.api_clients_info[cid]['grown'] = True
-            bridge.api_clients_info[cid]['request_interval'] = req_intervals[avg_duration]
-            avg_duration += 1
-        avg = 1.5
-        bridge._mark_bad_clients(avg)
+        bridge._mark_bad_clients()
         self.assertEqual(len(bridge.api_clients_info), 3)
         self.assertEqual(bridge.api_clients_queue.qsize(), 3)
         to_destroy = 0
         for cid in bridge.api_clients_info:
             if bridge.api_clients_info[cid]['drop_cookies']:
                 to_destroy += 1
-        self.assertEqual(to_destroy, 3)
+        # Slowest client and fast one with request_interval
+        self.assertEqual(to_destroy, 2)
 
     @patch('openprocurement_client.api_base_client.Session')
     def test_perfomance_watcher(self, mocked_session):
@@ -531,13 +761,13 @@ class TestEdgeDataBridge(TenderBaseWebTest):
             bridge.create_api_client()
         req_duration = 1
         for _, info in bridge.api_clients_info.items():
-            info['request_durations'][datetime.datetime.now()] = req_duration
+            info['request_durations'].record(req_duration)
             req_duration += 1
             self.assertEqual(info.get('grown', False), False)
-            self.assertEqual(len(info['request_durations']), 1)
+            self.assertEqual(info['request_durations'].count(), 1)
+            info['request_durations'].first -= 1
         self.assertEqual(len(bridge.api_clients_info), 3)
         self.assertEqual(bridge.api_clients_queue.qsize(), 3)
-        sleep(1)
 
         bridge.perfomance_watcher()
         grown = 0
@@ -547,7 +777,6 @@ class TestEdgeDataBridge(TenderBaseWebTest):
                 grown += 1
             if info['drop_cookies']:
                 with_new_cookies += 1
-            self.assertEqual(len(info['request_durations']), 0)
         self.assertEqual(len(bridge.api_clients_info), 3)
         self.assertEqual(bridge.api_clients_queue.qsize(), 3)
         self.assertEqual(grown, 3)
@@ -570,9 +799,99 @@ class TestEdgeDataBridge(TenderBaseWebTest):
         self.assertEqual(mock_fill_input_queue.call_count, 1)
 
 
+class TestMultiResourceEdgeDataBridge(TenderBaseWebTest):
+
+    def setUp(self):
+        self.config = deepcopy(TestEdgeDataBridge.config)
+        self.config['main']['resources'] = ['tenders', 'plans']
+
+    def tearDown(self):
+        try:
+            server = Server(self.config['main']['couch_url'])
+            del server[self.config['main']['db_name']]
+        except:
+            pass
+
+    def test_init(self):
+        bridge = MultiResourceEdgeDataBridge(self.config)
+        self.assertEqual(len(bridge.bridges), 2)
+        self.assertEqual(
+            [b.workers_config['resource'] for b in bridge.bridges],
+            ['tenders', 'plans'])
+        for b in bridge.bridges:
+            self.assertIs(b.db, bridge.db)
+            self.assertIs(b.server, bridge.server)
+            self.assertIs(b.api_clients_queue, bridge.api_clients_queue)
+            self.assertIs(b.api_clients_info, bridge.api_clients_info)
+        self.assertIsNot(bridge.bridges[0].resource_items_queue,
+                         bridge.bridges[1].resource_items_queue)
+        self.assertEqual(bridge.bridges[1].view_path,
+                         '_design/plans/_view/by_dateModified')
+
+        self.config['main']['resources'] = 'contracts, auctions'
+        bridge = MultiResourceEdgeDataBridge(self.config)
+        self.assertEqual(bridge.resources, ['contracts', 'auctions'])
+
+        self.config['main']['resources'] = []
+        with self.assertRaises(DataBridgeConfigError):
+            MultiResourceEdgeDataBridge(self.config)
+
+    def test_split_workers(self):
+        self.config['main']['workers_min'] = 1
+        self.config['main']['workers_max'] = 10
+        bridge = MultiResourceEdgeDataBridge(self.config)
+        self.assertEqual(bridge.split_workers(), [1, 1])
+        for i in xrange(0, 6):
+            bridge.bridges[0].resource_items_queue.put((1, uuid.uuid4().hex))
+        for i in xrange(0, 2):
+            bridge.bridges[1].resource_items_queue.put((1, uuid.uuid4().hex))
+        self.assertEqual(bridge.split_workers(), [7, 3])
+
+    @patch('openprocurement.edge.databridge.APIClient')
+    @patch('openprocurement.edge.databridge.ResourceItemWorker.spawn')
+    def test_queues_controller(self, mock_riw_spawn, mock_APIClient):
+        mock_riw_spawn.side_effect = lambda *args: MagicMock()
+        bridge = MultiResourceEdgeDataBridge(self.config)
+        bridge.split_workers = MagicMock(side_effect=[[2, 0], [1, 0]])
+        with patch('__builtin__.True', AlmostAlwaysTrue()):
+            bridge.queues_controller()
+        self.assertEqual(len(bridge.bridges[0].workers_pool), 2)
+        self.assertEqual(len(bridge.bridges[1].workers_pool), 0)
+        self.assertEqual(len(bridge.api_clients_info), 2)
+        with patch('__builtin__.True', AlmostAlwaysTrue()):
+            bridge.queues_controller()
+        self.assertEqual(len(bridge.bridges[0].workers_pool), 1)
+        self.assertEqual(len(bridge.api_clients_info), 1)
+
+    def test_gevent_watcher(self):
+        bridge = MultiResourceEdgeDataBridge(self.config)
+        for b in bridge.bridges:
+            b.perfomance_watcher = MagicMock()
+            b.resource_watcher = MagicMock()
+        bridge.gevent_watcher()
+        self.assertEqual(bridge.bridges[0].perfomance_watcher.call_count, 1)
+        self.assertEqual(bridge.bridges[1].perfomance_watcher.call_count, 0)
+        for b in bridge.bridges:
+            self.assertEqual(b.resource_watcher.call_count, 1)
+
+    @patch('openprocurement.edge.databridge.EdgeDataBridge.start_sync')
+    @patch('openprocurement.edge.databridge.MultiResourceEdgeDataBridge.'
+           'queues_controller')
+    @patch('openprocurement.edge.databridge.MultiResourceEdgeDataBridge.'
+           'gevent_watcher')
+    def test_run(self, mock_gevent, mock_controller, mock_start_sync):
+        bridge = MultiResourceEdgeDataBridge(self.config)
+        with patch('__builtin__.True', AlmostAlwaysTrue(4)):
+            bridge.run()
+        self.assertEqual(mock_start_sync.call_count, 2)
+        self.assertEqual(mock_controller.call_count, 1)
+        self.assertEqual(mock_gevent.call_count, 1)
+
+
 def suite():
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(TestEdgeDataBridge))
+    suite.addTest(unittest.makeSuite(TestMultiResourceEdgeDataBridge))
     return suite
 
 
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import datetime
+import unittest
+import uuid
+from couchdb.client import Row
+from couchdb.http import ResourceConflict
+from mock import MagicMock
+from openprocurement.edge.deadletters import DeadLetterStore
+from openprocurement.edge.utils import TZ
+
+
+class TestDeadLetterStore(unittest.TestCase):
+
+    def setUp(self):
+        self.docs = {}
+        self.db = MagicMock()
+        self.db.get.side_effect = lambda doc_id: self.docs.get(doc_id)
+        self.db.save.side_effect = lambda doc: self.docs.update(
+            {doc['_id']: doc})
+        self.store = DeadLetterStore(self.db, 'tenders')
+
+    def test_put(self):
+        item_id = uuid.uuid4().hex
+        first = datetime.datetime(2017, 1, 1, tzinfo=TZ)
+        last = datetime.datetime(2017, 1, 2, tzinfo=TZ)
+        self.store.put(item_id, 1003, 0, 'ConnectionError()', now=first)
+        doc = self.store.put(item_id, 1003, 503, 'Service Unavailable',
+                             now=last)
+        self.assertEqual(doc['_id'], 'tenders:' + item_id)
+        self.assertEqual(doc['item_id'], item_id)
+        self.assertEqual(doc['dropped_count'], 2)
+        self.assertEqual(doc['first_dropped'], first.isoformat())
+        self.assertEqual(doc['last_dropped'], last.isoformat())
+        self.assertEqual((doc['status_code'], doc['error']),
+                         (503, 'Service Unavailable'))
+
+    def test_letters(self):
+        rows = [Row(id='tenders:{}'.format(i), doc={'item_id': str(i)})
+                for i in xrange(0, 3)]
+        self.db.view.side_effect = [rows[:2], rows[2:]]
+        letters = list(self.store.letters(batch=2))
+        self.assertEqual([letter['item_id'] for letter in letters],
+                         ['0', '1', '2'])
+        self.assertEqual(self.db.view.call_args_list[0][1]['startkey'],
+                         'tenders:')
+        self.assertEqual(self.db.view.call_args_list[1][1]['startkey'],
+                         'tenders:1')
+        self.assertEqual(self.db.view.call_args_list[1][1]['skip'], 1)
+
+    def test_remove(self):
+        self.assertEqual(self.store.remove({'_id': 'tenders:a'}), True)
+        # Dropped again while replayed
+        self.db.delete.side_effect = ResourceConflict()
+        self.assertEqual(self.store.remove({'_id': 'tenders:a'}), False)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestDeadLetterStore))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+import unittest
+import webtest
+from openprocurement.edge.fakeapi import FakeAPI
+
+
+class TestFakeAPI(unittest.TestCase):
+
+    def setUp(self):
+        self.api = FakeAPI(resources=('tenders',), docs=5, doc_size=1000,
+                           seed=1)
+        self.app = webtest.TestApp(self.api)
+        self.resource = self.api.resources['tenders']
+
+    def test_spore(self):
+        self.assertEqual(self.app.head('/api/2.3/spore').status_int, 200)
+
+    def test_changes_feed(self):
+        response = self.app.get('/api/2.3/tenders',
+                                {'descending': '1', 'limit': 2}).json
+        self.assertEqual([item['id'] for item in response['data']],
+                         self.resource.ids[:2:-1][:2])
+        self.assertEqual(response['next_page']['offset'], 4)
+        forward_offset = response['prev_page']['offset']
+        response = self.app.get('/api/2.3/tenders', {
+            'descending': '1', 'offset': 4}).json
+        self.assertEqual(len(response['data']), 3)
+
+        # Updated item moves to the end of the feed
+        self.resource.update_random()
+        updated_id = self.resource.ids[-1]
+        response = self.app.get('/api/2.3/tenders',
+                                {'offset': forward_offset}).json
+        self.assertEqual(response['data'], [{
+            'id': updated_id,
+            'dateModified': self.resource.items[updated_id][
+                'dateModified']}])
+        response = self.app.get('/api/2.3/tenders').json
+        self.assertEqual(len(response['data']), 5)
+        self.assertEqual(response['data'][-1]['id'], updated_id)
+
+    def test_date_modified_feed(self):
+        start = self.resource.items[self.resource.ids[1]]['dateModified']
+        response = self.app.get('/api/2.3/tenders', {
+            'feed': 'dateModified', 'offset': start, 'limit': 2}).json
+        self.assertEqual([item['id'] for item in response['data']],
+                         self.resource.ids[2:4])
+        response = self.app.get('/api/2.3/tenders', {
+            'feed': 'dateModified',
+            'offset': response['next_page']['offset']}).json
+        self.assertEqual([item['id'] for item in response['data']],
+                         self.resource.ids[4:])
+
+    def test_item(self):
+        item_id = self.resource.ids[0]
+        response = self.app.get('/api/2.3/tenders/' + item_id)
+        self.assertEqual(len(response.body), 1000)
+        self.assertEqual(response.json['data']['dateModified'],
+                         self.resource.items[item_id]['dateModified'])
+        self.app.get('/api/2.3/tenders/' + item_id, status=304,
+                     headers={'If-None-Match': response.headers['ETag']})
+        self.app.get('/api/2.3/tenders/unknown', status=404)
+
+        self.resource.items[item_id]['gone'] = True
+        self.app.get('/api/2.3/tenders/' + item_id, status=410)
+        self.api.throttle_rate = 1
+        response = self.app.get('/api/2.3/tenders/' + item_id, status=429)
+        self.assertEqual(response.headers['Retry-After'], '1')
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestFakeAPI))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
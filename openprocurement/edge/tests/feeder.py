@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+import unittest
+from mock import MagicMock, patch
+from openprocurement.edge.feeder import (
+    CheckpointResourceFeeder,
+    FeedCheckpoint,
+    CHECKPOINT_DOC_ID
+)
+
+
+class TestFeedCheckpoint(unittest.TestCase):
+
+    def test_load(self):
+        db = MagicMock()
+        db.get.return_value = None
+        checkpoint = FeedCheckpoint(db, 'tenders')
+        self.assertEqual(checkpoint.doc_id,
+                         CHECKPOINT_DOC_ID.format('tenders'))
+        self.assertEqual(checkpoint.load(), {})
+
+        db.get.return_value = {'_id': checkpoint.doc_id, '_rev': '1-a',
+                               'forward_offset': 'f1',
+                               'backward_offset': 'b1'}
+        self.assertEqual(checkpoint.load(), {'forward_offset': 'f1',
+                                             'backward_offset': 'b1',
+                                             'backward_finished': False})
+
+        db.get.return_value['backfill'] = [['o1', 'e1']]
+        self.assertEqual(checkpoint.load()['backfill'], [['o1', 'e1']])
+
+        db.get.side_effect = Exception('db error')
+        self.assertEqual(checkpoint.load(), {})
+
+    def test_save(self):
+        db = MagicMock()
+        db.get.return_value = None
+        checkpoint = FeedCheckpoint(db, 'plans')
+        state = {'forward_offset': 'f1', 'backward_offset': 'b1',
+                 'backward_finished': False}
+        self.assertEqual(checkpoint.save(state), True)
+        db.save.assert_called_once_with(
+            dict(state, _id=CHECKPOINT_DOC_ID.format('plans')))
+
+        # Unchanged state isn't written again
+        self.assertEqual(checkpoint.save(dict(state)), False)
+        self.assertEqual(db.save.call_count, 1)
+
+        # Partial states are merged
+        self.assertEqual(checkpoint.save({'backfill': []}), True)
+        self.assertEqual(checkpoint.save(dict(state)), False)
+        self.assertEqual(checkpoint.saved_state, dict(state, backfill=[]))
+
+    def test_reset(self):
+        db = MagicMock()
+        doc = {'_id': CHECKPOINT_DOC_ID.format('tenders'), '_rev': '1-a'}
+        db.get.return_value = doc
+        checkpoint = FeedCheckpoint(db, 'tenders')
+        checkpoint.saved_state = {'forward_offset': 'f1'}
+        checkpoint.reset()
+        db.delete.assert_called_once_with(doc)
+        self.assertEqual(checkpoint.saved_state, {})
+
+        db.get.return_value = None
+        checkpoint.reset()
+        self.assertEqual(db.delete.call_count, 1)
+
+
+class TestCheckpointResourceFeeder(unittest.TestCase):
+
+    def setUp(self):
+        self.patcher = patch('openprocurement_client.sync.TendersClientSync')
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def get_feeder(self, state):
+        checkpoint = MagicMock()
+        checkpoint.load.return_value = state
+        feeder = CheckpointResourceFeeder(
+            checkpoint=checkpoint, host='http://127.0.0.1', version='2.3',
+            extra_params={'mode': '_all_', 'limit': 10})
+        return feeder
+
+    @patch('openprocurement.edge.feeder.ResourceFeeder.start_sync')
+    def test_start_sync_without_checkpoint(self, mocked_start_sync):
+        feeder = self.get_feeder({})
+        feeder.init_api_clients()
+        self.assertNotIn('offset', feeder.forward_params)
+        feeder.start_sync()
+        self.assertEqual(mocked_start_sync.call_count, 1)
+
+    @patch('openprocurement.edge.feeder.spawn')
+    def test_start_sync_from_checkpoint(self, mocked_spawn):
+        feeder = self.get_feeder({'forward_offset': 'f1',
+                                  'backward_offset': 'b1',
+                                  'backward_finished': False})
+        feeder.init_api_clients()
+        self.assertEqual(feeder.forward_params['offset'], 'f1')
+        self.assertEqual(feeder.backward_params['offset'], 'b1')
+        feeder.start_sync()
+        self.assertEqual(mocked_spawn.call_args_list[0][0][0],
+                         feeder.retriever_backward)
+        self.assertEqual(mocked_spawn.call_args_list[1][0][0],
+                         feeder.retriever_forward)
+
+        # Backward feed already walked
+        mocked_spawn.reset_mock()
+        feeder = self.get_feeder({'forward_offset': 'f1',
+                                  'backward_offset': 'b1',
+                                  'backward_finished': True})
+        feeder.init_api_clients()
+        feeder.start_sync()
+        self.assertNotEqual(mocked_spawn.call_args_list[0][0][0],
+                            feeder.retriever_backward)
+        self.assertEqual(mocked_spawn.call_args_list[1][0][0],
+                         feeder.retriever_forward)
+
+    def test_init_api_clients_on_restart(self):
+        feeder = self.get_feeder({'forward_offset': 'f1',
+                                  'backward_offset': 'b1'})
+        feeder.init_api_clients()
+        feeder.forward_params['offset'] = 'f2'
+        feeder.backward_params['offset'] = 'b2'
+        feeder.init_api_clients()
+        self.assertEqual(feeder.checkpoint.load.call_count, 1)
+        self.assertEqual(feeder.forward_params['offset'], 'f2')
+        self.assertEqual(feeder.backward_params['offset'], 'b2')
+
+    @patch('openprocurement.edge.feeder.ResourceFeeder.retriever_backward')
+    def test_retriever_backward(self, mocked_retriever):
+        feeder = self.get_feeder({})
+        mocked_retriever.return_value = 1
+        self.assertEqual(feeder.retriever_backward(), 1)
+        self.assertEqual(feeder.backward_finished, False)
+        mocked_retriever.return_value = 0
+        self.assertEqual(feeder.retriever_backward(), 0)
+        self.assertEqual(feeder.backward_finished, True)
+
+    def test_save_checkpoint(self):
+        feeder = self.get_feeder({})
+        # Feeder isn't started yet
+        self.assertEqual(feeder.save_checkpoint(), False)
+
+        feeder.init_api_clients()
+        self.assertEqual(feeder.save_checkpoint(), False)
+
+        feeder.forward_params['offset'] = 'f1'
+        feeder.backward_params['offset'] = 'b1'
+        feeder.checkpoint.save.return_value = True
+        self.assertEqual(feeder.save_checkpoint(), True)
+        feeder.checkpoint.save.assert_called_once_with({
+            'forward_offset': 'f1', 'backward_offset': 'b1',
+            'backward_finished': False})
+
+        feeder.forward_params['offset'] = 'f2'
+        feeder.checkpoint.save.side_effect = Exception('db error')
+        self.assertEqual(feeder.save_checkpoint(), False)
+
+    def test_save_checkpoint_with_queued_items(self):
+        feeder = self.get_feeder({})
+        feeder.init_api_clients()
+        feeder.queue.put('a')
+        feeder.queue.put('b')
+        feeder.forward_params['offset'] = 'f1'
+        feeder.checkpoint.save.return_value = True
+        items = feeder.low_water.iterate(iter(['a', 'b']))
+        # Offset is past the items which aren't handed over yet
+        self.assertEqual(feeder.save_checkpoint(), False)
+        next(items)
+        feeder.queue.get()
+        self.assertEqual(feeder.save_checkpoint(), False)
+        next(items)
+        feeder.queue.get()
+        self.assertEqual(feeder.save_checkpoint(), False)
+        self.assertEqual(list(items), [])
+        self.assertEqual(feeder.save_checkpoint(), True)
+        feeder.checkpoint.save.assert_called_once_with({
+            'forward_offset': 'f1', 'backward_offset': None,
+            'backward_finished': False})
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestFeedCheckpoint))
+    suite.addTest(unittest.makeSuite(TestCheckpointResourceFeeder))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+import unittest
+import uuid
+from mock import MagicMock
+from munch import munchify
+from openprocurement.edge.index import (
+    MAX_LOAD,
+    DateModifiedIndex,
+    date_to_microseconds
+)
+
+
+class TestDateModifiedIndex(unittest.TestCase):
+
+    def test_date_to_microseconds(self):
+        self.assertEqual(
+            date_to_microseconds('2017-05-02T12:34:56.123456+03:00'),
+            date_to_microseconds('2017-05-02T09:34:56.123456Z'))
+        self.assertEqual(
+            date_to_microseconds('2017-05-02T12:34:56.123456-01:30'),
+            date_to_microseconds('2017-05-02T14:04:56.123456+00:00'))
+        self.assertEqual(
+            date_to_microseconds('2017-05-02T12:34:56+03:00') + 120000,
+            date_to_microseconds('2017-05-02T12:34:56.12+03:00'))
+        self.assertLess(
+            date_to_microseconds('2017-05-02T12:34:56.123456+03:00'),
+            date_to_microseconds('2017-05-02T12:34:56.123457+03:00'))
+        # Not in the fast path format
+        self.assertEqual(date_to_microseconds('2017-05-02T12:34:56'),
+                         date_to_microseconds('2017-05-02T12:34:56Z'))
+
+    def test_set_get(self):
+        index = DateModifiedIndex(capacity=4)
+        old_date = '2017-05-02T12:34:56.123456+03:00'
+        new_date = '2017-05-02T12:35:56.123456+03:00'
+        ids = [uuid.uuid4().hex for i in xrange(0, 100)]
+        for item_id in ids:
+            index.set(item_id, old_date)
+        self.assertEqual(len(index), 100)
+        self.assertGreaterEqual(index.capacity * MAX_LOAD, len(index))
+        for item_id in ids:
+            self.assertEqual(index.get(item_id),
+                             date_to_microseconds(old_date))
+        self.assertEqual(index.get(uuid.uuid4().hex), None)
+
+        # Only newer dateModified is stored
+        index.set(ids[0], new_date)
+        index.set(ids[0], old_date)
+        self.assertEqual(index.get(ids[0]), date_to_microseconds(new_date))
+        self.assertEqual(len(index), 100)
+
+        # Ids which can't be packed
+        index.set('not-a-hex-id', old_date)
+        index.set('z' * 32, old_date)
+        index.set('not-a-hex-id', new_date)
+        self.assertEqual(index.get('not-a-hex-id'),
+                         date_to_microseconds(new_date))
+        self.assertEqual(index.get('z' * 32), date_to_microseconds(old_date))
+        self.assertEqual(len(index), 102)
+
+    def test_nbytes(self):
+        index = DateModifiedIndex(capacity=4)
+        date_modified = '2017-05-02T12:34:56.123456+03:00'
+        for i in xrange(0, 10000):
+            index.set(uuid.uuid4().hex, date_modified)
+        self.assertLessEqual(index.nbytes, 45 * len(index))
+        index = DateModifiedIndex(capacity=4)
+        index.reserve(10000)
+        for i in xrange(0, 10000):
+            index.set(uuid.uuid4().hex, date_modified)
+        self.assertEqual(index.capacity, 12501)
+        # 30 bytes per doc and a spare slot
+        self.assertEqual(index.nbytes, 24 * index.capacity)
+
+    def test_resolution(self):
+        index = DateModifiedIndex()
+        item_id = uuid.uuid4().hex
+        index.set(item_id, '2017-05-02T12:34:56.000017+03:00')
+        self.assertEqual(index.get(item_id), date_to_microseconds(
+            '2017-05-02T12:34:56.000017+03:00'))
+        self.assertEqual(
+            index.is_actual(item_id, '2017-05-02T12:34:56.000017+03:00'),
+            True)
+        # A newer version within the same 16 microseconds isn't stored yet
+        self.assertEqual(
+            index.is_actual(item_id, '2017-05-02T12:34:56.000018+03:00'),
+            False)
+        index.set(item_id, '2017-05-02T12:34:56.000018+03:00')
+        self.assertEqual(
+            index.is_actual(item_id, '2017-05-02T12:34:56.000018+03:00'),
+            True)
+        # Seconds since 2000 fit into 4 bytes till 2136
+        index.set(item_id, '2135-01-01T00:00:00.999999+00:00')
+        self.assertEqual(index.get(item_id), date_to_microseconds(
+            '2135-01-01T00:00:00.999999+00:00'))
+
+    def test_is_actual(self):
+        index = DateModifiedIndex()
+        item_id = uuid.uuid4().hex
+        old_date = '2017-05-02T12:34:56.123456+03:00'
+        new_date = '2017-05-02T12:35:56.123456+03:00'
+        self.assertEqual(index.is_actual(item_id, old_date), False)
+        index.set(item_id, new_date)
+        self.assertEqual(index.is_actual(item_id, old_date), True)
+        self.assertEqual(index.is_actual(item_id, new_date), True)
+        self.assertEqual(
+            index.is_actual(item_id, '2017-05-02T12:36:56.123456+03:00'),
+            False)
+
+    def test_load(self):
+        index = DateModifiedIndex()
+        rows = [munchify({'id': uuid.uuid4().hex,
+                          'key': '2017-05-02T12:34:56.123456+03:00'})
+                for i in xrange(0, 3)]
+        db = MagicMock()
+        db.view.return_value.total_rows = 3
+        db.iterview.return_value = iter(rows)
+        self.assertEqual(index.loaded, False)
+        index.load(db, '_design/tenders/_view/by_dateModified', 2)
+        db.iterview.assert_called_once_with(
+            '_design/tenders/_view/by_dateModified', 2)
+        db.view.assert_called_once_with(
+            '_design/tenders/_view/by_dateModified', limit=0)
+        self.assertEqual(index.loaded, True)
+        self.assertEqual(len(index), 3)
+        for row in rows:
+            self.assertEqual(index.is_actual(row.id, row.key), True)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestDateModifiedIndex))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+from openprocurement.edge.journal import QueueJournal
+
+
+class TestQueueJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'tenders.journal')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_replay(self):
+        journal = QueueJournal(self.path)
+        journal.add('a', 1, '2017-01-01T00:00:00+02:00')
+        journal.add('b', 1000, '2017-01-02T00:00:00+02:00')
+        journal.add('c', 1)
+        journal.add('a', 1002)
+        journal.discard('c')
+        journal.close()
+        journal = QueueJournal(self.path)
+        self.assertEqual(journal.items(), [
+            ('b', 1000, '2017-01-02T00:00:00+02:00'),
+            ('a', 1002, '2017-01-01T00:00:00+02:00')
+        ])
+
+    def test_discard_keeps_newer(self):
+        journal = QueueJournal(self.path)
+        journal.add('a', 1, '2017-01-02T00:00:00+02:00')
+        # Older version was saved
+        journal.discard('a', '2017-01-01T00:00:00+02:00')
+        self.assertEqual(len(journal), 1)
+        journal.discard('a', '2017-01-02T00:00:00+02:00')
+        self.assertEqual(len(journal), 0)
+
+    def test_same_entry_is_written_once(self):
+        journal = QueueJournal(self.path)
+        journal.add('a', 1, '2017-01-01T00:00:00+02:00')
+        size = journal.size
+        journal.add('a', 1, '2017-01-01T00:00:00+02:00')
+        self.assertEqual(journal.size, size)
+        self.assertEqual(os.path.getsize(self.path), size)
+
+    def test_compact(self):
+        journal = QueueJournal(self.path, min_compact_bytes=0)
+        for i in xrange(0, 10):
+            journal.add(str(i), 1, '2017-01-01T00:00:00+02:00')
+            journal.discard(str(i))
+        journal.add('a', 1, '2017-01-01T00:00:00+02:00')
+        self.assertEqual(journal.maybe_compact(), True)
+        self.assertEqual(os.path.getsize(self.path), journal.live_bytes)
+        self.assertEqual(journal.maybe_compact(), False)
+        journal.add('b', 2)
+        journal.close()
+        self.assertEqual(QueueJournal(self.path).items(), [
+            ('a', 1, '2017-01-01T00:00:00+02:00'), ('b', 2, None)])
+
+    def test_max_bytes(self):
+        line = len('A 1 a 2017-01-01T00:00:00+02:00\n')
+        journal = QueueJournal(self.path, max_bytes=line * 2)
+        journal.add('a', 1, '2017-01-01T00:00:00+02:00')
+        journal.discard('a')
+        journal.add('b', 1, '2017-01-01T00:00:00+02:00')
+        # Compaction frees space of discarded ids
+        journal.add('c', 1, '2017-01-01T00:00:00+02:00')
+        self.assertEqual(len(journal), 2)
+        journal.add('d', 1, '2017-01-01T00:00:00+02:00')
+        self.assertEqual(len(journal), 2)
+        self.assertEqual(journal.not_journaled, 1)
+        self.assertLessEqual(os.path.getsize(self.path), line * 2)
+
+    def test_torn_write(self):
+        with open(self.path, 'wb') as journal_file:
+            journal_file.write('A 1 a 2017-01-01T00:00:00+02:00\n'
+                               'A 1 b 2017-01-0')
+        journal = QueueJournal(self.path)
+        self.assertEqual([item[0] for item in journal.items()], ['a'])
+        journal.add('c', 1)
+        journal.close()
+        self.assertEqual([item[0] for item in QueueJournal(
+            self.path).items()], ['a', 'c'])
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestQueueJournal))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+import logging
+import unittest
+from mock import patch
+from openprocurement.edge.logs import EVENT_LOGS, EventLog, configure_events
+
+
+class Records(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class Unformattable(object):
+
+    def __format__(self, spec):
+        raise AssertionError('Message of a disabled event is formatted')
+
+
+class TestEventLog(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger('openprocurement.edge.tests.logs')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.DEBUG)
+        self.records = Records()
+        self.logger.addHandler(self.records)
+        self.event = EventLog(self.logger, 'save')
+        self.addCleanup(self.logger.removeHandler, self.records)
+        self.addCleanup(EVENT_LOGS.remove, self.event)
+
+    def test_log(self):
+        self.assertTrue(self.event.log('Save {} {}', 'tender', 1,
+                                       DOCUMENT_TIMESHIFT=2))
+        record = self.records.records[0]
+        self.assertEqual(record.getMessage(), 'Save tender 1')
+        self.assertEqual(record.MESSAGE_ID, 'save')
+        self.assertEqual(record.DOCUMENT_TIMESHIFT, 2)
+        self.assertFalse(hasattr(record, 'SKIPPED_EVENTS'))
+
+    def test_disabled_level(self):
+        self.logger.setLevel(logging.INFO)
+        self.assertFalse(self.event.log('Save {}', Unformattable()))
+        self.assertEqual(self.records.records, [])
+        # Not counted as sampled out
+        self.assertEqual(self.event.skipped, 0)
+
+    def test_every(self):
+        self.event.every = 3
+        logged = [self.event.log('Save {}', i) for i in range(7)]
+        self.assertEqual(logged, [False, False, True] * 2 + [False])
+        self.assertEqual([record.SKIPPED_EVENTS for record in
+                          self.records.records], [2, 2])
+        self.assertEqual(self.event.skipped, 1)
+
+    @patch('openprocurement.edge.logs.time')
+    def test_rate(self, mocked_time):
+        self.event.rate = 2
+        mocked_time.return_value = 100.2
+        logged = [self.event.log('Save {}', i) for i in range(4)]
+        self.assertEqual(logged, [True, True, False, False])
+        mocked_time.return_value = 101.1
+        self.assertTrue(self.event.log('Save {}', 4))
+        self.assertEqual(self.records.records[-1].SKIPPED_EVENTS, 2)
+        self.assertEqual(self.records.records[-1].getMessage(), 'Save 4')
+
+    def test_configure_events(self):
+        self.addCleanup(configure_events)
+        configure_events(10, 5)
+        self.assertTrue(all(event.every == 10 and event.rate == 5
+                            for event in EVENT_LOGS))
+        self.assertIn(self.event, EVENT_LOGS)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestEventLog))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
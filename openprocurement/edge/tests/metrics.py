@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+import unittest
+import urllib2
+from mock import MagicMock
+from openprocurement.edge.metrics import (
+    CONTENT_TYPE,
+    Counter,
+    Gauge,
+    Histogram,
+    Metric,
+    Registry,
+    REGISTRY,
+    RollingHistogram,
+    metrics_app,
+    start_metrics_server
+)
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_counter(self):
+        counter = Counter('docs_total', 'Docs.', ('resource', 'result'))
+        counter.labels('tenders', 'created').inc()
+        counter.labels('tenders', 'created').inc(2)
+        counter.labels('plans', 'updated').inc()
+        self.assertEqual(counter.labels('tenders', 'created').get(), 3)
+        lines = counter.render().split('\n')
+        self.assertEqual(lines[:2], ['# HELP docs_total Docs.',
+                                     '# TYPE docs_total counter'])
+        self.assertIn('docs_total{resource="tenders",result="created"} 3.0',
+                      lines)
+        self.assertIn('docs_total{resource="plans",result="updated"} 1.0',
+                      lines)
+        counter.remove('plans', 'updated')
+        self.assertEqual(len(counter.render().split('\n')), 3)
+
+    def test_gauge(self):
+        gauge = Gauge('queue_size', 'Queue size.', ('queue',))
+        gauge.labels('main').set(5)
+        queue = MagicMock()
+        queue.qsize.return_value = 7
+        gauge.labels('retry').set_function(queue.qsize)
+        rendered = gauge.render()
+        self.assertIn('queue_size{queue="main"} 5.0', rendered)
+        self.assertIn('queue_size{queue="retry"} 7.0', rendered)
+
+    def test_untyped(self):
+        metric = Metric('bridge_info', 'Bridge info.', ('version',))
+        metric.labels('2.3').set(1)
+        self.assertEqual(metric.render().split('\n'), [
+            '# HELP bridge_info Bridge info.',
+            '# TYPE bridge_info untyped',
+            'bridge_info{version="2.3"} 1.0'
+        ])
+
+    def test_histogram(self):
+        histogram = Histogram('duration_seconds', 'Duration.',
+                              buckets=(0.1, 1))
+        for value in (0.05, 0.1, 0.5, 2):
+            histogram.labels().observe(value)
+        self.assertEqual(histogram.render().split('\n')[2:], [
+            'duration_seconds_bucket{le="0.1"} 2.0',
+            'duration_seconds_bucket{le="1"} 3.0',
+            'duration_seconds_bucket{le="+Inf"} 4.0',
+            'duration_seconds_sum 2.65',
+            'duration_seconds_count 4.0'
+        ])
+
+    def test_registry(self):
+        registry = Registry()
+        counter = registry.register(Counter('a_total', 'A.'))
+        self.assertIs(registry.register(Counter('a_total', 'A.')), counter)
+        registry.register(Gauge('b', 'B.')).labels().set(1)
+        self.assertEqual(registry.render(), '# HELP a_total A.\n'
+                                            '# TYPE a_total counter\n'
+                                            '# HELP b B.\n'
+                                            '# TYPE b gauge\n'
+                                            'b 1.0\n')
+
+    def test_metrics_app(self):
+        start_response = MagicMock()
+        body = metrics_app({'PATH_INFO': '/metrics'}, start_response)
+        self.assertEqual(body, [REGISTRY.render()])
+        self.assertEqual(start_response.call_args[0][0], '200 OK')
+        self.assertIn(('Content-Type', CONTENT_TYPE),
+                      start_response.call_args[0][1])
+        metrics_app({'PATH_INFO': '/'}, start_response)
+        self.assertEqual(start_response.call_args[0][0], '404 Not Found')
+
+    def test_start_metrics_server(self):
+        server = start_metrics_server('127.0.0.1', 0)
+        try:
+            response = urllib2.urlopen('http://127.0.0.1:{}/metrics'.format(
+                server.server_port))
+            self.assertEqual(response.info()['Content-Type'], CONTENT_TYPE)
+            self.assertIn('# TYPE edge_bridge_feed_items_total counter',
+                          response.read())
+        finally:
+            server.stop()
+
+
+class TestRollingHistogram(unittest.TestCase):
+
+    def test_percentiles(self):
+        histogram = RollingHistogram(window=60, slots=6)
+        self.assertEqual(histogram.percentiles(now=100), [0, 0, 0])
+        for value in xrange(1, 101):
+            histogram.record(value / 100.0, now=100)
+        self.assertEqual(histogram.count(now=100), 100)
+        self.assertAlmostEqual(histogram.mean(now=100), 0.505)
+        p50, p95, p99 = histogram.percentiles(now=100)
+        # Upper bounds of buckets are within 25% of exact values
+        self.assertTrue(0.5 <= p50 < 0.5 * 1.25)
+        self.assertTrue(0.95 <= p95 < 0.95 * 1.25)
+        self.assertTrue(0.99 <= p99 < 0.99 * 1.25)
+
+    def test_window(self):
+        histogram = RollingHistogram(window=60, slots=6)
+        histogram.record(5, now=100)
+        histogram.record(0.1, now=135)
+        self.assertEqual(histogram.count(now=135), 2)
+        self.assertEqual(histogram.age(now=135), 35)
+        # Slice of the first request left the window
+        self.assertEqual(histogram.count(now=165), 1)
+        self.assertEqual(histogram.mean(now=165), 0.1)
+        # Its slot is reused by a new slice
+        histogram.record(0.2, now=160)
+        self.assertEqual(histogram.count(now=160), 2)
+        self.assertEqual(histogram.count(now=230), 0)
+        histogram.reset()
+        self.assertEqual(histogram.age(now=200), 0)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestMetrics))
+    suite.addTest(unittest.makeSuite(TestRollingHistogram))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
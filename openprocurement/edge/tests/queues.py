@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+import unittest
+import uuid
+from gevent import spawn, sleep
+from gevent.queue import Empty, Full
+from openprocurement.edge.queues import IndexedPriorityQueue
+
+
+class TestIndexedPriorityQueue(unittest.TestCase):
+
+    def test_put_get(self):
+        queue = IndexedPriorityQueue()
+        id_1 = uuid.uuid4().hex
+        id_2 = uuid.uuid4().hex
+        queue.put((1000, id_1))
+        queue.put((1, id_2))
+        self.assertEqual(queue.qsize(), 2)
+        self.assertIn(id_1, queue)
+        self.assertEqual(queue.peek(), (1, id_2))
+        self.assertEqual(queue.get(), (1, id_2))
+        self.assertNotIn(id_2, queue)
+        self.assertEqual(queue.get(), (1000, id_1))
+        self.assertEqual(queue.empty(), True)
+        with self.assertRaises(Empty):
+            queue.get(timeout=0.01)
+
+    def test_dedup(self):
+        queue = IndexedPriorityQueue()
+        item_id = uuid.uuid4().hex
+        other_id = uuid.uuid4().hex
+        queue.put((5, other_id))
+
+        # Lower priority is ignored
+        queue.put((1000, item_id))
+        queue.put((1001, item_id))
+        self.assertEqual(queue.qsize(), 2)
+        self.assertEqual(queue.priority(item_id), 1000)
+
+        # Decrease-key
+        queue.put((1, item_id))
+        self.assertEqual(queue.qsize(), 2)
+        self.assertEqual(queue.priority(item_id), 1)
+        self.assertEqual(queue.get(), (1, item_id))
+        self.assertEqual(queue.get(), (5, other_id))
+        self.assertEqual(queue.qsize(), 0)
+        self.assertEqual(queue.queue, [])
+
+        # Id may be queued again after get
+        queue.put((1000, item_id))
+        self.assertEqual(queue.get(), (1000, item_id))
+
+    def test_maxsize(self):
+        queue = IndexedPriorityQueue(2)
+        id_1 = uuid.uuid4().hex
+        id_2 = uuid.uuid4().hex
+        queue.put((1000, id_1))
+        queue.put((1000, id_2))
+        self.assertEqual(queue.full(), True)
+        # Queued id doesn't need a free slot
+        queue.put((1, id_1), timeout=0.01)
+        self.assertEqual(queue.priority(id_1), 1)
+        with self.assertRaises(Full):
+            queue.put((1, uuid.uuid4().hex), timeout=0.01)
+
+        # Blocked putter is released by get
+        id_3 = uuid.uuid4().hex
+        putter = spawn(queue.put, (1, id_3))
+        sleep(0)
+        self.assertEqual(queue.get(), (1, id_1))
+        putter.join()
+        self.assertIn(id_3, queue)
+        self.assertEqual(queue.qsize(), 2)
+
+    def test_compact(self):
+        queue = IndexedPriorityQueue()
+        item_id = uuid.uuid4().hex
+        for priority in xrange(1000, 0, -1):
+            queue.put((priority, item_id))
+        self.assertEqual(queue.qsize(), 1)
+        self.assertLess(len(queue.queue), 200)
+        self.assertEqual(queue.get(), (1, item_id))
+
+    def test_copy(self):
+        queue = IndexedPriorityQueue(10, [(1000, 'a'), (1, 'b'), (2, 'a')])
+        self.assertEqual(queue.qsize(), 2)
+        queue_copy = queue.copy()
+        self.assertEqual(queue_copy.maxsize, 10)
+        self.assertEqual(queue_copy.get(), (1, 'b'))
+        self.assertEqual(queue_copy.get(), (2, 'a'))
+        self.assertEqual(queue.qsize(), 2)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestIndexedPriorityQueue))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
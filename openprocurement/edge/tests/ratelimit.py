@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+import unittest
+from time import time
+from openprocurement.edge.ratelimit import AIMDRateController, TokenBucket
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_acquire(self):
+        bucket = TokenBucket(rate=100, burst=2)
+        start = time()
+        for i in xrange(0, 12):
+            bucket.acquire()
+        # Two tokens of burst and ten refilled at 100 per sec.
+        self.assertTrue(0.09 <= time() - start < 0.2)
+
+    def test_pause(self):
+        bucket = TokenBucket(rate=10, burst=5)
+        now = bucket.updated
+        bucket.pause(2, now=now)
+        self.assertEqual(bucket.acquire(now=now, wait=False), 2.1)
+        # No tokens are refilled during the pause
+        self.assertEqual(round(bucket.acquire(now=now + 2, wait=False), 3),
+                         0.2)
+        self.assertEqual(round(bucket.acquire(now=now + 3, wait=False), 3),
+                         0)
+
+
+class TestAIMDRateController(unittest.TestCase):
+
+    def test_increase(self):
+        controller = AIMDRateController(rate=10, max_rate=12, increase=1,
+                                        interval=1)
+        # Two requests at once are more than the rate
+        controller.acquire(now=100, wait=False)
+        controller.acquire(now=100, wait=False)
+        controller.on_success(0.1, now=100)
+        controller.on_success(0.1, now=100.5)
+        self.assertEqual(controller.rate, 11)
+        controller.acquire(now=101, wait=False)
+        controller.acquire(now=101, wait=False)
+        controller.on_success(0.1, now=101)
+        controller.acquire(now=102, wait=False)
+        controller.acquire(now=102, wait=False)
+        controller.on_success(0.1, now=102)
+        self.assertEqual(controller.rate, 12)
+
+    def test_no_increase_below_rate(self):
+        controller = AIMDRateController(rate=10, increase=1, interval=1)
+        start = controller.bucket.updated
+        # One request per second never waits for a token
+        for now in xrange(int(start) + 1, int(start) + 11):
+            self.assertEqual(controller.acquire(now=now, wait=False), 0)
+            controller.on_success(0.1, now=now)
+        self.assertEqual(controller.rate, 10)
+
+    def test_decrease(self):
+        controller = AIMDRateController(rate=40, min_rate=4, decrease=0.5,
+                                        latency_threshold=2, interval=1)
+        controller.on_throttle(now=100)
+        # 429s of requests in flight decrease the rate once
+        controller.on_throttle(now=100.1)
+        self.assertEqual(controller.rate, 20)
+        self.assertEqual(controller.throttled, 2)
+        # No increase right after a decrease
+        controller.on_success(0.1, now=100.5)
+        self.assertEqual(controller.rate, 20)
+        # Slow requests decrease the rate
+        controller.on_success(3, now=101.1)
+        self.assertEqual(controller.rate, 10)
+        controller.on_throttle(now=102.2)
+        controller.on_throttle(now=103.3)
+        self.assertEqual(controller.rate, 4)
+
+    def test_retry_after(self):
+        controller = AIMDRateController(rate=10)
+        controller.on_throttle(retry_after=5, now=100)
+        self.assertEqual(controller.bucket.paused_until, 105)
+        self.assertEqual(controller.rate, 5)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestTokenBucket))
+    suite.addTest(unittest.makeSuite(TestAIMDRateController))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
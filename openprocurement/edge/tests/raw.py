@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+import json
+import unittest
+import uuid
+from couchdb.client import Database
+from couchdb.http import Resource, ResourceConflict, Session
+from mock import MagicMock, patch
+from openprocurement.edge.raw import (
+    BulkDocsBody,
+    RawDoc,
+    post_bulk_docs,
+    scan_object,
+    update_raw
+)
+
+
+class TestRawDoc(unittest.TestCase):
+
+    def setUp(self):
+        self.tender = {
+            'id': uuid.uuid4().hex,
+            'dateModified': '2017-05-02T12:34:56.123456+03:00',
+            'title': u'Тендер "id": {[',
+            'documents': [{'id': uuid.uuid4().hex,
+                           'dateModified': '2016-01-01T00:00:00+02:00'}],
+            'items': {'id': 'nested'}
+        }
+
+    def test_scan_object(self):
+        body = json.dumps(self.tender)
+        end, values = scan_object(body, fields=('id', 'dateModified'),
+                                  objects=('items',))
+        self.assertEqual(end, len(body))
+        self.assertEqual(values['id'], self.tender['id'])
+        self.assertEqual(values['dateModified'],
+                         self.tender['dateModified'])
+        start, end = values['items']
+        self.assertEqual(json.loads(body[start:end]), self.tender['items'])
+        with self.assertRaises(ValueError):
+            scan_object(body[:-1])
+
+    def test_from_response(self):
+        content = json.dumps({'data': self.tender}, indent=2,
+                             ensure_ascii=False).encode('utf-8')
+        doc = RawDoc.from_response(content)
+        self.assertEqual(doc['id'], self.tender['id'])
+        self.assertEqual(doc['dateModified'], self.tender['dateModified'])
+        self.assertEqual(json.loads(doc.body), self.tender)
+        self.assertEqual(doc.dumps(), doc.body)
+
+        # Envelope with other keys before data
+        content = ('{"config": {"data": 1}, "data": ' +
+                   json.dumps(self.tender) + '}')
+        doc = RawDoc.from_response(content)
+        self.assertEqual(doc['id'], self.tender['id'])
+        self.assertEqual(json.loads(doc.body), self.tender)
+
+        # Couchdb fields are spliced in
+        doc['_id'] = doc['id']
+        doc['_rev'] = '1-' + uuid.uuid4().hex
+        doc['doc_type'] = 'Tender'
+        stored = json.loads(doc.dumps())
+        self.assertEqual(stored, dict(self.tender, _id=doc['id'],
+                                      _rev=doc['_rev'], doc_type='Tender'))
+
+        empty = RawDoc('{ }')
+        empty['doc_type'] = 'Tender'
+        self.assertEqual(json.loads(empty.dumps()), {'doc_type': 'Tender'})
+
+    def test_post_bulk_docs(self):
+        session = Session(retry_delays=range(10))
+        db = Database('http://127.0.0.1:5984/public', session=session)
+        with patch.object(Resource, 'post_json',
+                          autospec=True) as mocked_post_json:
+            mocked_post_json.return_value = (201, {}, [])
+            post_bulk_docs(db, BulkDocsBody([]))
+            post_bulk_docs(db, BulkDocsBody([]))
+        first, second = [args[0][0] for args in
+                         mocked_post_json.call_args_list]
+        self.assertEqual(first.url, 'http://127.0.0.1:5984/public/_bulk_docs')
+        # Streamed body isn't resent on socket errors
+        self.assertEqual(first.session.retry_delays, [])
+        self.assertIs(first.session, second.session)
+        self.assertEqual(db.resource.session, session)
+
+    def test_update_raw(self):
+        docs = [RawDoc(json.dumps(self.tender), id=self.tender['id']),
+                RawDoc('{"id": "b"}', id='b'), RawDoc('{"id": "c"}', id='c')]
+        db = MagicMock()
+        db.resource.return_value.post_json.return_value = (201, {}, [
+            {'id': self.tender['id'], 'rev': '1-a'},
+            {'id': 'b', 'error': 'conflict', 'reason': 'Document update '
+                                                       'conflict.'},
+            {'id': 'c', 'error': 'forbidden',
+             'reason': u'New doc with oldest dateModified.'}
+        ])
+        results = update_raw(db, docs)
+        body = db.resource.return_value.post_json.call_args[1]['body'].read()
+        self.assertEqual(json.loads(body),
+                         {'docs': [self.tender, {'id': 'b'}, {'id': 'c'}]})
+        self.assertEqual(results[0], (True, self.tender['id'], '1-a'))
+        self.assertEqual(results[1][:2], (False, 'b'))
+        self.assertIsInstance(results[1][2], ResourceConflict)
+        self.assertEqual(results[2][2].message,
+                         u'New doc with oldest dateModified.')
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestRawDoc))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
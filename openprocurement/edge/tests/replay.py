@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+import unittest
+from itertools import islice
+from json import dumps
+from mock import patch
+from openprocurement_client.exceptions import (
+    RequestFailed,
+    ResourceNotFound
+)
+from openprocurement.edge.replay import (
+    ReplayAdapter,
+    ReplayClient,
+    ReplayClock,
+    ReplayFeeder
+)
+
+
+class FakeCapture(object):
+
+    resource = 'tenders'
+
+    def __init__(self, pages=(), items=None):
+        self.pages = list(pages)
+        self.items = items or {}
+
+
+def item_response(item_id, status=200, etag=None, t=100.0, duration=0.5):
+    headers = {'ETag': etag} if etag else {}
+    body = dumps({'data': {'id': item_id}}) if status == 200 else ''
+    return {'t': t, 'status': status, 'headers': headers,
+            'duration': duration}, body
+
+
+class TestReplay(unittest.TestCase):
+
+    url = 'http://api/api/2.3/tenders/'
+
+    def client(self, items, speed=0):
+        adapter = ReplayAdapter(FakeCapture(items=items),
+                                ReplayClock(100.0, speed))
+        return ReplayClient(adapter, 'tenders', 'http://api', '2.3')
+
+    def test_item_responses_in_order(self):
+        client = self.client({'a': [item_response('a', 429),
+                                    item_response('a', etag='W/"2"')]})
+        with self.assertRaises(RequestFailed) as context:
+            client.request('GET', self.url + 'a')
+        self.assertEqual(context.exception.status_code, 429)
+        self.assertEqual(client._get_resource_item(self.url + 'a').data.id,
+                         'a')
+        # The last response is repeated
+        response = client.request('GET', self.url + 'a')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['ETag'], 'W/"2"')
+        response = client.request('GET', self.url + 'a',
+                                  headers={'If-None-Match': 'W/"2"'})
+        self.assertEqual(response.status_code, 304)
+        with self.assertRaises(ResourceNotFound):
+            client.request('GET', self.url + 'unknown')
+
+    def test_renew_cookies(self):
+        client = self.client({})
+        client.renew_cookies()
+
+    @patch('openprocurement.edge.replay.sleep')
+    def test_latency(self, mocked_sleep):
+        client = self.client({'a': [item_response('a', duration=0.5)]},
+                             speed=2)
+        client.request('GET', self.url + 'a')
+        mocked_sleep.assert_called_once_with(0.25)
+
+    @patch('openprocurement.edge.replay.time')
+    @patch('openprocurement.edge.replay.sleep')
+    def test_feeder(self, mocked_sleep, mocked_time):
+        mocked_time.return_value = 1000.0
+        pages = [(100.0, 1000, [{'id': 'a'}, {'id': 'b'}]),
+                 (104.0, 1, [{'id': 'c'}])]
+        feeder = ReplayFeeder(FakeCapture(pages), ReplayClock(100.0, 2))
+        items = feeder.get_resource_items()
+        self.assertEqual(list(islice(items, 3)), [
+            (1000, {'id': 'a'}), (1000, {'id': 'b'}), (1, {'id': 'c'})])
+        self.assertEqual(mocked_sleep.call_args_list[-1][0], (2.0,))
+        self.assertFalse(feeder.finished.is_set())
+
+        feeder = ReplayFeeder(FakeCapture(pages), ReplayClock(100.0, 0))
+        mocked_sleep.reset_mock()
+        with patch('openprocurement.edge.replay.Event.wait'):
+            self.assertEqual(len(list(feeder.get_resource_items())), 3)
+        self.assertTrue(feeder.finished.is_set())
+        self.assertEqual(mocked_sleep.call_count, 0)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestReplay))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
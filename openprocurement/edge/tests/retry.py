@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+import unittest
+import uuid
+from email.utils import formatdate
+from time import time
+from gevent import sleep
+from munch import munchify
+from openprocurement.edge.queues import IndexedPriorityQueue
+from openprocurement.edge.retry import (
+    RetryScheduler,
+    parse_retry_after,
+    retry_delay
+)
+
+
+class TestRetryHelpers(unittest.TestCase):
+
+    def test_retry_delay(self):
+        self.assertEqual(retry_delay(0, 3, 300), 0)
+        self.assertEqual([retry_delay(n, 3, 300) for n in xrange(1, 5)],
+                         [3, 6, 12, 24])
+        self.assertEqual(retry_delay(10, 3, 300), 300)
+        for i in xrange(0, 100):
+            delay = retry_delay(2, 3, 300, 0.5)
+            self.assertGreaterEqual(delay, 3)
+            self.assertLessEqual(delay, 6)
+
+    def test_parse_retry_after(self):
+        self.assertEqual(
+            parse_retry_after(munchify({'headers': {'Retry-After': '2.5'}})),
+            2.5)
+        self.assertEqual(
+            parse_retry_after(munchify({'headers': {'Retry-After': '-1'}})), 0)
+        self.assertEqual(
+            parse_retry_after(munchify({'headers': {'Retry-After': 'bad'}})),
+            0)
+        http_date = formatdate(time() + 60, usegmt=True)
+        delay = parse_retry_after(
+            munchify({'headers': {'Retry-After': http_date}}))
+        self.assertGreater(delay, 55)
+        self.assertLessEqual(delay, 60)
+        self.assertEqual(parse_retry_after(munchify({})), 0)
+
+
+class TestRetryScheduler(unittest.TestCase):
+
+    def test_schedule(self):
+        queue = IndexedPriorityQueue()
+        scheduler = RetryScheduler(queue)
+        id_1 = uuid.uuid4().hex
+        id_2 = uuid.uuid4().hex
+        id_3 = uuid.uuid4().hex
+
+        # Without delay item goes to the queue at once
+        scheduler.schedule((1001, id_1))
+        self.assertEqual(queue.get(timeout=0), (1001, id_1))
+        self.assertEqual(scheduler.started, False)
+
+        scheduler.schedule((1002, id_2), 0.2)
+        scheduler.schedule((1003, id_3), 0.05)
+        self.assertEqual(scheduler.pending(), 2)
+        self.assertEqual(queue.qsize(), 0)
+        sleep(0.1)
+        self.assertEqual(scheduler.pending(), 1)
+        self.assertEqual(queue.get(timeout=0), (1003, id_3))
+        sleep(0.15)
+        self.assertEqual(scheduler.pending(), 0)
+        self.assertEqual(queue.get(timeout=0), (1002, id_2))
+
+        scheduler.shutdown()
+        scheduler.join(timeout=1)
+        self.assertEqual(scheduler.dead, True)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestRetryHelpers))
+    suite.addTest(unittest.makeSuite(TestRetryScheduler))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+import json
+import unittest
+import uuid
+from couchdb.client import Row
+from couchdb.http import ResourceConflict
+from mock import MagicMock
+from openprocurement.edge.raw import RawDoc
+from openprocurement.edge.revs import (
+    CONFLICTS_VIEW,
+    deterministic_rev,
+    prune_conflicts,
+    update_deterministic
+)
+
+
+class TestRevs(unittest.TestCase):
+
+    def setUp(self):
+        self.tender = {
+            'id': uuid.uuid4().hex,
+            'dateModified': '2017-05-02T12:34:56.123456+03:00',
+            'title': u'Тендер'
+        }
+
+    def test_deterministic_rev(self):
+        rev = deterministic_rev(self.tender)
+        position, rev_id = rev.split('-')
+        self.assertEqual(position, '1493717696123456')
+        self.assertEqual(len(rev_id), 32)
+        # Couchdb fields don't change it, the same raw version gets it too
+        self.assertEqual(deterministic_rev(dict(self.tender, _rev='1-a',
+                                                doc_type='Tender')), rev)
+        self.assertEqual(deterministic_rev(RawDoc.from_doc(self.tender)),
+                         deterministic_rev(RawDoc.from_doc(self.tender)))
+        self.assertNotEqual(deterministic_rev(dict(self.tender, title='x')),
+                            rev)
+        newer = deterministic_rev(dict(
+            self.tender, dateModified='2017-05-02T12:34:56.123457+03:00'))
+        self.assertGreater(int(newer.split('-')[0]), int(position))
+
+    def test_update_deterministic(self):
+        docs = [dict(self.tender, _rev='3-a'), RawDoc('{"id": "b"}', id='b',
+                                                       dateModified='2017')]
+        db = MagicMock()
+        db.resource.return_value.post_json.return_value = (201, {}, [
+            {'id': 'b', 'error': 'conflict', 'reason': 'Conflict.'}])
+        results = update_deterministic(db, docs)
+        body = json.loads(db.resource.return_value.post_json.call_args[1]['body'].read())
+        self.assertEqual(body['new_edits'], False)
+        self.assertEqual(body['docs'][0]['_rev'],
+                         deterministic_rev(self.tender))
+        self.assertEqual(results[0], (True, self.tender['id'],
+                                      deterministic_rev(self.tender)))
+        self.assertEqual(results[1][:2], (False, 'b'))
+        self.assertIsInstance(results[1][2], ResourceConflict)
+
+    def test_update_deterministic_stored(self):
+        db = MagicMock()
+        db.resource.return_value.post_json.return_value = (201, {}, [])
+        stored_rev = '1493717696123455-' + 'a' * 32
+        doc = dict(self.tender)
+        results = update_deterministic(db, [doc], {doc['id']: stored_rev})
+        body = json.loads(
+            db.resource.return_value.post_json.call_args[1]['body'].read())
+        rev = body['docs'][0]['_rev']
+        self.assertEqual(rev, deterministic_rev(self.tender, stored_rev))
+        self.assertEqual(rev.split('-')[0], '1493717696123456')
+        # Child of the stored revision instead of a conflicting root
+        self.assertEqual(body['docs'][0]['_revisions'], {
+            'start': 1493717696123456, 'ids': [rev.split('-')[1], 'a' * 32]})
+        self.assertEqual(results, [(True, doc['id'], rev)])
+
+        # The stored version is written as is
+        update_deterministic(db, [doc], {doc['id']: rev})
+        body = json.loads(
+            db.resource.return_value.post_json.call_args[1]['body'].read())
+        self.assertEqual(body['docs'][0]['_rev'], rev)
+        self.assertNotIn('_revisions', body['docs'][0])
+
+    def test_prune_conflicts(self):
+        db = MagicMock()
+        db.view.return_value = [
+            Row(id='a', key='Tender', value=['9-w', '5-l', '7-l']),
+            Row(id='b', key='Tender', value=['3-w', '2-l'])]
+        db.update.return_value = [(True, 'a', '6-t'), (True, 'a', '8-t'),
+                                  (False, 'b', ResourceConflict())]
+        self.assertEqual(prune_conflicts(db, 'Tender', 10), 2)
+        db.view.assert_called_once_with(CONFLICTS_VIEW, key='Tender',
+                                        limit=10)
+        self.assertEqual(db.update.call_args[0][0], [
+            {'_id': 'a', '_rev': '5-l', '_deleted': True},
+            {'_id': 'a', '_rev': '7-l', '_deleted': True},
+            {'_id': 'b', '_rev': '2-l', '_deleted': True}])
+
+        # Nothing to prune
+        db.reset_mock()
+        db.view.return_value = []
+        self.assertEqual(prune_conflicts(db, 'Tender'), 0)
+        self.assertEqual(db.update.call_count, 0)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestRevs))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
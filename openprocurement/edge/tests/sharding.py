@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+import socket
+import unittest
+import uuid
+from gevent import spawn
+from mock import MagicMock
+from openprocurement.edge.sharding import (
+    RemoteDateModifiedIndex,
+    RemoteJournal,
+    ShardConnection,
+    ShardEdgeDataBridge,
+    ShardRouter
+)
+
+
+class TestShardConnection(unittest.TestCase):
+
+    def setUp(self):
+        left, right = socket.socketpair()
+        self.left = ShardConnection(left)
+        self.right = ShardConnection(right)
+
+    def tearDown(self):
+        self.left.close()
+        self.right.close()
+
+    def test_send_iter(self):
+        item_id = uuid.uuid4().hex
+        self.left.send('1', item_id)
+        self.left.send('1000', item_id)
+        self.left.close()
+        self.assertEqual(list(self.right), [['1', item_id],
+                                            ['1000', item_id]])
+
+    def test_remote_date_modified_index(self):
+        index = RemoteDateModifiedIndex(self.left)
+        item_id = uuid.uuid4().hex
+        date_modified = '2017-05-02T12:34:56.123456+03:00'
+        index.set(item_id, date_modified)
+        self.left.close()
+        self.assertEqual(list(self.right), [[item_id, date_modified]])
+
+    def test_shutdown(self):
+        self.left.shutdown()
+        self.assertEqual(list(self.right), [])
+        # Other direction still works
+        self.right.send('a', '-')
+        self.right.close()
+        self.assertEqual(list(self.left), [['a', '-']])
+
+    def test_remote_journal(self):
+        journal = RemoteJournal(self.left)
+        item_id = uuid.uuid4().hex
+        date_modified = '2017-05-02T12:34:56.123456+03:00'
+        journal.add(item_id, 1001)
+        journal.discard(item_id, date_modified)
+        journal.discard(item_id)
+        self.left.close()
+        self.assertEqual(list(self.right), [[item_id, date_modified],
+                                            [item_id, '-']])
+
+
+class TestShardRouter(unittest.TestCase):
+
+    def test_put(self):
+        connections = [MagicMock(), MagicMock(), MagicMock()]
+        router = ShardRouter(connections)
+        ids = [uuid.uuid4().hex for i in xrange(0, 30)]
+        for item_id in ids:
+            router.put((1, item_id))
+            shard = router.shard_for(item_id)
+            self.assertEqual(shard, router.shard_for(item_id))
+            connections[shard].send.assert_called_with('1', item_id)
+        self.assertEqual(sum(c.send.call_count for c in connections), 30)
+        # Dedup is done by shard queues
+        self.assertNotIn(ids[0], router)
+
+    def test_put_over_socket(self):
+        pairs = [socket.socketpair() for i in xrange(0, 2)]
+        router = ShardRouter([ShardConnection(pair[0]) for pair in pairs])
+        shards = [ShardConnection(pair[1]) for pair in pairs]
+        readers = [spawn(list, shard) for shard in shards]
+        ids = [uuid.uuid4().hex for i in xrange(0, 10)]
+        for item_id in ids:
+            router.put((1000, item_id))
+        for connection in router.connections:
+            connection.close()
+        received = [reader.get() for reader in readers]
+        self.assertEqual(sum(len(r) for r in received), 10)
+        for shard, lines in enumerate(received):
+            for priority, item_id in lines:
+                self.assertEqual(priority, '1000')
+                self.assertEqual(router.shard_for(item_id), shard)
+        for shard in shards:
+            shard.close()
+
+
+class TestShardEdgeDataBridge(unittest.TestCase):
+
+    def test_create_rate_controller(self):
+        # Only the rate settings of the bridge are needed
+        bridge = ShardEdgeDataBridge.__new__(ShardEdgeDataBridge)
+        bridge.shards = 4
+        bridge.rate_initial = 10
+        bridge.rate_min = 1
+        bridge.rate_max = 100
+        bridge.rate_increase = 1
+        bridge.rate_decrease = 0.5
+        bridge.rate_latency_threshold = None
+        controller = bridge.create_rate_controller()
+        self.assertEqual(controller.rate, 2.5)
+        self.assertEqual(controller.min_rate, 0.25)
+        self.assertEqual(controller.max_rate, 25)
+        self.assertEqual(controller.increase, 0.25)
+        self.assertEqual(controller.decrease, 0.5)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(TestShardConnection))
+    suite.addTest(unittest.makeSuite(TestShardRouter))
+    suite.addTest(unittest.makeSuite(TestShardEdgeDataBridge))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
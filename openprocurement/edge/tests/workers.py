@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 import datetime
+import json
 import unittest
 import uuid
 import logging
@@ -14,13 +15,34 @@ from openprocurement_client.exceptions import (
     ResourceNotFound as RNF,
     ResourceGone
 )
-from openprocurement.edge.workers import ResourceItemWorker
+from openprocurement.edge.cache import EtagCache, FingerprintCache, RevCache
+from openprocurement.edge.index import DateModifiedIndex, date_to_microseconds
+from openprocurement.edge.inflight import InFlight
+from openprocurement.edge.metrics import RollingHistogram
+from openprocurement.edge.raw import RawDoc
+from openprocurement.edge.revs import deterministic_rev
+from openprocurement.edge.workers import BulkWriter, ResourceItemWorker
 from openprocurement.edge.workers import logger
 from openprocurement.edge.utils import TZ
 
 logger.setLevel(logging.DEBUG)
 
 
+class LogRecords(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+    def pop(self):
+        records, self.records = self.records, []
+        return [(record.getMessage(), getattr(record, 'MESSAGE_ID', None))
+                for record in records]
+
+
 class TestResourceItemWorker(unittest.TestCase):
 
     worker_config = {
@@ -30,10 +52,13 @@ class TestResourceItemWorker(unittest.TestCase):
         'drop_threshold_client_cookies': 1.5,
         'worker_sleep': 0.1,
         'retry_default_timeout': 0.5,
+        'retry_max_timeout': 5,
+        'retry_jitter': 0,
         'retries_count': 2,
         'queue_timeout': 0.3,
         'bulk_save_limit': 1,
-        'bulk_save_interval': 0.1
+        'bulk_save_interval': 0.1,
+        'raw_ingest': False
     }
 
     def tearDown(self):
@@ -45,6 +70,7 @@ class TestResourceItemWorker(unittest.TestCase):
         self.worker_config['retry_default_timeout'] = 0.01
         self.worker_config['retries_count'] = 2
         self.worker_config['queue_timeout'] = 0.03
+        self.worker_config['raw_ingest'] = False
 
     def test_init(self):
         worker = ResourceItemWorker(
@@ -87,9 +113,18 @@ class TestResourceItemWorker(unittest.TestCase):
         self.assertEqual(priority, 1001)
         self.assertEqual(retry_resource_item_id, resource_item_id)
 
+        # Retry-After is honored, worker isn't blocked
+        worker.add_to_retry_queue(
+            resource_item_id, priority, status_code=429, retry_after=0.05)
+        self.assertEqual(retry_items_queue.qsize(), 0)
+        self.assertEqual(worker.retry_scheduler.pending(), 1)
+        sleep(0.1)
+        self.assertEqual(retry_items_queue.get(timeout=0),
+                         (1001, resource_item_id))
+
         priority = 1002
         worker.add_to_retry_queue(resource_item_id, priority=priority)
-        sleep(worker.config['retry_default_timeout'] * 2)
+        sleep(worker.config['retry_default_timeout'] * 3)
         self.assertEqual(retry_items_queue.qsize(), 1)
         priority, retry_resource_item_id = retry_items_queue.get()
         self.assertEqual(priority, 1003)
@@ -105,6 +140,22 @@ class TestResourceItemWorker(unittest.TestCase):
             ),
             extra={'MESSAGE_ID': 'dropped_documents'}
         )
+
+        # Dropped item becomes a dead letter
+        worker.dead_letters = MagicMock()
+        worker.add_to_retry_queue(resource_item_id, priority=priority,
+                                  status_code=503, error='Unavailable')
+        worker.dead_letters.put.assert_called_once_with(
+            resource_item_id, priority, 503, 'Unavailable')
+        # Dead letters leave the journal
+        worker.journal = MagicMock()
+        worker.add_to_retry_queue(resource_item_id, priority=priority)
+        worker.journal.discard.assert_called_once_with(resource_item_id)
+        # Store errors don't break the worker and the id stays journaled
+        worker.dead_letters.put.side_effect = Exception('db is down')
+        worker.add_to_retry_queue(resource_item_id, priority=priority)
+        self.assertEqual(mocked_logger.error.call_count, 1)
+        self.assertEqual(worker.journal.discard.call_count, 1)
         del worker
 
     def test__get_api_client_dict(self):
@@ -187,6 +238,15 @@ class TestResourceItemWorker(unittest.TestCase):
         self.assertEqual(priority, None)
         del worker
 
+    def test__get_resource_item_url(self):
+        api_client = MagicMock(host_url='https://lb.api-sandbox.org',
+                               api_version='2.3')
+        worker = ResourceItemWorker(config_dict=dict(self.worker_config,
+                                                     resource='plans'))
+        self.assertEqual(
+            worker._get_resource_item_url(api_client, 'abc'),
+            'https://lb.api-sandbox.org/api/2.3/plans/abc')
+
     @patch('openprocurement_client.client.TendersClient')
     def test__get_resource_item_from_public(self, mock_api_client):
         resource_item_id = uuid.uuid4().hex
@@ -200,7 +260,8 @@ class TestResourceItemWorker(unittest.TestCase):
         }
         api_clients_queue.put(client_dict)
         api_clients_info =\
-            {client_dict['id']: {'drop_cookies': False, 'request_durations': {}}}
+            {client_dict['id']: {'drop_cookies': False,
+                                 'request_durations': RollingHistogram()}}
         retry_queue = PriorityQueue()
         return_dict = {
             'data': {
@@ -208,7 +269,7 @@ class TestResourceItemWorker(unittest.TestCase):
                 'dateModified': datetime.datetime.utcnow().isoformat()
             }
         }
-        mock_api_client.get_resource_item.return_value = return_dict
+        mock_api_client._get_resource_item.return_value = return_dict
         worker = ResourceItemWorker(api_clients_queue=api_clients_queue,
                                     config_dict=self.worker_config,
                                     retry_resource_items_queue=retry_queue,
@@ -239,7 +300,7 @@ class TestResourceItemWorker(unittest.TestCase):
         # self.assertEqual(worker.api_clients_queue.qsize(), 1)
 
         # InvalidResponse
-        mock_api_client.get_resource_item.side_effect =\
+        mock_api_client._get_resource_item.side_effect =\
             InvalidResponse('invalid response')
         api_client = worker._get_api_client_dict()
         self.assertEqual(worker.api_clients_queue.qsize(), 0)
@@ -247,12 +308,12 @@ class TestResourceItemWorker(unittest.TestCase):
             api_client, priority, resource_item_id
         )
         self.assertEqual(public_item, None)
-        sleep(worker.config['retry_default_timeout'] * 1)
+        sleep(worker.config['retry_default_timeout'] * 2)
         self.assertEqual(worker.retry_resource_items_queue.qsize(), 1)
         self.assertEqual(worker.api_clients_queue.qsize(), 1)
 
         # RequestFailed status_code=429
-        mock_api_client.get_resource_item.side_effect = RequestFailed(
+        mock_api_client._get_resource_item.side_effect = RequestFailed(
             munchify({'status_code': 429}))
         api_client = worker._get_api_client_dict()
         self.assertEqual(worker.api_clients_queue.qsize(), 0)
@@ -282,7 +343,7 @@ class TestResourceItemWorker(unittest.TestCase):
         self.assertEqual(worker.retry_resource_items_queue.qsize(), 3)
 
         # RequestFailed with status_code not equal 429
-        mock_api_client.get_resource_item.side_effect = RequestFailed(
+        mock_api_client._get_resource_item.side_effect = RequestFailed(
             munchify({'status_code': 404}))
         api_client = worker._get_api_client_dict()
         self.assertEqual(worker.api_clients_queue.qsize(), 0)
@@ -296,7 +357,7 @@ class TestResourceItemWorker(unittest.TestCase):
         self.assertEqual(worker.retry_resource_items_queue.qsize(), 4)
 
         # ResourceNotFound
-        mock_api_client.get_resource_item.side_effect = RNF(
+        mock_api_client._get_resource_item.side_effect = RNF(
             munchify({'status_code': 404}))
         api_client = worker._get_api_client_dict()
         self.assertEqual(worker.api_clients_queue.qsize(), 0)
@@ -310,7 +371,7 @@ class TestResourceItemWorker(unittest.TestCase):
         self.assertEqual(worker.retry_resource_items_queue.qsize(), 5)
 
         # ResourceGone
-        mock_api_client.get_resource_item.side_effect = ResourceGone(munchify(
+        mock_api_client._get_resource_item.side_effect = ResourceGone(munchify(
             {'status_code': 410}
         ))
         api_client = worker._get_api_client_dict()
@@ -326,7 +387,7 @@ class TestResourceItemWorker(unittest.TestCase):
 
         # Exception
         api_client = worker._get_api_client_dict()
-        mock_api_client.get_resource_item.side_effect =\
+        mock_api_client._get_resource_item.side_effect =\
             Exception('text except')
         public_item = worker._get_resource_item_from_public(
             api_client, priority, resource_item_id
@@ -338,6 +399,53 @@ class TestResourceItemWorker(unittest.TestCase):
 
         del worker
 
+    @patch('openprocurement_client.client.TendersClient')
+    def test__get_resource_item_from_public_with_rate_controller(
+            self, mock_api_client):
+        resource_item_id = uuid.uuid4().hex
+        api_clients_queue = Queue()
+        client_dict = {
+            'id': uuid.uuid4().hex,
+            'request_interval': 0,
+            'client': mock_api_client
+        }
+        api_clients_info =\
+            {client_dict['id']: {'drop_cookies': False,
+                                 'request_durations': RollingHistogram()}}
+        retry_scheduler = MagicMock()
+        rate_controller = MagicMock()
+        rate_controller.rate = 5
+        return_dict = {'data': {
+            'id': resource_item_id,
+            'dateModified': datetime.datetime.utcnow().isoformat()
+        }}
+        mock_api_client._get_resource_item.return_value = return_dict
+        worker = ResourceItemWorker(api_clients_queue=api_clients_queue,
+                                    config_dict=self.worker_config,
+                                    retry_resource_items_queue=PriorityQueue(),
+                                    api_clients_info=api_clients_info,
+                                    retry_scheduler=retry_scheduler,
+                                    rate_controller=rate_controller)
+
+        public_item = worker._get_resource_item_from_public(
+            client_dict, 1, resource_item_id)
+        self.assertEqual(public_item, return_dict['data'])
+        self.assertEqual(rate_controller.acquire.call_count, 1)
+        self.assertEqual(rate_controller.on_success.call_count, 1)
+
+        # 429 slows down all clients instead of this one
+        mock_api_client._get_resource_item.side_effect = RequestFailed(
+            munchify({'status_code': 429, 'headers': {'Retry-After': '3'}}))
+        api_client = worker._get_api_client_dict()
+        public_item = worker._get_resource_item_from_public(
+            api_client, 1, resource_item_id)
+        self.assertEqual(public_item, None)
+        rate_controller.on_throttle.assert_called_once_with(3.0)
+        self.assertEqual(api_client['request_interval'], 0)
+        self.assertEqual(worker.api_clients_queue.qsize(), 1)
+        retry_scheduler.schedule.assert_called_once_with(
+            (1, resource_item_id), 3.0)
+
     def test__add_to_bulk(self):
         retry_queue = PriorityQueue()
         old_date_modified = datetime.datetime.utcnow().isoformat()
@@ -420,10 +528,20 @@ class TestResourceItemWorker(unittest.TestCase):
         worker.db.update.return_value = update_return_value
 
         # Test success response from couchdb
+        records = LogRecords()
+        logger.addHandler(records)
+        self.addCleanup(logger.removeHandler, records)
         worker._save_bulk_docs()
         sleep(0.1)
         self.assertEqual(len(worker.bulk), 0)
         self.assertEqual(worker.retry_resource_items_queue.qsize(), 1)
+        # One summary of the bulk
+        summary = [record for record in records.records
+                   if getattr(record, 'MESSAGE_ID', None) == 'save_bulk']
+        self.assertEqual(len(summary), 1)
+        self.assertEqual(summary[0].SAVE_BULK_LEN, 4)
+        self.assertIn(': 1 created, 1 updated, 0 written, 0 unchanged, '
+                      '1 ignored, 1 failed', summary[0].getMessage())
 
         # Test failed response from couchdb
         worker.db.update.side_effect = Exception('Some exceptions')
@@ -442,6 +560,158 @@ class TestResourceItemWorker(unittest.TestCase):
         self.assertEqual(worker.retry_resource_items_queue.qsize(), 5)
         self.assertEqual(len(worker.bulk), 0)
 
+        # Test dateModified index update
+        worker.date_modified_index = DateModifiedIndex()
+        worker.db.update.side_effect = None
+        for doc_id in (doc_id_1, doc_id_2, doc_id_3, doc_id_4):
+            worker.priority_cache[doc_id] = 1
+        worker.db.update.return_value = update_return_value
+        worker.bulk = {
+            doc_id_1: {'id': doc_id_1, 'dateModified': date_modified},
+            doc_id_2: {'id': doc_id_2, 'dateModified': date_modified},
+            doc_id_3: {'id': doc_id_3, 'dateModified': date_modified},
+            doc_id_4: {'id': doc_id_4, 'dateModified': date_modified}
+        }
+        saved_ids = set()
+        worker.on_saved = saved_ids.add
+        worker._save_bulk_docs()
+        # Saved and ignored docs are reported, failed ones aren't
+        self.assertEqual(saved_ids, {doc_id_1, doc_id_2, doc_id_3})
+        self.assertEqual(worker.date_modified_index.is_actual(
+            doc_id_1, date_modified), True)
+        self.assertEqual(worker.date_modified_index.is_actual(
+            doc_id_2, date_modified), True)
+        self.assertEqual(worker.date_modified_index.get(doc_id_3), None)
+        self.assertEqual(worker.date_modified_index.get(doc_id_4), None)
+
+    @patch('openprocurement.edge.workers.ResourceItemWorker.'
+           '_get_resource_item_from_public')
+    def test__run_with_bulk_writer(self, mock_get_from_public):
+        queue = Queue()
+        api_clients_queue = Queue()
+        api_clients_queue.put({'id': uuid.uuid4().hex, 'client': MagicMock(),
+                               'request_interval': 0})
+        queue_item = (1, uuid.uuid4().hex)
+        queue.put(queue_item)
+        doc = {'id': queue_item[1],
+               'dateModified': datetime.datetime.utcnow().isoformat()}
+        mock_get_from_public.return_value = doc
+        bulk_writer = MagicMock()
+        db = MagicMock()
+        worker = ResourceItemWorker(
+            api_clients_queue=api_clients_queue, resource_items_queue=queue,
+            db=db, api_clients_info=MagicMock(),
+            config_dict=self.worker_config, bulk_writer=bulk_writer,
+            rev_cache=RevCache())
+        worker.exit = MagicMock()
+        worker.exit.__nonzero__.side_effect = [False, True]
+        worker._run()
+        bulk_writer.put.assert_called_once_with(None, doc, 1)
+        self.assertEqual(worker.bulk, {})
+        # _rev is resolved by the bulk writer
+        self.assertEqual(db.get.called, False)
+
+    @patch('openprocurement.edge.workers.ResourceItemWorker.'
+           '_get_resource_item_from_public')
+    def test__run_with_in_flight(self, mock_get_from_public):
+        queue = Queue()
+        api_clients_queue = Queue()
+        api_client_dict = {'id': uuid.uuid4().hex, 'client': MagicMock(),
+                           'request_interval': 0}
+        api_clients_queue.put(api_client_dict)
+        item_id = uuid.uuid4().hex
+        in_flight = InFlight()
+        bulk_writer = MagicMock()
+        worker = ResourceItemWorker(
+            api_clients_queue=api_clients_queue, resource_items_queue=queue,
+            db=MagicMock(), api_clients_info=MagicMock(),
+            config_dict=self.worker_config, bulk_writer=bulk_writer,
+            rev_cache=RevCache(), in_flight=in_flight)
+        worker.exit = MagicMock()
+
+        # Fetched by another worker
+        in_flight.start(item_id)
+        queue.put((1, item_id))
+        worker.exit.__nonzero__.side_effect = [False, True]
+        worker._run()
+        self.assertEqual(mock_get_from_public.call_count, 0)
+        self.assertEqual(api_clients_queue.qsize(), 1)
+        self.assertEqual(in_flight.coalesced, 1)
+        in_flight.finish(item_id)
+
+        # Newer version is reported by the feed during the fetch
+        doc = {'id': item_id, 'dateModified': '2017-01-01T00:00:00+02:00'}
+
+        def get_from_public(*args):
+            self.assertIn(item_id, in_flight)
+            in_flight.note(item_id, '2017-01-02T00:00:00+02:00')
+            return doc
+        mock_get_from_public.side_effect = get_from_public
+        # The id is released only after the doc is handed over
+        bulk_writer.put.side_effect = \
+            lambda *args: self.assertIn(item_id, in_flight)
+        queue.put((1001, item_id))
+        worker.exit.__nonzero__.side_effect = [False, True]
+        worker._run()
+        bulk_writer.put.assert_called_once_with(None, doc, 1001)
+        self.assertNotIn(item_id, in_flight)
+        self.assertEqual(queue.get_nowait(), (1001, item_id))
+
+        # Newest version is fetched, the mocked fetch kept the client
+        api_clients_queue.put(api_client_dict)
+        worker.exit.__nonzero__.side_effect = [False, True]
+        queue.put((1, item_id))
+        mock_get_from_public.side_effect = None
+        mock_get_from_public.return_value = None
+        worker._run()
+        self.assertEqual(queue.qsize(), 0)
+        self.assertEqual(len(in_flight), 0)
+
+    def test__request_resource_item(self):
+        self.worker_config['raw_ingest'] = True
+        worker = ResourceItemWorker(config_dict=self.worker_config)
+        api_client = MagicMock()
+        doc_id = uuid.uuid4().hex
+        content = ('{"data": {"id": "%s", "dateModified": '
+                   '"2017-05-02T12:34:56+03:00"}}' % doc_id)
+        api_client.request.return_value = munchify({
+            'status_code': 200, 'content': content, 'text': content,
+            'headers': {'ETag': 'W/"1"'}})
+        doc = worker._request_resource_item(api_client, 'url', doc_id)
+        api_client.request.assert_called_once_with('GET', 'url', headers={})
+        self.assertEqual(doc['id'], doc_id)
+        self.assertEqual(doc['dateModified'], '2017-05-02T12:34:56+03:00')
+        self.assertEqual(doc.body, '{"id": "%s", "dateModified": '
+                                   '"2017-05-02T12:34:56+03:00"}' % doc_id)
+
+        api_client.request.return_value = munchify({'status_code': 204,
+                                                    'content': '',
+                                                    'headers': {}})
+        with self.assertRaises(InvalidResponse):
+            worker._request_resource_item(api_client, 'url', doc_id)
+
+        # Conditional GET with ETag of the saved doc
+        self.worker_config['raw_ingest'] = False
+        worker.etag_cache = EtagCache()
+        api_client.request.return_value = munchify({
+            'status_code': 200, 'content': content, 'text': content,
+            'headers': {'ETag': 'W/"1"'}})
+        doc = worker._request_resource_item(api_client, 'url', doc_id)
+        self.assertEqual(doc, {'id': doc_id,
+                               'dateModified': '2017-05-02T12:34:56+03:00'})
+        # ETag isn't used until the doc is saved
+        self.assertEqual(worker.etag_cache.get(doc_id), None)
+        worker.etag_cache.commit(doc_id, '2017-05-02T12:34:56+03:00')
+        api_client.request.return_value = munchify({
+            'status_code': 304, 'content': '', 'headers': {}})
+        api_client.request.reset_mock()
+        self.assertEqual(
+            worker._request_resource_item(api_client, 'url', doc_id), None)
+        api_client.request.assert_called_once_with(
+            'GET', 'url', headers={'If-None-Match': 'W/"1"'})
+        self.assertEqual(worker.etag_cache.not_modified, 1)
+        self.assertEqual(worker.etag_cache.bytes_saved, len(content))
+
     def test_shutdown(self):
         worker = ResourceItemWorker(
             'api_clients_queue', 'resource_items_queue', 'db',
@@ -466,8 +736,10 @@ class TestResourceItemWorker(unittest.TestCase):
            '_save_bulk_docs')
     @patch('openprocurement.edge.workers.ResourceItemWorker.'
            '_get_resource_item_from_public')
-    @patch('openprocurement.edge.workers.logger')
-    def test__run(self, mocked_logger, mock_get_from_public, mocked_save_bulk):
+    def test__run(self, mock_get_from_public, mocked_save_bulk):
+        records = LogRecords()
+        logger.addHandler(records)
+        self.addCleanup(logger.removeHandler, records)
         self.queue = Queue()
         self.retry_queue = Queue()
         self.api_clients_queue = Queue()
@@ -487,7 +759,7 @@ class TestResourceItemWorker(unittest.TestCase):
         client.session.headers = {'User-Agent': 'Test-Agent'}
         self.api_clients_info = {
             api_client_dict['id']: {
-                'drop_cookies': False, 'request_durations': []
+                'drop_cookies': False, 'request_durations': RollingHistogram()
             }
         }
         self.db = MagicMock()
@@ -500,58 +772,39 @@ class TestResourceItemWorker(unittest.TestCase):
         )
         worker.exit = MagicMock()
         worker.exit.__nonzero__.side_effect = [False, True]
+        get_client = (
+            'GET API CLIENT: {} Test-Agent with requests interval: 0'.format(
+                api_client_dict['id']), 'get_client')
+        put_client = ('PUT API CLIENT: {}'.format(api_client_dict['id']),
+                      'put_client')
+        get_item = ('Get tender {} from main queue.'.format(doc['id']),
+                    'get_from_queue')
 
         # Try get api client from clients queue
         self.assertEqual(self.queue.qsize(), 0)
         worker._run()
         self.assertEqual(self.queue.qsize(), 0)
-        mocked_logger.debug.assert_called_once_with(
-            'API clients queue is empty.')
+        self.assertEqual(records.pop(),
+                         [('API clients queue is empty.', None)])
 
         # Try get item from resource items queue
         self.api_clients_queue.put(api_client_dict)
         worker.exit.__nonzero__.side_effect = [False, True]
         worker._run()
-        self.assertEqual(
-            mocked_logger.debug.call_args_list[1:],
-            [
-                call(
-                    'GET API CLIENT: {} {} with requests interval: {}'.format(
-                        api_client_dict['id'],
-                        api_client_dict['client'].session.headers['User-Agent'],
-                        api_client_dict['request_interval']
-                    ),
-                     extra={'REQUESTS_TIMEOUT': 0, 'MESSAGE_ID': 'get_client'}
-                ),
-                call('PUT API CLIENT: {}'.format(api_client_dict['id']),
-                     extra={'MESSAGE_ID': 'put_client'}),
-                call('Resource items queue is empty.')
-            ]
-        )
+        self.assertEqual(records.pop(), [
+            get_client, put_client, ('Resource items queue is empty.', None)
+        ])
 
         # Try get resource item from local storage
         self.queue.put(queue_item)
         mock_get_from_public.return_value = doc
         worker.exit.__nonzero__.side_effect = [False, True]
         worker._run()
-        self.assertEqual(
-            mocked_logger.debug.call_args_list[4:],
-            [
-                call(
-                    'GET API CLIENT: {} {} with requests interval: {}'.format(
-                        api_client_dict['id'],
-                        api_client_dict['client'].session.headers['User-Agent'],
-                        api_client_dict['request_interval']
-                    ),
-                     extra={'REQUESTS_TIMEOUT': 0, 'MESSAGE_ID': 'get_client'}
-                ),
-                call('Get tender {} from main queue.'.format(doc['id'])),
-                call('Put in bulk tender {} {}'.format(doc['id'],
-                                                       doc['dateModified']),
-                     extra={'MESSAGE_ID': 'add_to_save_bulk'})
-            ]
-        )
-
+        self.assertEqual(records.pop(), [
+            get_client, get_item,
+            ('Put in bulk tender {} {}'.format(doc['id'], doc['dateModified']),
+             'add_to_save_bulk')
+        ])
 
         # Try get local_resource_item with Exception
         self.api_clients_queue.put(api_client_dict)
@@ -560,27 +813,13 @@ class TestResourceItemWorker(unittest.TestCase):
         self.db.get.side_effect = [Exception('Database Error')]
         worker.exit.__nonzero__.side_effect = [False, True]
         worker._run()
-        self.assertEqual(
-            mocked_logger.debug.call_args_list[7:],
-            [
-                call(
-                    'GET API CLIENT: {} {} with requests interval: {}'.format(
-                        api_client_dict['id'],
-                        api_client_dict['client'].session.headers['User-Agent'],
-                        api_client_dict['request_interval']
-                    ),
-                     extra={'REQUESTS_TIMEOUT': 0, 'MESSAGE_ID': 'get_client'}
-                ),
-                call('Get tender {} from main queue.'.format(doc['id'])),
-                call('PUT API CLIENT: {}'.format(api_client_dict['id']),
-                     extra={'MESSAGE_ID': 'put_client'})
-            ]
-        )
-        mocked_logger.error.assert_called_once_with(
-            "Error while getting resource item from couchdb:"
-            " Exception('Database Error',)",
-            extra={'MESSAGE_ID': 'exceptions'}
-        )
+        self.assertEqual(records.pop(), [
+            get_client, get_item, put_client,
+            ("Put to 'retry_queue' tender: {} after 0.01 sec.".format(
+                doc['id']), 'add_to_retry'),
+            ("Error while getting resource item from couchdb:"
+             " Exception('Database Error',)", 'exceptions')
+        ])
 
         self.api_clients_queue.put(api_client_dict)
         self.queue.put(queue_item)
@@ -588,26 +827,299 @@ class TestResourceItemWorker(unittest.TestCase):
         self.db.get.side_effect = [doc]
         worker.exit.__nonzero__.side_effect = [False, True]
         worker._run()
-        self.assertEqual(
-            mocked_logger.debug.call_args_list[10:],
-            [
-                call(
-                    'GET API CLIENT: {} {} with requests interval: {}'.format(
-                        api_client_dict['id'],
-                        api_client_dict['client'].session.headers['User-Agent'],
-                        api_client_dict['request_interval']
-                    ),
-                     extra={'REQUESTS_TIMEOUT': 0, 'MESSAGE_ID': 'get_client'}
-                ),
-                call('Get tender {} from main queue.'.format(doc['id'])),
-            ]
-        )
-        self.assertEqual(mocked_save_bulk.call_count, 1)
+        self.assertEqual(records.pop(), [get_client, get_item])
+        # Mocked save keeps the bulk, so it's flushed again on every exit
+        self.assertEqual(mocked_save_bulk.call_count, 4)
+
+    def test__run_flushes_on_exit(self):
+        worker = ResourceItemWorker(config_dict=self.worker_config,
+                                    retry_resource_items_queue=PriorityQueue())
+        worker.bulk_save_interval = 100
+        worker._write_bulk = MagicMock()
+        doc = {'id': uuid.uuid4().hex,
+               'dateModified': datetime.datetime.utcnow().isoformat()}
+        worker._add_to_bulk(None, doc, 1)
+        worker.shutdown()
+        worker._run()
+        worker._write_bulk.assert_called_once_with({doc['id']: doc},
+                                                   {doc['id']: 1})
+        self.assertEqual(worker.bulk, {})
+
+
+class TestBulkWriter(unittest.TestCase):
+
+    writer_config = {
+        'resource': 'tenders',
+        'retry_default_timeout': 0.01,
+        'retry_max_timeout': 1,
+        'retry_jitter': 0,
+        'retries_count': 2,
+        'bulk_save_limit': 2,
+        'bulk_save_interval': 0.1,
+        'bulk_writers': 2,
+        'raw_ingest': False
+    }
+
+    def doc(self, doc_id, date_modified=None):
+        return {'id': doc_id,
+                'dateModified': (date_modified or
+                                 datetime.datetime.utcnow().isoformat())}
+
+    def test_merge(self):
+        writer = BulkWriter(db=MagicMock(), config_dict=self.writer_config,
+                            retry_resource_items_queue=PriorityQueue())
+        self.assertEqual(writer.queue.maxsize, 4)
+        doc_id = uuid.uuid4().hex
+        old_doc = self.doc(doc_id, '2017-05-02T12:34:56.123456+03:00')
+        new_doc = self.doc(doc_id, '2017-05-02T12:35:56.123456+03:00')
+        writer._add_to_bulk({'_rev': '1-a'}, new_doc, 1000)
+        writer._add_to_bulk(None, old_doc, 1)
+        self.assertEqual(writer.bulk, {doc_id: new_doc})
+        self.assertEqual(new_doc['_rev'], '1-a')
+        self.assertEqual(writer.priority_cache[doc_id], 1000)
+
+    def test_run(self):
+        db = MagicMock()
+        db.update.side_effect = lambda docs: [
+            (True, doc['id'], '1-' + uuid.uuid4().hex) for doc in docs]
+        index = DateModifiedIndex()
+        writer = BulkWriter.spawn(db=db, config_dict=self.writer_config,
+                                  retry_resource_items_queue=PriorityQueue(),
+                                  date_modified_index=index)
+        docs = [self.doc(uuid.uuid4().hex) for i in xrange(0, 3)]
+        for doc in docs:
+            writer.put(None, doc, 1)
+        # Flushed by size
+        sleep(0.01)
+        self.assertEqual(db.update.call_count, 1)
+        self.assertEqual(len(db.update.call_args[0][0]), 3)
+        self.assertEqual(writer.bulk, {})
+        self.assertEqual(writer.writing_ids, set())
+        for doc in docs:
+            self.assertEqual(index.is_actual(doc['id'], doc['dateModified']),
+                             True)
+
+        # Flushed by interval
+        writer.put(None, self.doc(uuid.uuid4().hex), 1)
+        sleep(0.01)
+        self.assertEqual(db.update.call_count, 1)
+        sleep(0.15)
+        self.assertEqual(db.update.call_count, 2)
+
+        # Flushed on shutdown
+        writer.put(None, self.doc(uuid.uuid4().hex), 1)
+        writer.shutdown()
+        writer.join(timeout=1)
+        self.assertEqual(writer.dead, True)
+        self.assertEqual(db.update.call_count, 3)
+
+    def test_bulk_save_bytes(self):
+        saved = []
+
+        def post_json(body, headers):
+            # Streamed body
+            self.assertEqual(headers['Content-Type'], 'application/json')
+            saved.extend(json.loads(body.read())['docs'])
+            return 201, {}, [{'id': doc['_id'], 'rev': '1-a'}
+                             for doc in saved]
+
+        db = MagicMock()
+        db.resource.return_value.post_json.side_effect = post_json
+        config = dict(self.writer_config, bulk_save_limit=100,
+                      bulk_save_interval=10)
+        docs = [self.doc(uuid.uuid4().hex) for i in xrange(0, 3)]
+        config['bulk_save_bytes'] = len(json.dumps(docs[0])) + 10
+        writer = BulkWriter(db=db, config_dict=config,
+                            retry_resource_items_queue=PriorityQueue())
+        writer._add_to_bulk(None, docs[0], 1)
+        writer._save_bulk_docs()
+        self.assertEqual(writer.bulk_bytes, len(json.dumps(docs[0])))
+        self.assertIsInstance(writer.bulk[docs[0]['id']], RawDoc)
+
+        # Replaced doc is counted once
+        newer = self.doc(docs[0]['id'], '2117-01-01T00:00:00+02:00')
+        writer._add_to_bulk(None, newer, 1)
+        self.assertEqual(writer.bulk_bytes, len(json.dumps(newer)))
+
+        writer._add_to_bulk(None, docs[1], 1)
+        writer._save_bulk_docs()
+        writer.pool.join()
+        self.assertEqual(db.resource.return_value.post_json.call_count, 1)
+        self.assertEqual(db.update.called, False)
+        self.assertEqual(writer.bulk, {})
+        self.assertEqual(writer.bulk_bytes, 0)
+        self.assertEqual(sorted(saved, key=lambda doc: doc['id']), sorted([
+            dict(newer, _id=newer['id'], doc_type='Tender'),
+            dict(docs[1], _id=docs[1]['id'], doc_type='Tender')],
+            key=lambda doc: doc['id']))
+
+    def test_rev_cache(self):
+        db = MagicMock()
+        rev_cache = RevCache()
+        writer = BulkWriter(db=db, config_dict=self.writer_config,
+                            retry_resource_items_queue=PriorityQueue(),
+                            rev_cache=rev_cache)
+        stored_id, new_id = uuid.uuid4().hex, uuid.uuid4().hex
+        rev_cache.set(stored_id, '1-a')
+        db.view.return_value = []
+        db.update.return_value = [(True, stored_id, '2-a'),
+                                  (True, new_id, '1-b')]
+        bulk = {stored_id: self.doc(stored_id), new_id: self.doc(new_id)}
+        writer._write_bulk(bulk, {stored_id: 1, new_id: 1})
+        db.view.assert_called_once_with('_all_docs', keys=[new_id])
+        self.assertEqual(bulk[stored_id]['_rev'], '1-a')
+        self.assertNotIn('_rev', bulk[new_id])
+        self.assertEqual(rev_cache.get(stored_id), '2-a')
+        self.assertEqual(rev_cache.get(new_id), '1-b')
+
+        # Conflicting rev is forgotten
+        db.update.return_value = [
+            (False, new_id, Exception(u'Document update conflict.'))]
+        writer._write_bulk({new_id: self.doc(new_id)}, {new_id: 1})
+        self.assertNotIn(new_id, rev_cache)
+
+    def test_deterministic_revs(self):
+        db = MagicMock()
+        rev_cache = RevCache()
+        config = dict(self.writer_config, deterministic_revs=True)
+        writer = BulkWriter(db=db, config_dict=config,
+                            retry_resource_items_queue=PriorityQueue(),
+                            rev_cache=rev_cache)
+        doc_id, failed_id = uuid.uuid4().hex, uuid.uuid4().hex
+        db.resource.return_value.post_json.return_value = (201, {}, [
+            {'id': failed_id, 'error': 'forbidden', 'reason': 'Forbidden'}])
+        bulk = {doc_id: self.doc(doc_id), failed_id: self.doc(failed_id)}
+        writer._write_bulk(bulk, {doc_id: 1, failed_id: 1})
+        # Neither docs nor revisions are read
+        self.assertEqual(db.view.call_count, 0)
+        self.assertEqual(db.update.call_count, 0)
+        body = json.loads(
+            db.resource.return_value.post_json.call_args[1]['body'].read())
+        self.assertEqual(body['new_edits'], False)
+        self.assertEqual(rev_cache.get(doc_id),
+                         deterministic_rev(bulk[doc_id]))
+        self.assertNotIn(failed_id, rev_cache)
+        self.assertEqual(writer.retry_scheduler.pending(), 1)
+
+        # Update of a cached revision extends its branch
+        stored_rev = rev_cache.get(doc_id)
+        newer = self.doc(doc_id, '2117-01-01T00:00:00+02:00')
+        db.resource.return_value.post_json.return_value = (201, {}, [])
+        writer._write_bulk({doc_id: newer}, {doc_id: 1})
+        body = json.loads(
+            db.resource.return_value.post_json.call_args[1]['body'].read())
+        self.assertEqual(body['docs'][0]['_revisions']['ids'][1],
+                         stored_rev.split('-')[1])
+        self.assertEqual(rev_cache.get(doc_id),
+                         deterministic_rev(newer, stored_rev))
+
+    @patch('openprocurement.edge.workers.time')
+    def test_timeshift(self, mocked_time):
+        db = MagicMock()
+        writer = BulkWriter(db=db, config_dict=self.writer_config,
+                            retry_resource_items_queue=PriorityQueue())
+        doc_id = uuid.uuid4().hex
+        doc = self.doc(doc_id, '2017-05-02T12:34:56.123456+03:00')
+        mocked_time.time.return_value = date_to_microseconds(
+            '2017-05-02T12:35:56.623456+03:00') / 1000000.0
+        db.update.return_value = [(True, doc_id, '1-a')]
+        records = LogRecords()
+        logger.addHandler(records)
+        self.addCleanup(logger.removeHandler, records)
+        writer._write_bulk({doc_id: doc}, {doc_id: 1})
+        summary = [record for record in records.records
+                   if getattr(record, 'MESSAGE_ID', None) == 'save_bulk']
+        self.assertAlmostEqual(summary[0].DOCUMENT_TIMESHIFT, 60.5, 3)
+
+    def test_fingerprint_cache(self):
+        db = MagicMock()
+        index = DateModifiedIndex()
+        cache = FingerprintCache()
+        writer = BulkWriter(db=db, config_dict=self.writer_config,
+                            retry_resource_items_queue=PriorityQueue(),
+                            date_modified_index=index,
+                            fingerprint_cache=cache)
+        doc_id, other_id = uuid.uuid4().hex, uuid.uuid4().hex
+        db.update.return_value = [(True, doc_id, '1-a'),
+                                  (True, other_id, '1-b')]
+        writer._write_bulk({doc_id: self.doc(doc_id),
+                            other_id: self.doc(other_id)},
+                           {doc_id: 1, other_id: 1})
+        self.assertEqual(len(cache), 2)
+
+        # Only dateModified is bumped
+        bumped = self.doc(doc_id, '2117-01-01T00:00:00+02:00')
+        changed = dict(self.doc(other_id), title='changed')
+        db.update.return_value = [(True, other_id, '2-b')]
+        writer._write_bulk({doc_id: bumped, other_id: changed},
+                           {doc_id: 1, other_id: 1})
+        self.assertEqual(db.update.call_args[0][0], [changed])
+        self.assertEqual(index.is_actual(doc_id, bumped['dateModified']),
+                         True)
+        self.assertEqual(cache.unchanged, 1)
+
+        db.update.reset_mock()
+        writer._write_bulk({doc_id: self.doc(doc_id)}, {doc_id: 1})
+        self.assertEqual(db.update.called, False)
+
+        # Fingerprint of a failed write is forgotten
+        changed = dict(changed, title='again')
+        db.update.return_value = [
+            (False, other_id, Exception(u'Document update conflict.'))]
+        writer._write_bulk({other_id: changed}, {other_id: 1})
+        self.assertNotIn(other_id, cache)
+
+    def test_in_flight(self):
+        retry_queue = PriorityQueue()
+        db = MagicMock()
+        doc_id = uuid.uuid4().hex
+        writer = BulkWriter(db=db, config_dict=self.writer_config,
+                            retry_resource_items_queue=retry_queue)
+        writer.exit = True
+        writer.writing_ids.add(doc_id)
+        writer._add_to_bulk(None, self.doc(doc_id), 1)
+        writer._save_bulk_docs()
+        # Doc which is being written waits for the next flush
+        self.assertIn(doc_id, writer.bulk)
+        self.assertEqual(len(writer.pool), 0)
+
+        # Per doc errors are routed to retry
+        writer.writing_ids.clear()
+        db.update.return_value = [
+            (False, doc_id, Exception(u'Document update conflict.'))]
+        writer._save_bulk_docs()
+        writer.pool.join()
+        self.assertEqual(writer.bulk, {})
+        self.assertEqual(writer.writing_ids, set())
+        self.assertEqual(retry_queue.get(timeout=0.1), (2, doc_id))
+
+    def test_journal(self):
+        db = MagicMock()
+        journal = MagicMock()
+        writer = BulkWriter(db=db, config_dict=self.writer_config,
+                            retry_resource_items_queue=PriorityQueue(),
+                            journal=journal)
+        saved_id, ignored_id, failed_id = [uuid.uuid4().hex
+                                           for i in xrange(0, 3)]
+        bulk = {doc_id: self.doc(doc_id)
+                for doc_id in (saved_id, ignored_id, failed_id)}
+        db.update.return_value = [
+            (True, saved_id, '1-a'),
+            (False, ignored_id,
+             Exception(u'New doc with oldest dateModified.')),
+            (False, failed_id, Exception(u'Document update conflict.'))]
+        writer._write_bulk(bulk, {saved_id: 1, ignored_id: 1, failed_id: 1})
+        self.assertEqual(journal.discard.call_args_list, [
+            call(saved_id, bulk[saved_id]['dateModified']),
+            call(ignored_id)])
+        # Retry is journaled with its new priority
+        journal.add.assert_called_once_with(failed_id, 2)
 
 
 def suite():
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(TestResourceItemWorker))
+    suite.addTest(unittest.makeSuite(TestBulkWriter))
     return suite
 
 
@@ -9,10 +9,34 @@ import os
 from datetime import datetime
 from gevent import Greenlet
 from gevent import spawn, sleep
-from gevent.queue import Empty
-from iso8601 import parse_date
+from gevent.pool import Pool
+from gevent.queue import Empty, Queue
+from json import loads
+from munch import munchify
 from pytz import timezone
 from requests.exceptions import ConnectionError
+from openprocurement.edge.cache import fingerprint
+from openprocurement.edge.index import date_to_microseconds
+from openprocurement.edge.logs import EventLog, LazyMessage
+from openprocurement.edge.metrics import (
+    API_REQUEST_DURATION,
+    API_REQUESTS,
+    BULK_SAVE_BYTES,
+    BULK_SAVE_DURATION,
+    BULK_SAVE_SIZE,
+    DOCUMENT_TIMESHIFT,
+    DROPPED,
+    RETRIES,
+    RollingHistogram,
+    SAVED_DOCS
+)
+from openprocurement.edge.raw import RawDoc, doc_size, update_raw
+from openprocurement.edge.revs import update_deterministic
+from openprocurement.edge.retry import (
+    RetryScheduler,
+    parse_retry_after,
+    retry_delay
+)
 from openprocurement_client.exceptions import (
     InvalidResponse,
     RequestFailed,
@@ -24,12 +48,30 @@ logger = logging.getLogger(__name__)
 
 TZ = timezone(os.environ['TZ'] if 'TZ' in os.environ else 'Europe/Kiev')
 
+# Per document events, sampled by ``configure_events``
+PUT_CLIENT = EventLog(logger, 'put_client')
+GET_CLIENT = EventLog(logger, 'get_client')
+GET_ITEM = EventLog(logger, 'get_from_queue')
+REQUEST_INTERVAL = EventLog(logger, 'request_interval')
+NOT_MODIFIED = EventLog(logger, 'not_modified')
+RECEIVED = EventLog(logger, 'received')
+ADD_TO_BULK = EventLog(logger, 'add_to_save_bulk')
+SKIPPED = EventLog(logger, 'skipped')
+SKIPED = EventLog(logger, 'skiped')
+TIMESHIFT = EventLog(logger, 'timeshift')
+SAVE_DOCUMENT = EventLog(logger, 'save_documents', logging.INFO)
+UPDATE_DOCUMENT = EventLog(logger, 'update_documents', logging.INFO)
+COALESCED = EventLog(logger, 'coalesced')
+
 
 class ResourceItemWorker(Greenlet):
 
     def __init__(self, api_clients_queue=None, resource_items_queue=None,
                  db=None, config_dict=None, retry_resource_items_queue=None,
-                 api_clients_info=None):
+                 api_clients_info=None, date_modified_index=None,
+                 retry_scheduler=None, bulk_writer=None, rev_cache=None,
+                 etag_cache=None, rate_controller=None, journal=None,
+                 dead_letters=None, fingerprint_cache=None, in_flight=None):
         Greenlet.__init__(self)
         self.exit = False
         self.update_doc = False
@@ -39,13 +81,30 @@ class ResourceItemWorker(Greenlet):
         self.resource_items_queue = resource_items_queue
         self.retry_resource_items_queue = retry_resource_items_queue
         self.bulk = {}
+        self.bulk_bytes = 0
         self.priority_cache = {}
         self.bulk_save_limit = self.config['bulk_save_limit']
+        self.bulk_save_bytes = self.config.get('bulk_save_bytes')
+        self.deterministic_revs = self.config.get('deterministic_revs')
         self.bulk_save_interval = self.config['bulk_save_interval']
         self.start_time = datetime.now()
         self.api_clients_info = api_clients_info
+        self.date_modified_index = date_modified_index
+        self.retry_scheduler = retry_scheduler or RetryScheduler(
+            retry_resource_items_queue)
+        self.bulk_writer = bulk_writer
+        self.rev_cache = rev_cache
+        self.etag_cache = etag_cache
+        self.rate_controller = rate_controller
+        self.journal = journal
+        self.dead_letters = dead_letters
+        self.fingerprint_cache = fingerprint_cache
+        self.in_flight = in_flight
+        # Called with the id of each doc which is saved or found up to date
+        self.on_saved = None
 
-    def add_to_retry_queue(self, resource_item_id, priority=0, status_code=0):
+    def add_to_retry_queue(self, resource_item_id, priority=0, status_code=0,
+                           retry_after=0, error=None):
         retries_count = priority - 1000 if priority >= 1000 else priority
         if retries_count > self.config['retries_count'] and status_code != 429:
             logger.critical(
@@ -55,20 +114,46 @@ class ResourceItemWorker(Greenlet):
                     resource_item_id, self.config['retries_count']),
                 extra={'MESSAGE_ID': 'dropped_documents'}
             )
+            DROPPED.labels(self.config['resource']).inc()
+            if self.dead_letters is not None and self._put_dead_letter(
+                    resource_item_id, priority, status_code, error):
+                if self.journal is not None:
+                    # Dead letters are replayed on demand, not after restart
+                    self.journal.discard(resource_item_id)
+            # Otherwise stays pending in the journal to be retried after
+            # restart
             return
-        timeout = 0
+        timeout = retry_after
         if status_code != 429:
-            timeout = self.config['retry_default_timeout'] * retries_count
+            timeout = max(retry_delay(
+                retries_count, self.config['retry_default_timeout'],
+                self.config['retry_max_timeout'], self.config['retry_jitter']),
+                retry_after)
             priority += 1
-        sleep(timeout)
-        self.retry_resource_items_queue.put((priority, resource_item_id))
+        if self.journal is not None:
+            self.journal.add(resource_item_id, priority)
+        self.retry_scheduler.schedule((priority, resource_item_id), timeout)
+        RETRIES.labels(self.config['resource']).inc()
         logger.info(
-            'Put to \'retry_queue\' {}: {}'.format(
-                self.config['resource'][:-1], resource_item_id
+            'Put to \'retry_queue\' {}: {} after {} sec.'.format(
+                self.config['resource'][:-1], resource_item_id,
+                round(timeout, 3)
             ),
             extra={'MESSAGE_ID': 'add_to_retry'}
         )
 
+    def _put_dead_letter(self, resource_item_id, priority, status_code,
+                         error):
+        try:
+            self.dead_letters.put(resource_item_id, priority, status_code,
+                                  error)
+        except Exception as e:
+            logger.error('Error while saving dead letter {} {}: {}'.format(
+                self.config['resource'][:-1], resource_item_id, repr(e)),
+                extra={'MESSAGE_ID': 'exceptions'})
+            return False
+        return True
+
     def _get_api_client_dict(self):
         if not self.api_clients_queue.empty():
             try:
@@ -80,9 +165,12 @@ class ResourceItemWorker(Greenlet):
             if self.api_clients_info[api_client_dict['id']]['drop_cookies']:
                 try:
                     api_client_dict['client'].renew_cookies()
+                    durations = self.api_clients_info[api_client_dict['id']]\
+                        .get('request_durations') or RollingHistogram()
+                    durations.reset()
                     self.api_clients_info[api_client_dict['id']] = {
                         'drop_cookies': False,
-                        'request_durations': {},
+                        'request_durations': durations,
                         'request_interval': 0,
                         'avg_duration': 0
                     }
@@ -92,21 +180,16 @@ class ResourceItemWorker(Greenlet):
                         api_client_dict['id']))
                 except (Exception, ConnectionError) as e:
                     self.api_clients_queue.put(api_client_dict)
-                    logger.debug('PUT API CLIENT: {}'.format(api_client_dict['id']),
-                                 extra={'MESSAGE_ID': 'put_client'})
+                    PUT_CLIENT.log('PUT API CLIENT: {}', api_client_dict['id'])
                     logger.error('While renewing cookies catch exception: '
                                  '{}'.format(e.message))
                     return None
-            logger.debug(
-                'GET API CLIENT: {} {} with requests interval: {}'.format(
-                    api_client_dict['id'],
-                    api_client_dict['client'].session.headers['User-Agent'],
-                    api_client_dict['request_interval']
-                ),
-                extra={
-                    'MESSAGE_ID': 'get_client',
-                    'REQUESTS_TIMEOUT': api_client_dict['request_interval']
-                }
+            GET_CLIENT.log(
+                'GET API CLIENT: {} {} with requests interval: {}',
+                api_client_dict['id'],
+                api_client_dict['client'].session.headers['User-Agent'],
+                api_client_dict['request_interval'],
+                REQUESTS_TIMEOUT=api_client_dict['request_interval']
             )
             sleep(api_client_dict['request_interval'])
             return api_client_dict
@@ -117,67 +200,136 @@ class ResourceItemWorker(Greenlet):
         if not self.resource_items_queue.empty():
             priority, resource_item_id = self.resource_items_queue.get(
                 timeout=self.config['queue_timeout'])
-            logger.debug('Get {} {} from main queue.'.format(
-                self.config['resource'][:-1], resource_item_id))
+            GET_ITEM.log('Get {} {} from main queue.',
+                         self.config['resource'][:-1], resource_item_id)
             return priority, resource_item_id
         else:
             return None, None
 
+    def _get_resource_item_url(self, api_client, resource_item_id):
+        # Api clients may be shared between resources, so the url isn't
+        # taken from the client prefix_path
+        return '{}/api/{}/{}/{}'.format(api_client.host_url,
+                                        api_client.api_version,
+                                        self.config['resource'],
+                                        resource_item_id)
+
+    def _request_resource_item(self, api_client, url, resource_item_id):
+        headers = {}
+        etag = None
+        if self.etag_cache is not None:
+            etag = self.etag_cache.get(resource_item_id)
+            if etag is not None:
+                headers['If-None-Match'] = etag[0]
+        response = api_client.request('GET', url, headers=headers)
+        if response.status_code == 304 and etag is not None:
+            self.etag_cache.count_not_modified(etag[1])
+            return None
+        if response.status_code != 200:
+            raise InvalidResponse(response)
+        if self.config['raw_ingest']:
+            resource_item = RawDoc.from_response(response.content)
+        else:
+            resource_item = munchify(loads(response.text)).data
+        if self.etag_cache is not None and response.headers.get('ETag'):
+            self.etag_cache.stage(resource_item_id,
+                                  resource_item['dateModified'],
+                                  response.headers['ETag'],
+                                  len(response.content))
+        return resource_item
+
+    def _record_request(self, api_client_dict, start, result='ok'):
+        duration = time.time() - start
+        API_REQUESTS.labels(self.config['resource'], result).inc()
+        self.api_clients_info[api_client_dict['id']][
+            'request_durations'].record(duration)
+        self.api_clients_info[api_client_dict['id']]['request_interval'] =\
+            api_client_dict['request_interval']
+        API_REQUEST_DURATION.labels(api_client_dict['id']).observe(duration)
+        return duration
+
     def _get_resource_item_from_public(self, api_client_dict, priority,
                                        resource_item_id):
         try:
-            logger.debug('Request interval {} sec. for client {}'.format(
+            REQUEST_INTERVAL.log(
+                'Request interval {} sec. for client {}',
                 api_client_dict['request_interval'],
-                api_client_dict['client'].session.headers['User-Agent']),
-                extra={'REQUESTS_TIMEOUT': api_client_dict['request_interval']})
+                api_client_dict['client'].session.headers['User-Agent'],
+                REQUESTS_TIMEOUT=api_client_dict['request_interval'])
+            if self.rate_controller is not None:
+                self.rate_controller.acquire()
             start = time.time()
-            public_resource_item = api_client_dict['client'].get_resource_item(
-                resource_item_id).get('data')
-            self.api_clients_info[api_client_dict['id']][
-                'request_durations'][datetime.now()] = time.time() - start
-            self.api_clients_info[api_client_dict['id']]['request_interval'] =\
-                api_client_dict['request_interval']
-            logger.debug('Recieved from API {}: {} {}'.format(
-                self.config['resource'][:-1], public_resource_item['id'],
-                public_resource_item['dateModified'])
-            )
+            api_client = api_client_dict['client']
+            url = self._get_resource_item_url(api_client, resource_item_id)
+            if self.config['raw_ingest'] or self.etag_cache is not None:
+                public_resource_item = self._request_resource_item(
+                    api_client, url, resource_item_id)
+            else:
+                public_resource_item = api_client._get_resource_item(
+                    url).get('data')
+            duration = self._record_request(
+                api_client_dict, start,
+                'ok' if public_resource_item is not None else 'not_modified')
+            if self.rate_controller is not None:
+                self.rate_controller.on_success(duration)
+            if public_resource_item is None:
+                if self.journal is not None:
+                    self.journal.discard(resource_item_id)
+                NOT_MODIFIED.log('{} {} not modified at public.',
+                                 self.config['resource'][:-1].title(),
+                                 resource_item_id)
+            else:
+                RECEIVED.log('Recieved from API {}: {} {}',
+                             self.config['resource'][:-1],
+                             public_resource_item['id'],
+                             public_resource_item['dateModified'])
             if api_client_dict['request_interval'] > 0:
                 api_client_dict['request_interval'] -=\
                     self.config['client_dec_step_timeout']
             self.api_clients_queue.put(api_client_dict)
-            logger.debug('PUT API CLIENT: {}'.format(api_client_dict['id']),
-                         extra={'MESSAGE_ID': 'put_client'})
+            PUT_CLIENT.log('PUT API CLIENT: {}', api_client_dict['id'])
             return public_resource_item
         except ResourceGone:
+            self._record_request(api_client_dict, start, 'gone')
+            if self.journal is not None:
+                self.journal.discard(resource_item_id)
             self.api_clients_queue.put(api_client_dict)
-            logger.debug('PUT API CLIENT: {}'.format(api_client_dict['id']),
-                         extra={'MESSAGE_ID': 'put_client'})
+            PUT_CLIENT.log('PUT API CLIENT: {}', api_client_dict['id'])
             logger.info(
                 '{} {} archived.'.format(self.config['resource'][:-1].title(),
                                          resource_item_id)
             )
             return None  # Archived
         except InvalidResponse as e:
-            self.api_clients_info[api_client_dict['id']][
-                'request_durations'][datetime.now()] = time.time() - start
-            self.api_clients_info[api_client_dict['id']]['request_interval'] =\
-                api_client_dict['request_interval']
+            self._record_request(api_client_dict, start, 'invalid')
             self.api_clients_queue.put(api_client_dict)
-            logger.debug('PUT API CLIENT: {}'.format(api_client_dict['id']),
-                         extra={'MESSAGE_ID': 'put_client'})
+            PUT_CLIENT.log('PUT API CLIENT: {}', api_client_dict['id'])
             logger.error(
                 'Error while getting {} {} from public with status code: '
                 '{}'.format(
                     self.config['resource'][:-1], resource_item_id,
                     e.status_code), extra={'MESSAGE_ID': 'exceptions'})
-            self.add_to_retry_queue(resource_item_id, priority=priority)
+            # Status code isn't passed, 429 without Retry-After here would
+            # be retried without a delay
+            self.add_to_retry_queue(
+                resource_item_id, priority=priority,
+                error='Invalid response with status code {}: {}'.format(
+                    e.status_code, e.message))
             return None
         except RequestFailed as e:
-            self.api_clients_info[api_client_dict['id']][
-                'request_durations'][datetime.now()] = time.time() - start
-            self.api_clients_info[api_client_dict['id']]['request_interval'] =\
-                api_client_dict['request_interval']
-            if e.status_code == 429:
+            self._record_request(
+                api_client_dict, start,
+                'throttled' if e.status_code == 429 else 'failed')
+            retry_after = parse_retry_after(e.response)
+            if e.status_code == 429 and self.rate_controller is not None:
+                # The shared rate is throttled instead of this client
+                self.rate_controller.on_throttle(retry_after)
+                self.api_clients_queue.put(api_client_dict)
+                logger.warning('PUT API CLIENT: {}, API requests rate is {} '
+                               'per sec.'.format(api_client_dict['id'],
+                                                 self.rate_controller.rate),
+                               extra={'MESSAGE_ID': 'put_client'})
+            elif e.status_code == 429:
                 if (api_client_dict['request_interval'] >
                         self.config['drop_threshold_client_cookies']):
                     api_client_dict['client'].session.cookies.clear()
@@ -195,50 +347,49 @@ class ResourceItemWorker(Greenlet):
                     extra={'MESSAGE_ID': 'put_client'})
             else:
                 self.api_clients_queue.put(api_client_dict)
-                logger.debug('PUT API CLIENT: {}'.format(api_client_dict['id']),
-                             extra={'MESSAGE_ID': 'put_client'})
+                PUT_CLIENT.log('PUT API CLIENT: {}', api_client_dict['id'])
             logger.error(
                 'Request failed while getting {} {} from public with status '
                 'code {}: '.format(
                     self.config['resource'][:-1], resource_item_id,
                     e.status_code), extra={'MESSAGE_ID': 'exceptions'})
             self.add_to_retry_queue(
-                resource_item_id, priority=priority, status_code=e.status_code
+                resource_item_id, priority=priority, status_code=e.status_code,
+                retry_after=retry_after, error=e.message
             )
             return None  # request failed
         except ResourceNotFound as e:
-            self.api_clients_info[api_client_dict['id']][
-                'request_durations'][datetime.now()] = time.time() - start
-            self.api_clients_info[api_client_dict['id']]['request_interval'] =\
-                api_client_dict['request_interval']
+            self._record_request(api_client_dict, start, 'not_found')
             logger.error('Resource not found {} at public: {}. {}'.format(
                 self.config['resource'][:-1], resource_item_id, e.message),
                 extra={'MESSAGE_ID': 'not_found_docs'})
             api_client_dict['client'].session.cookies.clear()
             logger.info('Clear client cookies')
-            self.add_to_retry_queue(resource_item_id, priority=priority)
+            self.add_to_retry_queue(resource_item_id, priority=priority,
+                                    status_code=e.status_code,
+                                    error=e.message)
             self.api_clients_queue.put(api_client_dict)
-            logger.debug('PUT API CLIENT: {}'.format(api_client_dict['id']),
-                         extra={'MESSAGE_ID': 'put_client'})
+            PUT_CLIENT.log('PUT API CLIENT: {}', api_client_dict['id'])
             return None  # not found
         except Exception as e:
-            self.api_clients_info[api_client_dict['id']][
-                'request_durations'][datetime.now()] = time.time() - start
-            self.api_clients_info[api_client_dict['id']]['request_interval'] =\
-                api_client_dict['request_interval']
+            self._record_request(api_client_dict, start, 'failed')
             self.api_clients_queue.put(api_client_dict)
-            logger.debug('PUT API CLIENT: {}'.format(api_client_dict['id']),
-                         extra={'MESSAGE_ID': 'put_client'})
+            PUT_CLIENT.log('PUT API CLIENT: {}', api_client_dict['id'])
             logger.error(
                 'Error while getting resource item {} {} from public '
                 '{}: '.format(
                     self.config['resource'][:-1], resource_item_id,
                     e.message),
                 extra={'MESSAGE_ID': 'exceptions'})
-            self.add_to_retry_queue(resource_item_id, priority=priority)
+            self.add_to_retry_queue(resource_item_id, priority=priority,
+                                    error=repr(e))
             return None
 
     def _add_to_bulk(self, local_resource_item, public_resource_item, priority):
+        if self.bulk_save_bytes and not isinstance(public_resource_item,
+                                                   RawDoc):
+            # Bulk is kept as bytes and bounded by their size
+            public_resource_item = RawDoc.from_doc(public_resource_item)
         public_resource_item['doc_type'] = self.config['resource'][:-1].title()
         public_resource_item['_id'] = public_resource_item['id']
         if local_resource_item:
@@ -247,94 +398,245 @@ class ResourceItemWorker(Greenlet):
 
         if bulk_doc and bulk_doc['dateModified'] < \
                 public_resource_item['dateModified']:
-            logger.debug(
-                'Replaced {} in bulk {} previous {}, current {}'.format(
-                    self.config['resource'][:-1], bulk_doc['id'],
-                    bulk_doc['dateModified'],
-                    public_resource_item['dateModified']),
-                extra={'MESSAGE_ID': 'skipped'})
+            SKIPPED.log('Replaced {} in bulk {} previous {}, current {}',
+                        self.config['resource'][:-1], bulk_doc['id'],
+                        bulk_doc['dateModified'],
+                        public_resource_item['dateModified'])
             self.bulk[public_resource_item['id']] = public_resource_item
+            self.bulk_bytes += (doc_size(public_resource_item) -
+                                doc_size(bulk_doc))
             if priority < self.priority_cache[public_resource_item['id']]:
                 self.priority_cache[public_resource_item['id']] = priority
         elif bulk_doc and bulk_doc['dateModified'] >=\
                 public_resource_item['dateModified']:
-            logger.debug(
-                'Ignored dublicate {} {} in bulk: previous {}, current '
-                '{}'.format(
-                    self.config['resource'][:-1], public_resource_item['id'],
-                    bulk_doc['dateModified'],
-                    public_resource_item['dateModified']),
-                extra={'MESSAGE_ID': 'skipped'})
+            SKIPPED.log('Ignored dublicate {} {} in bulk: previous {}, '
+                        'current {}', self.config['resource'][:-1],
+                        public_resource_item['id'], bulk_doc['dateModified'],
+                        public_resource_item['dateModified'])
         if not bulk_doc:
             self.bulk[public_resource_item['id']] = public_resource_item
+            self.bulk_bytes += doc_size(public_resource_item)
             self.priority_cache[public_resource_item['id']] = priority
-            logger.debug('Put in bulk {} {} {}'.format(
-                    self.config['resource'][:-1],
-                    public_resource_item['id'],
-                    public_resource_item['dateModified']
-                ),
-                extra={'MESSAGE_ID': 'add_to_save_bulk'})
+            ADD_TO_BULK.log('Put in bulk {} {} {}',
+                            self.config['resource'][:-1],
+                            public_resource_item['id'],
+                            public_resource_item['dateModified'])
 
-    def _save_bulk_docs(self):
-        if (len(self.bulk) > self.bulk_save_limit or
+    def _bulk_is_due(self):
+        return (len(self.bulk) > self.bulk_save_limit or
+                (self.bulk_save_bytes and
+                 self.bulk_bytes >= self.bulk_save_bytes) or
                 (datetime.now() - self.start_time).total_seconds() >
-                self.bulk_save_interval or self.exit):
-            try:
-                logger.debug('Try save bulk: {}'.format(len(self.bulk)),
-                             extra={'SAVE_BULK_LEN': len(self.bulk)})
-                start = time.time()
-                res = self.db.update(self.bulk.values())
-                end = time.time() - start
-                logger.debug('Bulk save duration: {} sec.'.format(end),
-                             extra={'SAVE_BULK_DURATION': end})
-                for resource_item in self.bulk.values():
-                    ts = (datetime.now(TZ) -
-                          parse_date(resource_item[
-                              'dateModified'])).total_seconds()
-                    logger.debug('{} {} timeshift is {} sec.'.format(
-                        self.config['resource'][:-1], resource_item['id'], ts),
-                        extra={'DOCUMENT_TIMESHIFT': ts})
-                logger.info('Save bulk {} docs to db.'.format(len(self.bulk)))
-            except Exception as e:
-                logger.error('Error while saving bulk_docs in db: {}'.format(
-                    e.message), extra={'MESSAGE_ID': 'exceptions'})
-                for doc in self.bulk.values():
-                    self.add_to_retry_queue(
-                        doc['id'], priority=self.priority_cache[doc['id']]
-                    )
-                self.start_time = datetime.now()
-                self.priority_cache = {}
-                self.bulk = {}
-                return
-            for success, doc_id, rev_or_exc in res:
-                if success:
-                    if not rev_or_exc.startswith('1-'):
-                        logger.info('Update {} {}'.format(
-                            self.config['resource'][:-1], doc_id),
-                            extra={'MESSAGE_ID': 'update_documents'})
-                    else:
-                        logger.info('Save {} {}'.format(
-                            self.config['resource'][:-1], doc_id),
-                            extra={'MESSAGE_ID': 'save_documents'})
-                    continue
-                else:
-                    if rev_or_exc.message !=\
-                            u'New doc with oldest dateModified.':
-                        self.add_to_retry_queue(
-                            doc_id, priority=self.priority_cache[doc_id]
-                        )
-                        logger.error(
-                            'Put to retry queue {} {} with reason: '
-                            '{}'.format(self.config['resource'][:-1],
-                                        doc_id, rev_or_exc.message))
-                    else:
-                        logger.debug('Ignored {} {} with reason: {}'.format(
-                            self.config['resource'][:-1], doc_id, rev_or_exc),
-                            extra={'MESSAGE_ID': 'skiped'})
-                        continue
+                self.bulk_save_interval or self.exit)
+
+    def _save_bulk_docs(self):
+        if self._bulk_is_due():
+            bulk, priority_cache = self.bulk, self.priority_cache
             self.bulk = {}
+            self.bulk_bytes = 0
             self.priority_cache = {}
             self.start_time = datetime.now()
+            self._write_bulk(bulk, priority_cache)
+
+    def _set_revs(self, bulk):
+        revs = self.rev_cache.lookup(
+            self.db, [doc_id for doc_id, doc in bulk.items()
+                      if '_rev' not in doc])
+        for doc_id, rev in revs.items():
+            bulk[doc_id]['_rev'] = rev
+
+    def _drop_unchanged(self, bulk):
+        """Return docs which differ from their saved versions by more than
+        dateModified and their fingerprints, the rest count as saved."""
+        changed = {}
+        fingerprints = {}
+        for doc_id, doc in bulk.items():
+            digest = fingerprint(doc)
+            if not self.fingerprint_cache.is_unchanged(doc_id, digest):
+                changed[doc_id] = doc
+                fingerprints[doc_id] = digest
+                continue
+            SAVED_DOCS.labels(self.config['resource'], 'unchanged').inc()
+            if self.etag_cache is not None:
+                self.etag_cache.commit(doc_id, doc['dateModified'])
+            if self.date_modified_index is not None:
+                # Feed repeats of this dateModified aren't fetched again
+                self.date_modified_index.set(doc_id, doc['dateModified'])
+            if self.journal is not None:
+                self.journal.discard(doc_id, doc['dateModified'])
+            if self.on_saved is not None:
+                self.on_saved(doc_id)
+            SKIPED.log('Skipped unchanged {} {} {}',
+                       self.config['resource'][:-1], doc_id,
+                       doc['dateModified'])
+        return changed, fingerprints
+
+    def _write_bulk(self, bulk, priority_cache):
+        unchanged = 0
+        if self.fingerprint_cache is not None:
+            unchanged = len(bulk)
+            bulk, fingerprints = self._drop_unchanged(bulk)
+            unchanged -= len(bulk)
+            if not bulk:
+                logger.info('Skipped bulk of {} unchanged docs.'.format(
+                    unchanged), extra={'MESSAGE_ID': 'save_bulk',
+                                       'UNCHANGED_DOCS': unchanged})
+                return
+        resource = self.config['resource']
+        try:
+            logger.debug(LazyMessage('Try save bulk: {}', (len(bulk),)),
+                         extra={'SAVE_BULK_LEN': len(bulk)})
+            start = time.time()
+            if self.deterministic_revs:
+                # Stored revisions aren't read, updates of cached ones
+                # extend their branches
+                stored_revs = {}
+                if self.rev_cache is not None:
+                    for doc_id in bulk:
+                        rev = self.rev_cache.get(doc_id)
+                        if rev is not None:
+                            stored_revs[doc_id] = rev
+                res = update_deterministic(self.db, bulk.values(),
+                                           stored_revs)
+            elif self.config['raw_ingest'] or self.bulk_save_bytes:
+                if self.rev_cache is not None:
+                    self._set_revs(bulk)
+                res = update_raw(self.db, bulk.values())
+            else:
+                if self.rev_cache is not None:
+                    self._set_revs(bulk)
+                res = self.db.update(bulk.values())
+            end = time.time() - start
+            BULK_SAVE_DURATION.labels(resource).observe(end)
+            BULK_SAVE_SIZE.labels(resource).observe(len(bulk))
+            if self.config['raw_ingest'] or self.bulk_save_bytes:
+                BULK_SAVE_BYTES.labels(resource).observe(
+                    sum(doc_size(doc) for doc in bulk.values()))
+            timeshift = DOCUMENT_TIMESHIFT.labels(resource)
+            now = int(time.time() * 1000000)
+            max_ts = 0
+            for resource_item in bulk.values():
+                ts = (now - date_to_microseconds(
+                    resource_item['dateModified'])) / 1000000.0
+                timeshift.observe(ts)
+                max_ts = max(max_ts, ts)
+                TIMESHIFT.log('{} {} timeshift is {} sec.',
+                              resource[:-1], resource_item['id'], ts,
+                              DOCUMENT_TIMESHIFT=ts)
+        except Exception as e:
+            logger.error('Error while saving bulk_docs in db: {}'.format(
+                e.message), extra={'MESSAGE_ID': 'exceptions'})
+            for doc in bulk.values():
+                self.add_to_retry_queue(
+                    doc['id'], priority=priority_cache[doc['id']],
+                    error=repr(e)
+                )
+            return
+        counts = {'created': 0, 'updated': 0, 'written': 0, 'ignored': 0,
+                  'failed': 0}
+        for success, doc_id, rev_or_exc in res:
+            if success:
+                if self.rev_cache is not None:
+                    self.rev_cache.set(doc_id, rev_or_exc)
+                if self.fingerprint_cache is not None:
+                    self.fingerprint_cache.set(doc_id, fingerprints[doc_id])
+                if self.etag_cache is not None:
+                    self.etag_cache.commit(doc_id,
+                                           bulk[doc_id]['dateModified'])
+                if self.date_modified_index is not None:
+                    self.date_modified_index.set(
+                        doc_id, bulk[doc_id]['dateModified'])
+                if self.journal is not None:
+                    self.journal.discard(doc_id, bulk[doc_id]['dateModified'])
+                if self.on_saved is not None:
+                    self.on_saved(doc_id)
+                if self.deterministic_revs:
+                    # Whether a doc was new isn't known without a read
+                    counts['written'] += 1
+                    SAVE_DOCUMENT.log('Write {} {} {}', resource[:-1],
+                                      doc_id, rev_or_exc)
+                elif not rev_or_exc.startswith('1-'):
+                    counts['updated'] += 1
+                    UPDATE_DOCUMENT.log('Update {} {}', resource[:-1], doc_id)
+                else:
+                    counts['created'] += 1
+                    SAVE_DOCUMENT.log('Save {} {}', resource[:-1], doc_id)
+                continue
+            else:
+                if self.rev_cache is not None:
+                    self.rev_cache.pop(doc_id)
+                if self.fingerprint_cache is not None:
+                    self.fingerprint_cache.pop(doc_id)
+                if rev_or_exc.message !=\
+                        u'New doc with oldest dateModified.':
+                    counts['failed'] += 1
+                    self.add_to_retry_queue(
+                        doc_id, priority=priority_cache[doc_id],
+                        error=repr(rev_or_exc)
+                    )
+                    logger.error(
+                        'Put to retry queue {} {} with reason: '
+                        '{}'.format(self.config['resource'][:-1],
+                                    doc_id, rev_or_exc.message))
+                else:
+                    counts['ignored'] += 1
+                    if self.journal is not None:
+                        self.journal.discard(doc_id)
+                    if self.on_saved is not None:
+                        self.on_saved(doc_id)
+                    SKIPED.log('Ignored {} {} with reason: {}',
+                               self.config['resource'][:-1], doc_id,
+                               rev_or_exc)
+                    continue
+        for status, count in counts.items():
+            if count:
+                SAVED_DOCS.labels(resource, status).inc(count)
+        # One record per bulk instead of a record per doc
+        logger.info(
+            'Save bulk {} docs to db in {:.3f} sec.: {} created, {} updated, '
+            '{} written, {} unchanged, {} ignored, {} failed, max timeshift '
+            '{:.1f} sec.'.format(len(bulk), end, counts['created'],
+                                 counts['updated'], counts['written'],
+                                 unchanged, counts['ignored'],
+                                 counts['failed'], max_ts),
+            extra={'MESSAGE_ID': 'save_bulk', 'SAVE_BULK_LEN': len(bulk),
+                   'SAVE_BULK_DURATION': end, 'UNCHANGED_DOCS': unchanged,
+                   'DOCUMENT_TIMESHIFT': max_ts})
+
+    def _fetch_resource_item(self, api_client_dict, priority,
+                             resource_item_id):
+        try:
+            # Resource object from local db server, with rev cache _rev is
+            # resolved in batch before save
+            local_resource_item = (
+                self.db.get(resource_item_id)
+                if self.rev_cache is None and not self.deterministic_revs
+                else None)
+        except Exception as e:
+            self.api_clients_queue.put(api_client_dict)
+            PUT_CLIENT.log('PUT API CLIENT: {}', api_client_dict['id'])
+            self.add_to_retry_queue(resource_item_id, priority=priority,
+                                    error=repr(e))
+            logger.error('Error while getting resource item from couchdb: '
+                         '{}'.format(repr(e)),
+                         extra={'MESSAGE_ID': 'exceptions'})
+            return None, None
+
+        # Try get resource item from public server
+        public_resource_item = self._get_resource_item_from_public(
+            api_client_dict, priority, resource_item_id)
+        return local_resource_item, public_resource_item
+
+    def _finish_fetch(self, resource_item_id, priority, public_resource_item):
+        date_modified = (public_resource_item['dateModified']
+                         if public_resource_item is not None else None)
+        reported = self.in_flight.finish(resource_item_id, date_modified)
+        if reported is not None:
+            # Newer version reported by the feed during the fetch
+            self.resource_items_queue.put((priority, resource_item_id))
+            logger.info('Put {} {} {} to fetch again'.format(
+                self.config['resource'][:-1], resource_item_id, reported),
+                extra={'MESSAGE_ID': 'refetch'})
 
     def _run(self):
         while not self.exit:
@@ -349,40 +651,126 @@ class ResourceItemWorker(Greenlet):
             priority, resource_item_id = self._get_resource_item_from_queue()
             if resource_item_id is None:
                 self.api_clients_queue.put(api_client_dict)
-                logger.debug('PUT API CLIENT: {}'.format(api_client_dict['id']),
-                             extra={'MESSAGE_ID': 'put_client'})
+                PUT_CLIENT.log('PUT API CLIENT: {}', api_client_dict['id'])
                 logger.debug('Resource items queue is empty.')
                 sleep(self.config['worker_sleep'])
                 continue
 
-
-            try:
-                # Resource object from local db server
-                local_resource_item = self.db.get(resource_item_id)
-            except Exception as e:
+            if (self.in_flight is not None and
+                    not self.in_flight.start(resource_item_id)):
+                # The running fetch of another worker gets the doc
                 self.api_clients_queue.put(api_client_dict)
-                logger.debug('PUT API CLIENT: {}'.format(api_client_dict['id']),
-                             extra={'MESSAGE_ID': 'put_client'})
-                self.add_to_retry_queue(resource_item_id, priority=priority)
-                logger.error('Error while getting resource item from couchdb: '
-                             '{}'.format(repr(e)),
-                             extra={'MESSAGE_ID': 'exceptions'})
+                PUT_CLIENT.log('PUT API CLIENT: {}', api_client_dict['id'])
+                COALESCED.log('{} {} is being fetched already',
+                              self.config['resource'][:-1].title(),
+                              resource_item_id)
                 continue
 
-            # Try get resource item from public server
-            public_resource_item = self._get_resource_item_from_public(
-                api_client_dict, priority, resource_item_id)
-            if public_resource_item is None:
-                continue
+            public_resource_item = None
+            try:
+                local_resource_item, public_resource_item = \
+                    self._fetch_resource_item(api_client_dict, priority,
+                                              resource_item_id)
+                if public_resource_item is None:
+                    continue
 
-            # Add docs to bulk
-            self._add_to_bulk(
-                local_resource_item, public_resource_item, priority
-            )
+                if self.bulk_writer is not None:
+                    # Hand over docs to the shared bulk writer
+                    self.bulk_writer.put(
+                        local_resource_item, public_resource_item, priority
+                    )
+                    continue
+
+                # Add docs to bulk
+                self._add_to_bulk(
+                    local_resource_item, public_resource_item, priority
+                )
+            finally:
+                # The id is released once its doc is in a bulk, so a
+                # repeat fetched meanwhile can't overtake it
+                if self.in_flight is not None:
+                    self._finish_fetch(resource_item_id, priority,
+                                       public_resource_item)
 
             # Save/Update docs in db
             self._save_bulk_docs()
+        if self.bulk_writer is None and self.bulk:
+            # Flush on exit
+            self._save_bulk_docs()
 
     def shutdown(self):
         self.exit = True
         logger.info('Worker complete his job.')
+
+
+class BulkWriter(ResourceItemWorker):
+
+    """Merges docs fetched by all workers of a bridge into shared bulks.
+
+    Docs are deduplicated by id keeping the newest dateModified and saved
+    by a pool of up to ``bulk_writers`` concurrent ``_bulk_docs`` requests
+    when the bulk reaches ``bulk_save_limit`` docs or ``bulk_save_bytes``
+    or ``bulk_save_interval`` passes. Ids which are being written stay in
+    the bulk until their write is over, so one doc is never saved twice at
+    the same time.
+    """
+
+    def __init__(self, db=None, config_dict=None,
+                 retry_resource_items_queue=None, date_modified_index=None,
+                 retry_scheduler=None, rev_cache=None, etag_cache=None,
+                 journal=None, dead_letters=None, fingerprint_cache=None):
+        super(BulkWriter, self).__init__(
+            db=db, config_dict=config_dict,
+            retry_resource_items_queue=retry_resource_items_queue,
+            date_modified_index=date_modified_index,
+            retry_scheduler=retry_scheduler, rev_cache=rev_cache,
+            etag_cache=etag_cache, journal=journal,
+            dead_letters=dead_letters, fingerprint_cache=fingerprint_cache)
+        self.queue = Queue(self.bulk_save_limit * config_dict['bulk_writers'])
+        self.pool = Pool(config_dict['bulk_writers'])
+        self.writing_ids = set()
+
+    def put(self, local_resource_item, public_resource_item, priority):
+        self.queue.put((local_resource_item, public_resource_item, priority))
+
+    def _save_bulk_docs(self):
+        if self._bulk_is_due():
+            bulk = {}
+            priority_cache = {}
+            for doc_id in self.bulk.keys():
+                if doc_id not in self.writing_ids:
+                    bulk[doc_id] = self.bulk.pop(doc_id)
+                    self.bulk_bytes -= doc_size(bulk[doc_id])
+                    priority_cache[doc_id] = self.priority_cache.pop(doc_id)
+            self.start_time = datetime.now()
+            if bulk:
+                self.writing_ids.update(bulk)
+                # Blocks while all writers are busy, so the queue fills up
+                # and slows down workers
+                self.pool.spawn(self._write_and_release, bulk,
+                                priority_cache)
+
+    def _write_and_release(self, bulk, priority_cache):
+        try:
+            self._write_bulk(bulk, priority_cache)
+        finally:
+            self.writing_ids.difference_update(bulk)
+
+    def _run(self):
+        while not self.exit:
+            timeout = self.bulk_save_interval - (
+                datetime.now() - self.start_time).total_seconds()
+            try:
+                self._add_to_bulk(*self.queue.get(timeout=max(timeout, 0)))
+            except Empty:
+                pass
+            self._save_bulk_docs()
+        while not self.queue.empty():
+            self._add_to_bulk(*self.queue.get())
+        self.pool.join()
+        self._save_bulk_docs()
+        self.pool.join()
+
+    def shutdown(self):
+        self.exit = True
+        logger.info('Bulk writer complete his job.')
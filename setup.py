@@ -34,7 +34,9 @@ entry_points = {
         'main = openprocurement.edge.main:main'
     ],
     'console_scripts': [
-        'edge_data_bridge = openprocurement.edge.databridge:main'
+        'edge_data_bridge = openprocurement.edge.databridge:main',
+        'edge_fake_api = openprocurement.edge.fakeapi:main',
+        'edge_bridge_benchmark = openprocurement.edge.benchmark:main'
     ]
 }
 